@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+from datetime import datetime, timezone
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from bench.seed import book_author, book_title
+
+
+class Latency:
+    """
+    Latencia simulada: `base` segundos más un jitter uniforme de hasta
+    `jitter`. Con `error_rate` una parte de las respuestas son 503.
+    """
+
+    def __init__(self, base: float, jitter: float, error_rate: float = 0.0):
+        self.base = base
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def sample(self) -> float:
+        return self.base + random.uniform(0, self.jitter)
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+
+def _isbn_for(text: str) -> str:
+    # Mismo título, mismo ISBN: las búsquedas repetidas son deterministas
+    return "979" + str(int(hashlib.sha1(text.encode("utf-8")).hexdigest(), 16))[:10]
+
+
+def _volume(title: str, author: str, n: int) -> dict:
+    name = title if n == 0 else f"{title} ({n + 1})"
+    return {
+        "id": _isbn_for(name),
+        "volumeInfo": {
+            "title": name,
+            "authors": [author or "Autor Desconocido"],
+            "publishedDate": "2001-05-17",
+            "description": "Descripción generada por el servicio falso de Google Books.",
+            "pageCount": 320,
+            "categories": ["Fiction"],
+            "imageLinks": {"thumbnail": None},
+            "infoLink": None,
+            "industryIdentifiers": [{"type": "ISBN_13", "identifier": _isbn_for(name)}],
+        },
+    }
+
+
+def _recommendations(book_pool: int, count: int = 5) -> str:
+    # Texto con el formato que devuelve el modelo (prosa alrededor del array)
+    recs = []
+    for i in random.sample(range(book_pool * 2), count):
+        recs.append({"title": book_title(i), "author": book_author(i), "reason": "Encaja con tus lecturas."})
+    return "Aquí tienes mis recomendaciones:\n" + json.dumps(recs, ensure_ascii=False) + "\n¡Que las disfrutes!"
+
+
+def create_app(google: Latency, ollama: Latency, book_pool: int, chunk_size: int) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/books/v1/volumes")
+    async def volumes(q: str, maxResults: int = 10):
+        await asyncio.sleep(google.sample())
+        if google.fails():
+            return JSONResponse({"error": "backendError"}, status_code=503)
+
+        match = re.match(r"intitle:(.*?)(?: inauthor:(.*))?$", q)
+        title, author = (match.group(1), match.group(2)) if match else (q, None)
+        # Un título que empieza por "zz" simula una búsqueda sin resultados
+        if title.lower().startswith("zz"):
+            return {"totalItems": 0}
+        return {"totalItems": maxResults, "items": [_volume(title, author, n) for n in range(maxResults)]}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        content = _recommendations(book_pool)
+        created_at = datetime.now(timezone.utc).isoformat()
+
+        if not body.get("stream", True):
+            await asyncio.sleep(ollama.sample())
+            if ollama.fails():
+                return JSONResponse({"error": "model overloaded"}, status_code=503)
+            return {
+                "model": body.get("model"),
+                "created_at": created_at,
+                "message": {"role": "assistant", "content": content},
+                "done": True,
+            }
+
+        # En streaming la latencia se reparte entre los trozos, como cuando
+        # el modelo va generando tokens
+        chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+        delay = ollama.sample() / len(chunks)
+
+        async def parts():
+            for chunk in chunks:
+                await asyncio.sleep(delay)
+                yield json.dumps({
+                    "model": body.get("model"),
+                    "created_at": created_at,
+                    "message": {"role": "assistant", "content": chunk},
+                    "done": False,
+                }) + "\n"
+            yield json.dumps({
+                "model": body.get("model"),
+                "created_at": created_at,
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+            }) + "\n"
+
+        return StreamingResponse(parts(), media_type="application/x-ndjson")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Servicios falsos de Google Books y Ollama para los benchmarks. Arrancar la API con "
+        "GOOGLE_BOOKS_URL=http://HOST:PORT/books/v1/volumes y OLLAMA_HOST=http://HOST:PORT"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--google-latency", type=float, default=0.15)
+    parser.add_argument("--google-jitter", type=float, default=0.1)
+    parser.add_argument("--google-error-rate", type=float, default=0.0)
+    parser.add_argument("--ollama-latency", type=float, default=2.0)
+    parser.add_argument("--ollama-jitter", type=float, default=1.0)
+    parser.add_argument("--ollama-error-rate", type=float, default=0.0)
+    parser.add_argument("--chunk-size", type=int, default=16, help="Caracteres por trozo en streaming")
+    parser.add_argument("--books", type=int, default=5000, help="Los mismos que en bench.seed")
+    args = parser.parse_args()
+
+    app = create_app(
+        Latency(args.google_latency, args.google_jitter, args.google_error_rate),
+        Latency(args.ollama_latency, args.ollama_jitter, args.ollama_error_rate),
+        book_pool=args.books,
+        chunk_size=args.chunk_size,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import math
+import random
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from bench.seed import DEFAULT_PASSWORD, book_author, book_title, username
+
+# Escenario: (nombre, plantilla de ruta en /metrics, peso por defecto)
+SCENARIOS = [
+    ("find-all", "/books/find-all", 40),
+    ("find-all summary", "/books/find-all", 20),
+    ("by-title local", "/books/by-title", 15),
+    ("by-title google", "/books/by-title", 10),
+    ("recommendations latest", "/recommendations/latest", 10),
+    ("recommendations generate", "/recommendations/generate", 5),
+]
+
+_METRIC_LINE = re.compile(r'^db_queries_per_request_(sum|count)\{route="([^"]*)"\} ([0-9.e+-]+)$')
+
+
+class Results:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name: str, elapsed: float, status: int):
+        self.latencies[name].append(elapsed)
+        self.statuses[name][status] += 1
+
+
+def percentile(values: List[float], p: float) -> float:
+    # Percentil por rango más cercano sobre la muestra ordenada
+    ordered = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+async def scrape_queries(client: httpx.AsyncClient) -> Dict[str, Tuple[float, float]]:
+    # (suma, cuenta) de db_queries_per_request por ruta, del endpoint /metrics
+    # de la API. Con varios procesos de uvicorn solo se ve el que responde
+    try:
+        response = await client.get("/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+    values: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0])
+    for line in response.text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if match:
+            kind, route, value = match.groups()
+            values[route][0 if kind == "sum" else 1] = float(value)
+    return {route: (total, count) for route, (total, count) in values.items()}
+
+
+async def login(client: httpx.AsyncClient, user: str, password: str) -> str:
+    response = await client.post("/users/login", data={"username": user, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def _request(name: str, rng: random.Random, books: int) -> Tuple[str, str, dict]:
+    if name == "find-all":
+        return "GET", "/books/find-all", {"limit": 50}
+    if name == "find-all summary":
+        return "GET", "/books/find-all", {"limit": 50, "view": "summary"}
+    if name == "by-title local":
+        i = rng.randrange(books)
+        return "GET", "/books/by-title", {"title": book_title(i), "author": book_author(i)}
+    if name == "by-title google":
+        # Títulos fuera de la maestra: pasan por Google Books (o su caché)
+        return "GET", "/books/by-title", {"title": f"Remote Book {rng.randrange(books * 10)}"}
+    if name == "recommendations latest":
+        return "GET", "/recommendations/latest", {}
+    return "POST", "/recommendations/generate", {"force": "true"}
+
+
+async def virtual_user(
+    client: httpx.AsyncClient,
+    index: int,
+    args: argparse.Namespace,
+    weights: Dict[str, int],
+    deadline: float,
+    results: Results,
+):
+    rng = random.Random(args.seed + index)
+    token = await login(client, username(index % args.users), args.password)
+    headers = {"Authorization": f"Bearer {token}"}
+    names, name_weights = list(weights), list(weights.values())
+
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, name_weights)[0]
+        method, path, params = _request(name, rng, args.books)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, params=params, headers=headers)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        results.record(name, time.perf_counter() - start, status)
+        if args.think_time:
+            await asyncio.sleep(rng.uniform(0, args.think_time))
+
+
+def report(results: Results, elapsed: float, before: dict, after: dict):
+    routes = {name: route for name, route, _ in SCENARIOS}
+    total = sum(len(v) for v in results.latencies.values())
+    print(f"\n{total} peticiones en {elapsed:.1f}s ({total / elapsed:.1f} req/s)\n")
+    print(f"{'escenario':<26} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'q/req':>7}  estados")
+    for name, latencies in sorted(results.latencies.items()):
+        route = routes[name]
+        queries = "-"
+        if route in after:
+            total_q = after[route][0] - before.get(route, (0.0, 0.0))[0]
+            count = after[route][1] - before.get(route, (0.0, 0.0))[1]
+            if count:
+                # Es la media de la ruta: find-all y su vista resumen se suman
+                queries = f"{total_q / count:.1f}"
+        statuses = " ".join(f"{code}:{n}" for code, n in sorted(results.statuses[name].items()))
+        print(
+            f"{name:<26} {len(latencies):>6} {percentile(latencies, 50) * 1000:>9.1f} "
+            f"{percentile(latencies, 95) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} {queries:>7}  {statuses}"
+        )
+
+
+def _weights(spec: Optional[str]) -> Dict[str, int]:
+    weights = {name: weight for name, _, weight in SCENARIOS}
+    if spec:
+        # p.ej. "find-all=10,recommendations generate=0"
+        for part in spec.split(","):
+            name, _, weight = part.partition("=")
+            if name.strip() not in weights:
+                raise SystemExit(f"Escenario desconocido: {name.strip()}")
+            weights[name.strip()] = int(weight)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+async def run(args: argparse.Namespace):
+    weights = _weights(args.mix)
+    results = Results()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        before = await scrape_queries(client)
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*[
+            virtual_user(client, i, args, weights, deadline, results) for i in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+        after = await scrape_queries(client)
+    report(results, elapsed, before, after)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Escenario de carga contra la API (sembrada con bench.seed). Informa p50/p95/p99 y "
+        "consultas SQL por petición de cada endpoint"
+    )
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=20, help="Usuarios virtuales simultáneos")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Espera máxima entre peticiones (s)")
+    parser.add_argument("--users", type=int, default=100, help="Usuarios sembrados")
+    parser.add_argument("--books", type=int, default=5000, help="Libros sembrados")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    parser.add_argument("--mix", help='Pesos por escenario, p.ej. "find-all=10,recommendations generate=0"')
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
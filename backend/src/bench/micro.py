@@ -0,0 +1,94 @@
+import argparse
+import json
+import random
+import statistics
+import timeit
+
+from bench.seed import CATEGORIES, book_author, book_title
+from model.book import Book, UserBook
+from util.book_api import _parse_google_date
+from util.ollama import RecommendationStreamParser, build_prompt, parse_recommendations
+from util.similarity import SimilarityIndex, np
+
+
+def _library(size: int, rng: random.Random):
+    # UserBook con su Book en memoria, como los carga load_user_library
+    return [
+        UserBook(
+            book=Book(isbn=str(i), title=book_title(i), author=book_author(i), category=rng.choice(CATEGORIES)),
+            rating=float(rng.randint(1, 5)),
+            notes="Me gustó mucho el final." if i % 3 == 0 else "",
+        )
+        for i in range(size)
+    ]
+
+
+def _llm_output(count: int) -> str:
+    recs = [{"title": book_title(i), "author": book_author(i), "reason": "Encaja con tus lecturas. " * 3} for i in range(count)]
+    return "Claro, aquí tienes:\n```json\n" + json.dumps(recs, ensure_ascii=False, indent=2) + "\n```\nEspero que te gusten."
+
+
+def _stream_parse(text: str, chunk_size: int):
+    parser = RecommendationStreamParser()
+    found = []
+    for start in range(0, len(text), chunk_size):
+        found.extend(parser.feed(text[start:start + chunk_size]))
+    return found
+
+
+def _similarity_index(books: int, users: int, books_per_user: int, rng: random.Random) -> SimilarityIndex:
+    # Catálogo y bibliotecas sintéticas, como las de bench.seed
+    catalogue = [(i, book_title(i), book_author(i), rng.choice(CATEGORIES)) for i in range(books)]
+    shelves = [
+        [(user_id, book_id, float(rng.randint(1, 5))) for book_id in rng.sample(range(books), books_per_user)]
+        for user_id in range(users)
+    ]
+    return SimilarityIndex.from_rows(catalogue, shelves)
+
+
+def benchmarks(library_size: int, recs: int, catalogue_size: int):
+    rng = random.Random(42)
+    library = _library(library_size, rng)
+    dates = ["2004-03-12", "1999", "2011-07", "", None, "2020-13-45", "17/05/2001"] * 20
+    output = _llm_output(recs)
+
+    found = {
+        f"build_prompt ({library_size} libros)": lambda: build_prompt(library),
+        f"_parse_google_date ({len(dates)} fechas)": lambda: [_parse_google_date(d) for d in dates],
+        f"parse_recommendations ({recs} recs)": lambda: parse_recommendations(output),
+        f"RecommendationStreamParser ({recs} recs, trozos de 16)": lambda: _stream_parse(output, 16),
+    }
+    if np is not None:
+        index = _similarity_index(catalogue_size, 200, min(200, catalogue_size), rng)
+        owned = rng.sample(range(catalogue_size), min(library_size, catalogue_size))
+        seeds = {book_id: float(rng.randint(1, 2)) for book_id in owned[:50]}
+        found[f"SimilarityIndex.top_k ({catalogue_size} libros, 12 candidatos)"] = lambda: index.top_k(seeds, owned, 12)
+    return found
+
+
+def run(name: str, fn, repeat: int):
+    # autorange elige cuántas llamadas caben en ~0.2 s; luego se repite la
+    # medida y se informa del mínimo (el menos afectado por ruido) y la mediana
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    per_call = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    print(f"{name:<55} min {min(per_call):>10.1f} µs   mediana {statistics.median(per_call):>10.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de las funciones puras del recomendador")
+    parser.add_argument("--library-size", type=int, default=500)
+    parser.add_argument("--recs", type=int, default=10)
+    parser.add_argument("--catalogue-size", type=int, default=50_000, help="Libros del índice de similitud")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="Ejecuta solo los benchmarks cuyo nombre contenga este texto")
+    args = parser.parse_args()
+
+    for name, fn in benchmarks(args.library_size, args.recs, args.catalogue_size).items():
+        if args.only and args.only not in name:
+            continue
+        run(name, fn, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, col, select
+
+from config.database import engine, init_db
+from model.book import Book, UserBook
+from model.user import User
+from util.catalogue import dialect_insert, upsert_books
+from util.password import get_password_hash
+from util.tags import set_user_book_tags
+
+# Todo lo que genera el benchmark lleva este prefijo (usuarios e ISBN), para
+# poder sembrar sobre una base de datos con datos reales y no pisarlos
+USER_PREFIX = "bench_user_"
+ISBN_PREFIX = "bench-"
+DEFAULT_PASSWORD = "bench-password"
+
+CATEGORIES = ["Fiction", "Science Fiction", "Fantasy", "History", "Biography", "Science", "Poetry", "Mystery"]
+TAGS = ["favoritos", "verano", "club", "releer", "regalo", "clásicos", "ensayo", "audiolibro"]
+STATUSES = ["PENDING", "READING", "COMPLETED", "ABANDONED"]
+INSERT_CHUNK_SIZE = 500
+
+
+def book_title(i: int) -> str:
+    # Los servicios falsos recomiendan títulos con este mismo formato: una
+    # parte está en la DB maestra y otra obliga a ir a Google Books
+    return f"Bench Book {i}"
+
+
+def book_author(i: int) -> str:
+    return f"Author {i % 997}"
+
+
+def username(i: int) -> str:
+    return f"{USER_PREFIX}{i}"
+
+
+def _book_rows(count: int, rng: random.Random):
+    for i in range(count):
+        yield {
+            "isbn": f"{ISBN_PREFIX}{i:09d}",
+            "title": book_title(i),
+            "author": book_author(i),
+            "publisher": f"Publisher {i % 50}",
+            "published_date": datetime(1950, 1, 1) + timedelta(days=rng.randrange(365 * 75)),
+            "description": " ".join(rng.choices(["lorem", "ipsum", "dolor", "sit", "amet", "libro"], k=rng.randint(40, 160))),
+            "page_count": rng.randint(80, 900),
+            "category": rng.choice(CATEGORIES),
+            "image_url": None,
+            "external_link": None,
+        }
+
+
+def seed_books(session: Session, count: int, rng: random.Random):
+    batch = []
+    for row in _book_rows(count, rng):
+        batch.append(row)
+        if len(batch) == INSERT_CHUNK_SIZE:
+            upsert_books(session, batch)
+            batch = []
+    if batch:
+        upsert_books(session, batch)
+    session.commit()
+
+
+def seed_users(session: Session, count: int, password: str):
+    # Todos comparten contraseña: un único hash bcrypt para no tardar minutos
+    hashed = get_password_hash(password)
+    rows = [
+        {"username": username(i), "email": f"{username(i)}@bench.local", "hashed_password": hashed, "token_version": 0}
+        for i in range(count)
+    ]
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        session.execute(
+            dialect_insert(session)(User)
+            .values(rows[start:start + INSERT_CHUNK_SIZE])
+            .on_conflict_do_nothing(index_elements=["username"])
+        )
+    session.commit()
+
+
+def seed_libraries(session: Session, users: int, books_per_user: int, rng: random.Random):
+    user_ids = session.exec(
+        select(User.id).where(col(User.username).startswith(USER_PREFIX)).order_by(User.id).limit(users)
+    ).all()
+    book_rows = session.exec(
+        select(Book.id, Book.page_count).where(col(Book.isbn).startswith(ISBN_PREFIX))
+    ).all()
+    now = datetime.now()
+
+    for user_id in user_ids:
+        rows = []
+        for book_id, page_count in rng.sample(book_rows, min(books_per_user, len(book_rows))):
+            status = rng.choice(STATUSES)
+            added_at = now - timedelta(minutes=rng.randrange(60 * 24 * 730))
+            rows.append({
+                "user_id": user_id,
+                "book_id": book_id,
+                "status": status,
+                "current_page": page_count if status == "COMPLETED" else rng.randint(0, page_count or 0),
+                "rating": float(rng.randint(1, 5)) if status == "COMPLETED" else None,
+                "notes": "",
+                "tags": ", ".join(rng.sample(TAGS, rng.randint(0, 3))) or None,
+                "added_at": added_at,
+                "updated_at": added_at,
+            })
+        tagged = {}
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            created = session.execute(
+                dialect_insert(session)(UserBook)
+                .values(rows[start:start + INSERT_CHUNK_SIZE])
+                .on_conflict_do_nothing(index_elements=["user_id", "book_id"])
+                .returning(UserBook.id, UserBook.tags)
+            ).all()
+            tagged.update({ub_id: tags for ub_id, tags in created if tags})
+        if tagged:
+            set_user_book_tags(session, user_id, tagged)
+        session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Siembra usuarios, libros y bibliotecas para los benchmarks")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--books-per-user", type=int, default=200)
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    parser.add_argument("--seed", type=int, default=42, help="Semilla: misma semilla, mismos datos")
+    args = parser.parse_args()
+
+    init_db()
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    with Session(engine) as session:
+        seed_books(session, args.books, rng)
+        seed_users(session, args.users, args.password)
+        seed_libraries(session, args.users, args.books_per_user, rng)
+    print(
+        f"{args.users} usuarios, {args.books} libros, {args.books_per_user} libros por usuario "
+        f"en {time.perf_counter() - start:.1f}s (contraseña: {args.password})"
+    )
+
+
+if __name__ == "__main__":
+    main()
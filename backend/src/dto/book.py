@@ -1,5 +1,6 @@
-from typing import Optional
-from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field
 
 class BookUpdate(BaseModel):
     status: Optional[str] = "READING"
@@ -7,3 +8,76 @@ class BookUpdate(BaseModel):
     rating: Optional[float] = None
     notes: Optional[str] = None
     tags: Optional[str] = None
+
+
+class LibraryBookSummary(BaseModel):
+    # Libro de la biblioteca sin la descripción (el texto más pesado)
+    id: int
+    title: str
+    author: str
+    page_count: Optional[int] = None
+    publisher: Optional[str] = None
+    published_date: Optional[datetime] = None
+    image_url: Optional[str] = None
+    category: Optional[str] = None
+    progress: float = 0.0
+    rating: Optional[float] = None
+    notes: Optional[str] = None
+    tags: Optional[str] = None
+    status: str
+    current_page: int = 0
+    added_at: datetime
+
+
+class LibraryBook(LibraryBookSummary):
+    description: Optional[str] = None
+
+
+class LibraryPage(BaseModel):
+    items: List[LibraryBook]
+    # Cursor opaco para pedir la siguiente página (None si no hay más)
+    next_cursor: Optional[str] = None
+
+
+class LibraryPageSummary(BaseModel):
+    items: List[LibraryBookSummary]
+    next_cursor: Optional[str] = None
+
+
+class TagCount(BaseModel):
+    # Nombre normalizado (el que se usa para filtrar) y cómo se muestra
+    name: str
+    label: str
+    count: int
+
+
+class ProgressUpdate(BaseModel):
+    book_id: int
+    current_page: int = Field(ge=0)
+    # Segundos leídos desde la actualización anterior (para las estadísticas)
+    seconds: int = Field(default=0, ge=0, le=60 * 60 * 24)
+
+
+class ProgressBatch(BaseModel):
+    updates: List[ProgressUpdate] = Field(min_length=1, max_length=200)
+
+
+class ProgressOut(BaseModel):
+    book_id: int
+    current_page: int
+    progress: float
+
+
+class ProgressBatchResult(BaseModel):
+    items: List[ProgressOut]
+    # Libros que no están en la biblioteca del usuario
+    not_found: List[int] = []
+
+
+class ImportProgress(BaseModel):
+    processed: int = 0
+    imported: int = 0
+    already_in_library: int = 0
+    not_found: int = 0
+    google_lookups: int = 0
+    done: bool = False
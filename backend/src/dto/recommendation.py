@@ -0,0 +1,18 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+from model.recommendation import Recommendation
+
+
+class RecommendationBatchOut(BaseModel):
+    id: int
+    created_at: datetime
+    recommendations: List[Recommendation]
+
+
+class RecommendationHistoryPage(BaseModel):
+    items: List[RecommendationBatchOut]
+    # id de la última tanda de la página: se pasa como `cursor` para pedir
+    # las anteriores (None si no hay más)
+    next_cursor: Optional[int] = None
@@ -0,0 +1,35 @@
+from datetime import date
+from typing import List
+from pydantic import BaseModel
+
+
+class DailyStats(BaseModel):
+    day: date
+    pages_read: int = 0
+    seconds_read: int = 0
+    books_finished: int = 0
+
+
+class MonthlyStats(BaseModel):
+    # "YYYY-MM"
+    month: str
+    pages_read: int = 0
+    seconds_read: int = 0
+    books_finished: int = 0
+
+
+class CategoryStats(BaseModel):
+    category: str
+    pages_read: int = 0
+    seconds_read: int = 0
+
+
+class ReadingStats(BaseModel):
+    since: date
+    # Solo los días con actividad
+    days: List[DailyStats]
+    months: List[MonthlyStats]
+    categories: List[CategoryStats]
+    pages_read: int = 0
+    seconds_read: int = 0
+    books_finished: int = 0
@@ -4,4 +4,28 @@ from pydantic import BaseModel, EmailStr
 class UserCreate(BaseModel):
     username: str
     email: EmailStr  # Valida automáticamente que sea un email real
-    password: str
\ No newline at end of file
+    password: str
+
+
+class CurrentUser(BaseModel):
+    # Lo que las rutas necesitan del usuario autenticado; se cachea en
+    # memoria para no consultar la DB en cada petición
+    id: int
+    username: str
+    email: str
+    token_version: int = 0
+
+
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class UserPublic(BaseModel):
+    id: int
+    email: str
+    username: str
@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+
+from sqlmodel import Session, select
+
+from config.database import engine
+from model.user import User
+from util.book_api import close_client
+from util.importer import import_library, iter_import_rows
+
+
+async def run(username: str, path: str):
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.username == username)).first()
+        if user is None:
+            raise SystemExit(f"Usuario no encontrado: {username}")
+
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as f:
+                async for progress in import_library(session, user.id, iter_import_rows(f)):
+                    print(
+                        f"{progress.processed} procesados, {progress.imported} importados, "
+                        f"{progress.already_in_library} ya en la biblioteca, "
+                        f"{progress.not_found} sin encontrar"
+                    )
+        finally:
+            await close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa un export de Goodreads o un CSV a la biblioteca de un usuario")
+    parser.add_argument("username")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    asyncio.run(run(args.username, args.path))
@@ -1,17 +1,48 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 from config.database import init_db
-from router import book, user, recommendation
+from config.settings import settings
+from router import book, user, recommendation, stats
+from util.auth import listen_for_invalidations
+from util.book_api import close_client
+from util.compression import CompressionMiddleware
+from util.instrumentation import MetricsMiddleware, install_sql_hooks
+from util.log import configure_logging
+from util.metrics import render_metrics
+from util.ollama import close_llm_client
+from util.password import shutdown_executor
+from util.progress import progress_buffer
+from util.similarity import similarity_engine
+
+configure_logging()
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     init_db()
+    invalidations = asyncio.create_task(listen_for_invalidations())
+    progress_buffer.start()
+    similarity_index = asyncio.create_task(similarity_engine.keep_fresh())
     yield
+    # Se esperan las tareas canceladas: no deben seguir corriendo mientras
+    # se cierra lo demás
+    for task in (invalidations, similarity_index):
+        task.cancel()
+    for task in (invalidations, similarity_index):
+        with suppress(asyncio.CancelledError):
+            await task
+    # Antes de cerrar nada: vuelca el progreso de lectura pendiente
+    await progress_buffer.close()
+    await close_client()
+    await close_llm_client()
+    shutdown_executor()
 
-app = FastAPI(lifespan=lifespan)
+# orjson serializa bastante más rápido que el encoder JSON por defecto
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 origins = [
     "https://refactored-eureka-g5wg45vqp9w3v69q-3000.app.github.dev",
@@ -26,6 +57,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_minimum_size,
+    compresslevel=settings.gzip_compresslevel,
+    brotli_quality=settings.brotli_quality,
+)
+
+# El último middleware añadido es el más externo: la latencia medida
+# incluye CORS y la compresión
+if settings.metrics_enabled:
+    install_sql_hooks()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 app.include_router(book.router)
 app.include_router(user.router)
-app.include_router(recommendation.router)
\ No newline at end of file
+app.include_router(recommendation.router)
+app.include_router(stats.router)
\ No newline at end of file
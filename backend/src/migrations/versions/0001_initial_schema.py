@@ -0,0 +1,171 @@
+"""Esquema inicial
+
+Recoge lo que antes creaban `SQLModel.metadata.create_all` y las ALTER de
+`config/database.py`. En una base de datos creada con la versión anterior
+(tablas ya existentes, sin `alembic_version`) solo añade lo que falte.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# Índices de búsqueda sobre el catálogo (solo Postgres): tsvector y GIN de
+# trigramas sobre las columnas normalizadas
+SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE book ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple', coalesce(search_title, '') || ' ' || coalesce(search_author, ''))
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_book_search_title_trgm ON book USING gin (search_title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_book_search_author_trgm ON book USING gin (search_author gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_book_search_vector ON book USING gin (search_vector)",
+]
+
+# Columnas que la versión anterior añadía a tablas ya existentes
+def _legacy_columns():
+    return {
+        "book": [
+            sa.Column("search_title", sa.String(), nullable=True),
+            sa.Column("search_author", sa.String(), nullable=True),
+        ],
+        "userbook": [
+            sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        ],
+        "user": [
+            sa.Column("library_fingerprint", sa.String(), nullable=True),
+            sa.Column("recommendations_fingerprint", sa.String(), nullable=True),
+            sa.Column("token_version", sa.Integer(), nullable=False, server_default="0"),
+        ],
+    }
+
+
+# Relleno de filas anteriores a las columnas de búsqueda
+SEARCH_BACKFILL = """
+    UPDATE book
+    SET search_title = lower({fn}(title)), search_author = lower({fn}(author))
+    WHERE search_title IS NULL
+"""
+
+
+def _create_tables():
+    op.create_table(
+        "user",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False, unique=True),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("token_version", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("library_fingerprint", sa.String(), nullable=True),
+        sa.Column("recommendations_fingerprint", sa.String(), nullable=True),
+    )
+    op.create_index("ix_user_username", "user", ["username"], unique=True)
+
+    op.create_table(
+        "book",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("isbn", sa.String(), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("author", sa.String(), nullable=False),
+        sa.Column("publisher", sa.String(), nullable=True),
+        sa.Column("published_date", sa.DateTime(), nullable=True),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("page_count", sa.Integer(), nullable=True),
+        sa.Column("category", sa.String(), nullable=True),
+        sa.Column("image_url", sa.String(), nullable=True),
+        sa.Column("external_link", sa.String(), nullable=True),
+        sa.Column("search_title", sa.String(), nullable=True),
+        sa.Column("search_author", sa.String(), nullable=True),
+    )
+    op.create_index("ix_book_isbn", "book", ["isbn"], unique=True)
+
+    op.create_table(
+        "userbook",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+        sa.Column("book_id", sa.Integer(), sa.ForeignKey("book.id"), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("current_page", sa.Integer(), nullable=False),
+        sa.Column("rating", sa.Float(), nullable=True),
+        sa.Column("notes", sa.String(), nullable=True),
+        sa.Column("tags", sa.String(), nullable=True),
+        sa.Column("added_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+
+    op.create_table(
+        "recommendation",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("author", sa.String(), nullable=False),
+        sa.Column("reason", sa.String(), nullable=False),
+        sa.Column("image_url", sa.String(), nullable=True),
+        sa.Column("external_link", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+
+
+def _search_backfill(bind):
+    try:
+        # Savepoint: si unaccent falla, la transacción de la migración sigue viva
+        with bind.begin_nested():
+            op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+            op.execute(SEARCH_BACKFILL.format(fn="unaccent"))
+    except Exception:
+        # Sin permisos para unaccent: al menos dejamos el texto en minúsculas
+        op.execute(SEARCH_BACKFILL.format(fn=""))
+
+
+def _add_legacy_columns(bind):
+    inspector = sa.inspect(bind)
+    for table, columns in _legacy_columns().items():
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        missing = [column for column in columns if column.name not in existing]
+        if not missing:
+            continue
+        # SQLite no admite ADD COLUMN con un DEFAULT no constante (now()):
+        # el modo batch recrea la tabla. En Postgres son ALTER normales
+        recreate = "always" if bind.dialect.name == "sqlite" and table == "userbook" else "auto"
+        with op.batch_alter_table(table, recreate=recreate) as batch:
+            for column in missing:
+                batch.add_column(column)
+
+
+def upgrade():
+    bind = op.get_bind()
+    # En modo --sql (sin conexión) se genera el esquema desde cero
+    legacy = not op.get_context().as_sql and sa.inspect(bind).has_table("book")
+
+    if not legacy:
+        _create_tables()
+    else:
+        _add_legacy_columns(bind)
+
+    if bind.dialect.name == "postgresql":
+        for ddl in SEARCH_DDL:
+            op.execute(ddl)
+        if legacy:
+            _search_backfill(bind)
+    elif legacy:
+        op.execute(SEARCH_BACKFILL.format(fn=""))
+
+
+def downgrade():
+    op.drop_table("recommendation")
+    op.drop_table("userbook")
+    op.drop_index("ix_book_isbn", table_name="book")
+    op.drop_table("book")
+    op.drop_index("ix_user_username", table_name="user")
+    op.drop_table("user")
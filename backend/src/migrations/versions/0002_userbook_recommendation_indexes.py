@@ -0,0 +1,51 @@
+"""Índices de UserBook y Recommendation y unicidad (user_id, book_id)
+
+En Postgres los índices se crean con CREATE INDEX CONCURRENTLY (fuera de
+la transacción) para no bloquear escrituras en tablas con datos.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+# Sin la restricción, inserciones concurrentes pueden haber duplicado
+# libros en una biblioteca: nos quedamos con la fila más antigua
+DEDUPLICATE_USERBOOK = """
+    DELETE FROM userbook
+    WHERE id NOT IN (SELECT min(id) FROM userbook GROUP BY user_id, book_id)
+"""
+
+INDEXES = [
+    ("uq_userbook_user_book", "userbook", ["user_id", "book_id"], True),
+    ("ix_userbook_user_added", "userbook", ["user_id", "added_at", "id"], False),
+    ("ix_recommendation_user_created", "recommendation", ["user_id", "created_at"], False),
+]
+
+
+def upgrade():
+    op.execute(DEDUPLICATE_USERBOOK)
+
+    if op.get_bind().dialect.name != "postgresql":
+        for name, table, columns, unique in INDEXES:
+            op.create_index(name, table, columns, unique=unique)
+        return
+
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            # Un CONCURRENTLY interrumpido deja el índice inválido: lo
+            # quitamos para que el reintento lo cree de nuevo
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True)
+
+
+def downgrade():
+    for name, table, _columns, _unique in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
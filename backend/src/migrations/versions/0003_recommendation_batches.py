@@ -0,0 +1,73 @@
+"""Tandas de recomendaciones (RecommendationBatch) y puntero a la última
+
+Las recomendaciones existentes se agrupan en tandas por (user_id,
+created_at), que es como se identificaban hasta ahora.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+BACKFILL = [
+    # Una tanda por cada (usuario, fecha), en orden cronológico para que
+    # los ids sigan el orden de creación
+    """
+    INSERT INTO recommendationbatch (user_id, created_at)
+    SELECT user_id, created_at FROM recommendation
+    GROUP BY user_id, created_at
+    ORDER BY created_at
+    """,
+    """
+    UPDATE recommendation SET batch_id = (
+        SELECT b.id FROM recommendationbatch b
+        WHERE b.user_id = recommendation.user_id AND b.created_at = recommendation.created_at
+    )
+    WHERE batch_id IS NULL
+    """,
+    """
+    UPDATE "user" SET latest_batch_id = (
+        SELECT max(b.id) FROM recommendationbatch b WHERE b.user_id = "user".id
+    )
+    """,
+]
+
+
+def upgrade():
+    op.create_table(
+        "recommendationbatch",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_recommendationbatch_user", "recommendationbatch", ["user_id", "id"])
+
+    with op.batch_alter_table("recommendation") as batch:
+        batch.add_column(sa.Column("batch_id", sa.Integer(), nullable=True))
+        batch.create_foreign_key(
+            "fk_recommendation_batch_id", "recommendationbatch", ["batch_id"], ["id"]
+        )
+    op.add_column("user", sa.Column("latest_batch_id", sa.Integer(), nullable=True))
+
+    for statement in BACKFILL:
+        op.execute(statement)
+
+    op.create_index("ix_recommendation_batch_id", "recommendation", ["batch_id"])
+
+
+def downgrade():
+    op.drop_index("ix_recommendation_batch_id", table_name="recommendation")
+    op.drop_column("user", "latest_batch_id")
+    with op.batch_alter_table("recommendation") as batch:
+        batch.drop_constraint("fk_recommendation_batch_id", type_="foreignkey")
+        batch.drop_column("batch_id")
+    op.drop_index("ix_recommendationbatch_user", table_name="recommendationbatch")
+    op.drop_table("recommendationbatch")
@@ -0,0 +1,57 @@
+"""Registro de lectura (ReadingEvent) y agregados diarios
+
+El histórico empieza con esta migración: UserBook solo guarda la página
+actual, así que no hay eventos anteriores que reconstruir.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "readingevent",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+        sa.Column("book_id", sa.Integer(), sa.ForeignKey("book.id"), nullable=False),
+        sa.Column("from_page", sa.Integer(), nullable=False),
+        sa.Column("to_page", sa.Integer(), nullable=False),
+        sa.Column("pages_read", sa.Integer(), nullable=False),
+        sa.Column("seconds_read", sa.Integer(), nullable=False),
+        sa.Column("finished", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_readingevent_user_created", "readingevent", ["user_id", "created_at"])
+
+    op.create_table(
+        "readingdailystats",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), primary_key=True),
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("pages_read", sa.Integer(), nullable=False),
+        sa.Column("seconds_read", sa.Integer(), nullable=False),
+        sa.Column("books_finished", sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        "readingcategorystats",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), primary_key=True),
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("category", sa.String(), primary_key=True),
+        sa.Column("pages_read", sa.Integer(), nullable=False),
+        sa.Column("seconds_read", sa.Integer(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("readingcategorystats")
+    op.drop_table("readingdailystats")
+    op.drop_index("ix_readingevent_user_created", table_name="readingevent")
+    op.drop_table("readingevent")
@@ -0,0 +1,106 @@
+"""Etiquetas normalizadas (tag) y su asociación con UserBook (userbooktag)
+
+Las etiquetas de texto de UserBook.tags se separan por comas y se pasan a
+las tablas nuevas. La columna se mantiene como copia para mostrar.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+MAX_TAG_LENGTH = 50
+CHUNK_SIZE = 500
+
+tag = sa.table("tag", sa.column("id", sa.Integer), sa.column("name", sa.String), sa.column("label", sa.String))
+userbooktag = sa.table(
+    "userbooktag",
+    sa.column("user_book_id", sa.Integer),
+    sa.column("tag_id", sa.Integer),
+    sa.column("user_id", sa.Integer),
+)
+userbook = sa.table(
+    "userbook", sa.column("id", sa.Integer), sa.column("user_id", sa.Integer), sa.column("tags", sa.String)
+)
+
+
+def _normalize(value):
+    # Copia de util.text.normalize_text: la migración no depende del código
+    # de la app, que puede cambiar después
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.lower().split())
+
+
+def _parse(raw):
+    tags = {}
+    for label in (raw or "").split(","):
+        label = " ".join(label.split())[:MAX_TAG_LENGTH]
+        name = _normalize(label)
+        if name and name not in tags:
+            tags[name] = label
+    return tags
+
+
+def _backfill(bind):
+    rows = bind.execute(
+        sa.select(userbook.c.id, userbook.c.user_id, userbook.c.tags)
+        .where(userbook.c.tags.isnot(None), userbook.c.tags != "")
+    ).all()
+    parsed = [(ub_id, user_id, _parse(raw)) for ub_id, user_id, raw in rows]
+
+    labels = {}
+    for _, _, tags in parsed:
+        for name, label in tags.items():
+            labels.setdefault(name, label)
+    if not labels:
+        return
+
+    tag_rows = [{"name": name, "label": label} for name, label in labels.items()]
+    for start in range(0, len(tag_rows), CHUNK_SIZE):
+        bind.execute(tag.insert(), tag_rows[start:start + CHUNK_SIZE])
+    tag_ids = dict(bind.execute(sa.select(tag.c.name, tag.c.id)).all())
+
+    links = [
+        {"user_book_id": ub_id, "tag_id": tag_ids[name], "user_id": user_id}
+        for ub_id, user_id, tags in parsed
+        for name in tags
+    ]
+    for start in range(0, len(links), CHUNK_SIZE):
+        bind.execute(userbooktag.insert(), links[start:start + CHUNK_SIZE])
+
+
+def upgrade():
+    op.create_table(
+        "tag",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False, unique=True),
+        sa.Column("label", sa.String(), nullable=False),
+    )
+    op.create_table(
+        "userbooktag",
+        sa.Column("user_book_id", sa.Integer(), sa.ForeignKey("userbook.id"), primary_key=True),
+        sa.Column("tag_id", sa.Integer(), sa.ForeignKey("tag.id"), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+    )
+
+    # En modo --sql (sin conexión) no hay filas que migrar
+    if not op.get_context().as_sql:
+        _backfill(op.get_bind())
+
+    op.create_index("ix_userbooktag_user_tag", "userbooktag", ["user_id", "tag_id", "user_book_id"])
+
+
+def downgrade():
+    op.drop_index("ix_userbooktag_user_tag", table_name="userbooktag")
+    op.drop_table("userbooktag")
+    op.drop_table("tag")
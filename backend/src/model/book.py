@@ -1,7 +1,10 @@
 from typing import TYPE_CHECKING, List, Optional
+from sqlalchemy import Index, event
 from sqlmodel import Field, Relationship, SQLModel
 from datetime import datetime
 
+from util.text import normalize_text
+
 if TYPE_CHECKING:
     from .user import User
 
@@ -18,9 +21,30 @@ class Book(SQLModel, table=True):
     image_url: Optional[str] = None
     external_link: Optional[str] = None
 
+    # Título y autor normalizados (sin tildes, minúsculas) para la búsqueda.
+    # En Postgres llevan índices GIN de trigramas (ver migrations/)
+    search_title: Optional[str] = None
+    search_author: Optional[str] = None
+
     user_books: List["UserBook"] = Relationship(back_populates="book")
 
+@event.listens_for(Book, "before_insert")
+@event.listens_for(Book, "before_update")
+def _fill_search_columns(_mapper, _connection, target: Book):
+    target.search_title = normalize_text(target.title)
+    target.search_author = normalize_text(target.author)
+
+
 class UserBook(SQLModel, table=True):
+    __table_args__ = (
+        # Un libro solo una vez por usuario. El índice también sirve a las
+        # consultas por user_id (es el prefijo) y es el objetivo de los
+        # INSERT ... ON CONFLICT DO NOTHING
+        Index("uq_userbook_user_book", "user_id", "book_id", unique=True),
+        # Listado de la biblioteca por fecha de alta (orden por defecto)
+        Index("ix_userbook_user_added", "user_id", "added_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     book_id: int = Field(foreign_key="book.id")
@@ -32,6 +56,11 @@ class UserBook(SQLModel, table=True):
     notes: Optional[str] = None
     tags: Optional[str] = None
     added_at: datetime = Field(default_factory=datetime.now)
+    # Última modificación. El buffer de progreso (util/progress.py) no
+    # escribe encima de cambios posteriores a la actualización que vuelca.
+    # Las recomendaciones no dependen de ella sino de la huella de la
+    # biblioteca (util/fingerprint.py)
+    updated_at: datetime = Field(default_factory=datetime.now)
     
     user: Optional["User"] = Relationship(back_populates="user_books")
     book: Optional["Book"] = Relationship(back_populates="user_books")
@@ -41,4 +70,9 @@ class UserBook(SQLModel, table=True):
     def progress(self) -> float:
         if self.book and self.book.page_count:
             return (self.current_page / self.book.page_count) * 100
-        return 0.0
\ No newline at end of file
+        return 0.0
+
+
+@event.listens_for(UserBook, "before_update")
+def _touch_user_book(_mapper, _connection, target: UserBook):
+    target.updated_at = datetime.now()
@@ -0,0 +1,40 @@
+from datetime import date, datetime
+from typing import Optional
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+
+class ReadingEvent(SQLModel, table=True):
+    # Cada avance de lectura (cambio de página o libro terminado). Es el
+    # histórico; las estadísticas se leen de las tablas agregadas
+    __table_args__ = (Index("ix_readingevent_user_created", "user_id", "created_at"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    book_id: int = Field(foreign_key="book.id")
+    from_page: int = 0
+    to_page: int = 0
+    # Páginas que suma a las estadísticas (volver atrás no resta)
+    pages_read: int = 0
+    # Tiempo de lectura que informa el cliente, si lo hace
+    seconds_read: int = 0
+    finished: bool = False
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class ReadingDailyStats(SQLModel, table=True):
+    # Agregado por usuario y día, se actualiza con cada ReadingEvent
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    pages_read: int = 0
+    seconds_read: int = 0
+    books_finished: int = 0
+
+
+class ReadingCategoryStats(SQLModel, table=True):
+    # Agregado por usuario, día y categoría principal del libro
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    category: str = Field(primary_key=True)
+    pages_read: int = 0
+    seconds_read: int = 0
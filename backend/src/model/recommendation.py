@@ -1,14 +1,29 @@
 from datetime import datetime
 from typing import TYPE_CHECKING, Optional
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
 
 if TYPE_CHECKING:
     from .user import User
 
 
+class RecommendationBatch(SQLModel, table=True):
+    # Una tanda de recomendaciones (una llamada al LLM). El usuario apunta a
+    # la última con `User.latest_batch_id`
+    __table_args__ = (Index("ix_recommendationbatch_user", "user_id", "id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class Recommendation(SQLModel, table=True):
+    # Última tanda e historial de un usuario
+    __table_args__ = (Index("ix_recommendation_user_created", "user_id", "created_at"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
+    batch_id: Optional[int] = Field(default=None, foreign_key="recommendationbatch.id", index=True)
     title: str
     author: str
     reason: str
@@ -0,0 +1,22 @@
+from typing import Optional
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+
+class Tag(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # Forma normalizada (minúsculas, sin tildes): "Clásicos" y "clasicos"
+    # son la misma etiqueta
+    name: str = Field(unique=True)
+    # Cómo se escribió la primera vez
+    label: str
+
+
+class UserBookTag(SQLModel, table=True):
+    # Etiquetas de cada libro de la biblioteca. `user_id` está duplicado para
+    # filtrar y contar por usuario sin pasar por UserBook
+    __table_args__ = (Index("ix_userbooktag_user_tag", "user_id", "tag_id", "user_book_id"),)
+
+    user_book_id: int = Field(foreign_key="userbook.id", primary_key=True)
+    tag_id: int = Field(foreign_key="tag.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
@@ -9,5 +9,15 @@ class User(SQLModel, table=True):
     username: str = Field(index=True, unique=True)
     email: str = Field(unique=True)
     hashed_password: str
+    # Se incrementa al cambiar la contraseña: invalida los tokens anteriores
+    token_version: int = Field(default=0)
+
+    # Huella de los datos de la biblioteca que usa el prompt del LLM y la
+    # huella con la que se generaron las últimas recomendaciones
+    library_fingerprint: Optional[str] = None
+    recommendations_fingerprint: Optional[str] = None
+    # Última tanda de recomendaciones (RecommendationBatch). Sin FK para no
+    # crear un ciclo user <-> recommendationbatch
+    latest_batch_id: Optional[int] = None
     
     user_books: List["UserBook"] = Relationship(back_populates="user")
\ No newline at end of file
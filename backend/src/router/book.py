@@ -1,161 +1,328 @@
-from typing import Optional
-
-from dto.book import BookUpdate
-from model.user import User
+import base64
+import io
+import json
+from datetime import datetime
+from typing import List, Literal, Optional, Union
+
+from dto.book import (
+    BookUpdate,
+    LibraryBook,
+    LibraryBookSummary,
+    LibraryPage,
+    LibraryPageSummary,
+    ProgressBatch,
+    ProgressBatchResult,
+    ProgressOut,
+    TagCount,
+)
+from dto.user import CurrentUser
 from util.auth import get_current_user
 from config.database import get_session
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from model.book import Book, UserBook
-from sqlmodel import Session, and_, col, func, select
+from model.tag import UserBookTag
+from sqlalchemy.orm import contains_eager
+from sqlmodel import Session, and_, col, delete, or_, select
 from util.book_api import fetch_multiple_books
+from util.catalogue import dialect_insert, upsert_books
+from util.fingerprint import refresh_library_fingerprint
+from util.http_cache import LIBRARY, bump_version, bump_version_from_thread, cached_json
+from util.importer import import_library, iter_import_rows
+from util.progress import compute_progress, forget_target, load_targets, progress_buffer
+from util.ratelimit import google_limiter
+from util.reading_stats import ProgressEvent, is_finish, record_events
+from util.tags import parse_tags, set_user_book_tags, tag_counts, with_all_tags
+from util.search import find_best_match, search_books
 
 router = APIRouter(prefix="/books", tags=["books"])
 
 
-@router.get("/find-all")
-def find_all_books(
+SORT_COLUMNS = {
+    "added_at": UserBook.added_at,
+    "title": Book.title,
+    "author": Book.author,
+}
+
+
+def _encode_cursor(value, row_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps({"v": value, "id": row_id}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("utf-8")
+
+
+def _decode_cursor(cursor: str, sort: str):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+        value, row_id = data["v"], int(data["id"])
+        if sort == "added_at":
+            value = datetime.fromisoformat(value)
+        return value, row_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+@router.get("/find-all", response_model=Union[LibraryPage, LibraryPageSummary])
+async def find_all_books(
+    request: Request,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    tags: Optional[str] = Query(default=None, description="Tags separados por comas (deben estar todos)"),
+    sort: Literal["added_at", "title", "author"] = "added_at",
+    order: Literal["asc", "desc"] = "desc",
+    cursor: Optional[str] = None,
+    limit: int = Query(default=50, ge=1, le=200),
+    view: Literal["full", "summary"] = Query(default="full", description="summary: sin descripciones"),
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    user_books = session.exec(
-        select(UserBook).where(UserBook.user_id == current_user.id)
-    ).all()
+    # Si la biblioteca no ha cambiado desde la copia del cliente, 304 sin
+    # consultar la DB
+    return await cached_json(
+        request,
+        LIBRARY,
+        current_user.id,
+        LibraryPageSummary if view == "summary" else LibraryPage,
+        lambda: run_in_threadpool(
+            _library_page, session, current_user.id, status, category, tags, sort, order, cursor, limit, view
+        ),
+    )
 
-    books = []
-    for ub in user_books:
-        book = session.get(Book, ub.book_id)
-        if book:
-            books.append(
-                {
-                    "id": book.id,
-                    "title": book.title,
-                    "author": book.author,
-                    "page_count": book.page_count,
-                    "description": book.description,
-                    "publisher": book.publisher,
-                    "published_date": book.published_date,
-                    "image_url": book.image_url,
-                    "category": book.category,
-                    "progress": ub.progress,
-                    "rating": ub.rating,
-                    "notes": ub.notes,
-                    "tags": ub.tags,
-                    "status": ub.status,
-                    "current_page": ub.current_page,
-                }
+
+def _library_page(
+    session: Session,
+    user_id: int,
+    status: Optional[str],
+    category: Optional[str],
+    tags: Optional[str],
+    sort: str,
+    order: str,
+    cursor: Optional[str],
+    limit: int,
+    view: str = "full",
+) -> Union[LibraryPage, LibraryPageSummary]:
+    # Una única consulta: UserBook + Book con JOIN, así `progress` no dispara
+    # una carga perezosa por fila. En la vista resumen ni se lee la descripción
+    summary = view == "summary"
+    book_loader = contains_eager(UserBook.book)
+    if summary:
+        book_loader = book_loader.defer(Book.description)
+
+    sort_col = SORT_COLUMNS[sort]
+    query = (
+        select(UserBook)
+        .join(Book, Book.id == UserBook.book_id)
+        .options(book_loader)
+        .where(UserBook.user_id == user_id)
+    )
+
+    if status:
+        query = query.where(UserBook.status == status)
+    if category:
+        query = query.where(col(Book.category).ilike(f"%{category}%"))
+    if tags and parse_tags(tags):
+        query = query.where(col(UserBook.id).in_(with_all_tags(user_id, tags)))
+
+    # Paginación por keyset sobre (columna de orden, id)
+    if cursor:
+        value, last_id = _decode_cursor(cursor, sort)
+        if order == "desc":
+            query = query.where(
+                or_(sort_col < value, and_(sort_col == value, UserBook.id < last_id))
+            )
+        else:
+            query = query.where(
+                or_(sort_col > value, and_(sort_col == value, UserBook.id > last_id))
             )
 
-    return books
+    if order == "desc":
+        query = query.order_by(sort_col.desc(), col(UserBook.id).desc())
+    else:
+        query = query.order_by(sort_col.asc(), col(UserBook.id).asc())
+
+    # Pedimos una fila extra para saber si hay más páginas
+    user_books = session.exec(query.limit(limit + 1)).all()
+    has_more = len(user_books) > limit
+    user_books = user_books[:limit]
+
+    items = []
+    for ub in user_books:
+        fields = dict(
+            id=ub.book.id,
+            title=ub.book.title,
+            author=ub.book.author,
+            page_count=ub.book.page_count,
+            publisher=ub.book.publisher,
+            published_date=ub.book.published_date,
+            image_url=ub.book.image_url,
+            category=ub.book.category,
+            progress=ub.progress,
+            rating=ub.rating,
+            notes=ub.notes,
+            tags=ub.tags,
+            status=ub.status,
+            current_page=ub.current_page,
+            added_at=ub.added_at,
+        )
+        if summary:
+            items.append(LibraryBookSummary(**fields))
+        else:
+            items.append(LibraryBook(**fields, description=ub.book.description))
+
+    next_cursor = None
+    if has_more and user_books:
+        last = user_books[-1]
+        last_value = last.added_at if sort == "added_at" else getattr(last.book, sort)
+        next_cursor = _encode_cursor(last_value, last.id)
+
+    if summary:
+        return LibraryPageSummary(items=items, next_cursor=next_cursor)
+    return LibraryPage(items=items, next_cursor=next_cursor)
+
+
+@router.get("/tags", response_model=List[TagCount])
+async def get_tag_counts(
+    request: Request,
+    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    # Cambia con la biblioteca: mismo ETag (versión LIBRARY) que el listado
+    return await cached_json(
+        request,
+        LIBRARY,
+        current_user.id,
+        List[TagCount],
+        lambda: run_in_threadpool(tag_counts, session, current_user.id),
+    )
+
+
+def _save_google_results(session: Session, google_results: List[dict]):
+    # Un único upsert para todo el lote; un ISBN repetido ya no aborta la petición
+    try:
+        upsert_books(session, google_results)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(
+            status_code=500, detail=f"Error al guardar el libro: {str(e)}"
+        )
 
 
 @router.get("/by-title")
-def search_book_title(
+async def search_book_title(
     title: str,
     author: Optional[str] = None,
     session: Session = Depends(get_session),
-    _=Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    query = select(Book).where(
-        and_(
-            col(Book.title).ilike(f"%{title.strip()}%"),
-            func.abs(func.length(Book.title) - len(title.strip()))
-            < 5,
-        )
-    )
-
-    if author:
-        query = query.where(col(Book.author).ilike(f"%{author}%"))
-    books_db = session.exec(query).all()
+    # La base de datos en el threadpool; solo la llamada a Google es async
+    books_db = await run_in_threadpool(search_books, session, title, author, limit=5)
 
     if books_db:
         return {"message": "Libro encontrado en biblioteca local", "books": books_db}
 
-    google_results = fetch_multiple_books(title, author, max_results=5)
+    google_results = await fetch_multiple_books(
+        title, author, max_results=5, limiter=google_limiter, user_id=current_user.id
+    )
 
     if not google_results:
         raise HTTPException(
             status_code=404, detail="No se encontró el libro en ninguna fuente"
         )
 
-    for book in google_results:
-        new_book = Book(**book)
+    await run_in_threadpool(_save_google_results, session, google_results)
+    return {"message": "Libros importado desde Google Books", "books": google_results}
+
 
-        try:
-            session.add(new_book)
-            session.commit()
-            session.refresh(new_book)
-        except Exception as e:
+def _add_to_library(
+    session: Session,
+    user_id: int,
+    book_db: Optional[Book],
+    google_results: List[dict],
+):
+    if not book_db:
+        # Se confirma en el mismo commit que el UserBook
+        imported = upsert_books(session, google_results[:1])
+        if not imported:
+            raise HTTPException(
+                status_code=404,
+                detail="El libro de Google Books no tiene ISBN",
+            )
+        book_db = imported[0]
+
+    # El índice único (user_id, book_id) resuelve el duplicado en la propia
+    # inserción, sin la carrera de consultar antes de escribir
+    now = datetime.now()
+    statement = (
+        dialect_insert(session)(UserBook)
+        .values(
+            user_id=user_id,
+            book_id=book_db.id,
+            status="PENDING",
+            current_page=0,
+            rating=0,
+            notes="",
+            added_at=now,
+            updated_at=now,
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "book_id"])
+        .returning(UserBook.id)
+    )
+
+    try:
+        user_book_id = session.scalar(statement)
+        if user_book_id is None:
             session.rollback()
             raise HTTPException(
-                status_code=500, detail=f"Error al guardar el libro: {str(e)}"
+                status_code=409,
+                detail="Este libro ya está en tu colección",
             )
 
-    return {"message": "Libros importado desde Google Books", "books": google_results}
+        refresh_library_fingerprint(session, user_id)
+        session.commit()
+        new_user_book = session.get(UserBook, user_book_id)
+        # Refrescamos el book_db para que traiga la info actualizada (ID, etc)
+        session.refresh(book_db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al vincular el libro al usuario: {str(e)}",
+        )
+    return new_user_book, book_db
 
 
 @router.post("/by-title")
-def add_book_title(
+async def add_book_title(
     title: str,
     author: Optional[str] = None,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    book_query = select(Book).where(Book.title.ilike(f"%{title}%"))
-    if author:
-        book_query = book_query.where(Book.author.ilike(f"%{author}%"))
-
-    book_db = session.exec(book_query).first()
+    book_db = await run_in_threadpool(find_best_match, session, title, author)
     source = "Local DB"
+    google_results = []
 
     if not book_db:
-        google_results = fetch_multiple_books(title, author, max_results=1)
+        google_results = await fetch_multiple_books(
+            title, author, max_results=1, limiter=google_limiter, user_id=current_user.id
+        )
 
         if not google_results:
             raise HTTPException(
                 status_code=404,
                 detail="Libro no encontrado en Google Books",
             )
-
-        best_match = google_results[0]
-        book_db = Book(**best_match)
-
-        session.add(book_db)
-        session.commit()
-        session.refresh(book_db)
         source = "Google Books"
 
-    exists_query = select(UserBook).where(
-        UserBook.user_id == current_user.id, UserBook.book_id == book_db.id
+    new_user_book, book_db = await run_in_threadpool(
+        _add_to_library, session, current_user.id, book_db, google_results
     )
-    user_book_exists = session.exec(exists_query).first()
-
-    if user_book_exists:
-        raise HTTPException(
-            status_code=409,
-            detail="Este libro ya está en tu colección",
-        )
-
-    new_user_book = UserBook(
-        user_id=current_user.id,
-        book_id=book_db.id,
-        status="PENDING",
-        current_page=0,
-        rating=0,
-        notes="",
-    )
-
-    try:
-        session.add(new_user_book)
-        session.commit()
-        session.refresh(new_user_book)
-        # Refrescamos el book_db para que traiga la info actualizada (ID, etc)
-        session.refresh(book_db)
-    except Exception as e:
-        session.rollback()
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error al vincular el libro al usuario: {str(e)}",
-        )
+    await bump_version(LIBRARY, current_user.id)
 
     return {
         "message": "Libro añadido con éxito",
@@ -165,12 +332,73 @@ def add_book_title(
     }
 
 
+@router.post("/import")
+async def import_books(
+    file: UploadFile = File(..., description="Export de Goodreads o CSV"),
+    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    # Se lee el fichero fila a fila y se devuelve el progreso por lotes
+    # como NDJSON (una línea por lote terminado)
+    lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+
+    async def progress_events():
+        progress_iter = import_library(
+            session, current_user.id, iter_import_rows(lines), offload=run_in_threadpool
+        )
+        async for progress in progress_iter:
+            # Cada lote ya está confirmado: el listado puede mostrarlo
+            await bump_version(LIBRARY, current_user.id)
+            yield progress.model_dump_json() + "\n"
+
+    # Content-Encoding: identity evita que el middleware de compresión
+    # acumule las líneas de progreso en su buffer
+    return StreamingResponse(
+        progress_events(),
+        media_type="application/x-ndjson",
+        headers={"Content-Encoding": "identity"},
+    )
+
+
+@router.post("/progress", response_model=ProgressBatchResult)
+async def sync_progress(
+    data: ProgressBatch,
+    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    # Sincronización de la página actual desde los lectores: no escribe en
+    # la DB, deja la actualización en el buffer write-behind (se vuelca en
+    # segundos con un UPDATE por lote) y devuelve el progreso calculado.
+    # Al volcarse también alimenta las estadísticas de lectura
+    targets = await run_in_threadpool(load_targets, session, current_user.id, [u.book_id for u in data.updates])
+
+    now = datetime.now()
+    latest = {u.book_id: u.current_page for u in data.updates}
+    seconds = {book_id: 0 for book_id in latest}
+    for u in data.updates:
+        seconds[u.book_id] += u.seconds
+    items, not_found = [], []
+    for book_id, current_page in latest.items():
+        target = targets.get(book_id)
+        if target is None:
+            not_found.append(book_id)
+            continue
+        progress_buffer.add(target.user_book_id, current_user.id, book_id, current_page, seconds[book_id], now)
+        items.append(ProgressOut(
+            book_id=book_id,
+            current_page=current_page,
+            progress=compute_progress(current_page, target.page_count),
+        ))
+
+    return ProgressBatchResult(items=items, not_found=not_found)
+
+
 @router.put("/{book_id}")
 def update_user_book(
     book_id: int,
     data: BookUpdate,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     query = select(UserBook).where(
         UserBook.book_id == book_id, UserBook.user_id == current_user.id
@@ -182,12 +410,31 @@ def update_user_book(
             status_code=404, detail="El usuario no tiene este libro asignado"
         )
 
+    from_page, from_status = user_book.current_page or 0, user_book.status
     update_data = data.model_dump(exclude_unset=True)
+    if "tags" in update_data:
+        update_data["tags"] = set_user_book_tags(
+            session, current_user.id, {user_book.id: update_data["tags"]}
+        )[user_book.id]
     for key, value in update_data.items():
         setattr(user_book, key, value)
 
     session.add(user_book)
+    record_events(session, [ProgressEvent(
+        user_id=current_user.id,
+        book_id=book_id,
+        category=user_book.book.category,
+        from_page=from_page,
+        to_page=user_book.current_page or 0,
+        seconds_read=0,
+        finished=is_finish(
+            from_page, user_book.current_page or 0, user_book.book.page_count, from_status, user_book.status
+        ),
+        created_at=datetime.now(),
+    )])
+    refresh_library_fingerprint(session, current_user.id)
     session.commit()
+    bump_version_from_thread(LIBRARY, current_user.id)
     session.refresh(user_book)
 
     return {
@@ -201,21 +448,23 @@ def update_user_book(
 def delete_user_book(
     book_id: int,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    print("book id", book_id)
     query = select(UserBook).where(
         UserBook.book_id == book_id, UserBook.user_id == current_user.id
     )
     user_book = session.exec(query).first()
-    print("user_book", user_book)
 
     if not user_book:
         raise HTTPException(
             status_code=404, detail="El usuario no tiene este libro asignado"
         )
 
+    session.exec(delete(UserBookTag).where(UserBookTag.user_book_id == user_book.id))
     session.delete(user_book)
+    refresh_library_fingerprint(session, current_user.id)
     session.commit()
+    forget_target(current_user.id, book_id)
+    bump_version_from_thread(LIBRARY, current_user.id)
 
     return {"message": "Book deleted"}
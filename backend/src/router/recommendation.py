@@ -1,130 +1,206 @@
-from typing import List
-from sqlmodel import select
-from config.database import get_session
-from fastapi import APIRouter, Depends, HTTPException
-from model.book import Book, UserBook
-from model.recommendation import Recommendation
+import json
+import uuid
+from typing import List, Optional
+from celery.result import AsyncResult
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, col, select
+from config.database import SessionLocal, get_session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from model.recommendation import Recommendation, RecommendationBatch
+from dto.recommendation import RecommendationBatchOut, RecommendationHistoryPage
+from dto.user import CurrentUser
 from model.user import User
-from requests import Session
-from router.user import get_current_user
-from util.book_api import fetch_multiple_books
-from util.ollama import get_ai_recommendations
+from util.auth import get_current_user
+from util.http_cache import RECOMMENDATIONS, bump_version, cached_json
+from util.ratelimit import RateLimited, llm_limiter
+from util.recommender import generate_for_user, latest_recommendations, stream_for_user
+from util.singleflight import SingleFlight
+from worker import celery_app
 
 router = APIRouter(prefix="/recommendations", tags=["recommendations"])
 
+# Generaciones en curso por (usuario, force)
+generation_flights = SingleFlight()
+
 
 @router.post("/generate")
 async def generate_and_save_recommendations(
-    current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    response: Response,
+    force: bool = False,
+    background: bool = False,
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    # 1. Obtener libros del usuario para el contexto (usando SQLModel)
-    # Seleccionamos los libros que el usuario tiene vinculados en UserBook
-    statement = select(Book).join(UserBook).where(UserBook.user_id == current_user.id)
-    user_books = session.exec(statement).all()
+    if background:
+        # La generación la hace el worker; el cliente consulta el estado en
+        # /recommendations/jobs/{job_id}. El cupo por usuario evita llenar
+        # la cola; la concurrencia del worker ya limita las llamadas al LLM
+        llm_limiter.check(current_user.id)
+        job = celery_app.send_task(
+            "tasks.generate_user_recommendations",
+            args=[current_user.id, force],
+            task_id=_job_id(current_user.id),
+        )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"job_id": job.id, "status": "PENDING"}
+
+    # Las consultas a la DB van al threadpool y el LLM y Google Books se
+    # esperan de forma asíncrona: la generación no bloquea otras peticiones
+    # Si el usuario ya tiene una generación en curso (doble clic, varias
+    # pestañas), esta petición espera a la misma en lugar de lanzar otra.
+    # La generación compartida abre su propia sesión: la de la petición se
+    # cierra si ese cliente se desconecta, y las demás siguen esperando
+    async def generate():
+        with SessionLocal() as session:
+            user = await run_in_threadpool(session.get, User, current_user.id)
+            return await generate_for_user(
+                session, user, force=force, offload=run_in_threadpool, limiter=llm_limiter
+            )
+
+    try:
+        final_recs = await generation_flights.do((current_user.id, force), generate)
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(
+            status_code=500, detail="Error al generar las recomendaciones."
+        )
 
-    if not user_books:
+    if final_recs is None:
         raise HTTPException(
             status_code=400,
             detail="No tienes suficientes libros para generar recomendaciones.",
         )
 
-    # 2. Llamada a Ollama (Proceso pesado en Raspberry Pi)
-    raw_recommendations = get_ai_recommendations(user_books)
+    await bump_version(RECOMMENDATIONS, current_user.id)
+    return final_recs
 
-    final_recs = []
 
-    # 3. Enriquecer y Guardar
-    for rec in raw_recommendations:
-        # Intentamos encontrar si el libro recomendado ya existe en nuestra DB maestra
-        book_query = select(Book).where(Book.title.ilike(f"%{rec['title']}%"))
-        if rec.get("author"):
-            book_query = book_query.where(Book.author.ilike(f"%{rec['author']}%"))
+@router.post("/generate/stream")
+async def stream_recommendations(
+    force: bool = False,
+    current_user: CurrentUser = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    # Server-Sent Events: un evento `recommendation` por cada libro en cuanto
+    # el modelo lo termina y un `done` con la tanda ya guardada
+    async def events():
+        try:
+            user = await run_in_threadpool(session.get, User, current_user.id)
+            async for event, data in stream_for_user(
+                session, user, force=force, offload=run_in_threadpool, limiter=llm_limiter
+            ):
+                if event == "done":
+                    await bump_version(RECOMMENDATIONS, current_user.id)
+                    data = [rec.model_dump(mode="json") for rec in data]
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except RateLimited as e:
+            # La respuesta ya ha empezado: el 429 va como evento de error
+            error = {"detail": e.detail, "retry_after": e.retry_after}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+        except Exception:
+            error = {"detail": "Error al generar las recomendaciones."}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        book_db = session.exec(book_query).first()
 
-        # Si no existe en la DB local, lo buscamos en Google Books
-        if not book_db:
-            google_results = fetch_multiple_books(
-                rec["title"], rec.get("author", ""), max_results=1
-            )
+def _job_id(user_id: int) -> str:
+    # El id del trabajo lleva el del usuario: se comprueba de quién es antes
+    # de preguntar a Celery, que no sabe nada de un trabajo aún en cola
+    return f"{user_id}-{uuid.uuid4()}"
 
-            if google_results:
-                best_match = google_results[0]
-                book_db = Book(**best_match)
-                session.add(book_db)
-                session.commit()  # Guardamos en la maestra para que otros usuarios lo aprovechen
-                session.refresh(book_db)
-            else:
-                # Si Google tampoco lo encuentra, saltamos este libro o usamos datos de la IA
-                print(f"Advertencia: No se encontró info extra para {rec['title']}")
-
-        # 4. Crear la recomendación vinculada al usuario
-        # Usamos los datos de la DB si los encontramos, si no, los de la IA
-        db_rec = Recommendation(
-            user_id=current_user.id,
-            title=rec["title"],
-            author=rec.get("author", "Autor desconocido"),
-            reason=rec["reason"],
-            image_url=book_db.image_url if book_db else None,
-            external_link=book_db.external_link if book_db else None,
-        )
-        session.add(db_rec)
-        final_recs.append(db_rec)
 
-    try:
-        session.commit()
-        for r in final_recs:
-            session.refresh(r)
-    except Exception as e:
-        session.rollback()
-        raise HTTPException(
-            status_code=500, detail="Error al guardar las recomendaciones."
-        )
+@router.get("/jobs/{job_id}")
+def get_generation_job(
+    job_id: str,
+    # Lee filas recién escritas por el worker: contra la principal, no la réplica
+    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    # Síncrona (threadpool): tanto AsyncResult como la sesión bloquean
+    if not job_id.startswith(f"{current_user.id}-"):
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
 
-    return final_recs
+    result = AsyncResult(job_id, app=celery_app)
+
+    if not result.ready():
+        return {"job_id": job_id, "status": result.status}
+
+    if result.failed():
+        return {"job_id": job_id, "status": result.status, "recommendations": []}
+
+    data = result.result or {}
+    if data.get("user_id") != current_user.id:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    recommendations = session.exec(
+        select(Recommendation).where(col(Recommendation.id).in_(data["recommendation_ids"]))
+    ).all()
+    return {"job_id": job_id, "status": result.status, "recommendations": recommendations}
 
 
 @router.get("/latest", response_model=List[Recommendation])
 async def get_latest_recommendations(
+    request: Request,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    print("current_user", current_user)
-    # 1. Buscamos la fecha de la última recomendación creada para este usuario
-    subquery = (
-        select(Recommendation.created_at)
-        .where(Recommendation.user_id == current_user["id"])
-        .order_by(Recommendation.created_at.desc())
-        .limit(1)
+    return await cached_json(
+        request,
+        RECOMMENDATIONS,
+        current_user.id,
+        List[Recommendation],
+        lambda: run_in_threadpool(latest_recommendations, session, current_user.id),
     )
 
-    last_date = session.exec(subquery).first()
 
-    if not last_date:
-        return []
-
-    # 2. Obtenemos todas las recomendaciones que se crearon en ese mismo instante
-    # (ya que la IA suele generar 3 de golpe)
-    statement = (
-        select(Recommendation)
-        .where(Recommendation.user_id == current_user.id)
-        .where(Recommendation.created_at == last_date)
-    )
-
-    results = session.exec(statement).all()
-    return results
-
-
-@router.get("/history")
+@router.get("/history", response_model=RecommendationHistoryPage)
 async def get_recommendation_history(
+    request: Request,
+    cursor: Optional[int] = None,
+    limit: int = Query(10, ge=1, le=50),
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    statement = (
-        select(Recommendation)
-        .where(Recommendation.user_id == current_user.id)
-        .order_by(Recommendation.created_at.desc())
+    return await cached_json(
+        request,
+        RECOMMENDATIONS,
+        current_user.id,
+        RecommendationHistoryPage,
+        lambda: run_in_threadpool(_history_page, session, current_user.id, cursor, limit),
     )
 
-    return session.exec(statement).all()
+
+def _history_page(session: Session, user_id: int, cursor: Optional[int], limit: int) -> RecommendationHistoryPage:
+    # Paginación por tanda (de la más reciente a la más antigua) con cursor
+    # sobre el id: usa el índice (user_id, id) sin OFFSET
+    statement = select(RecommendationBatch).where(RecommendationBatch.user_id == user_id)
+    if cursor is not None:
+        statement = statement.where(RecommendationBatch.id < cursor)
+    batches = session.exec(statement.order_by(RecommendationBatch.id.desc()).limit(limit + 1)).all()
+
+    has_more = len(batches) > limit
+    batches = batches[:limit]
+
+    recs_by_batch = {}
+    if batches:
+        recs = session.exec(
+            select(Recommendation)
+            .where(col(Recommendation.batch_id).in_([b.id for b in batches]))
+            .order_by(Recommendation.id)
+        ).all()
+        for rec in recs:
+            recs_by_batch.setdefault(rec.batch_id, []).append(rec)
+
+    return RecommendationHistoryPage(
+        items=[
+            RecommendationBatchOut(id=b.id, created_at=b.created_at, recommendations=recs_by_batch.get(b.id, []))
+            for b in batches
+        ],
+        next_cursor=batches[-1].id if has_more else None,
+    )
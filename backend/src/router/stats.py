@@ -0,0 +1,35 @@
+from datetime import date
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
+
+from config.database import get_session
+from dto.stats import ReadingStats
+from dto.user import CurrentUser
+from util.auth import get_current_user
+from util.http_cache import LIBRARY, cached_json
+from util.reading_stats import reading_stats
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+
+@router.get("/reading", response_model=ReadingStats)
+async def get_reading_stats(
+    request: Request,
+    days: int = Query(default=30, ge=1, le=366),
+    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    # Los agregados solo cambian con escrituras en la biblioteca, que ya
+    # suben la versión de LIBRARY. La ventana de días se mueve a medianoche,
+    # así que el día también forma parte de la versión
+    today = date.today()
+    return await cached_json(
+        request,
+        LIBRARY,
+        current_user.id,
+        ReadingStats,
+        lambda: run_in_threadpool(reading_stats, session, current_user.id, days, today),
+        variant=today.isoformat(),
+    )
@@ -1,45 +1,90 @@
 from fastapi.security import OAuth2PasswordRequestForm
-from dto.user import UserCreate
+from dto.user import CurrentUser, PasswordChange, RefreshRequest, UserCreate, UserPublic
 from config.database import get_session
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from model.book import UserBook
+from model.reading import ReadingCategoryStats, ReadingDailyStats, ReadingEvent
+from model.recommendation import Recommendation, RecommendationBatch
+from model.tag import UserBookTag
 from model.user import User
-from sqlmodel import Session, select
-from util.auth import create_access_token, get_password_hash, verify_password, get_current_user
+from sqlmodel import Session, delete, select
+from util.http_cache import cached_json
+from util.auth import (
+    create_token_pair,
+    get_current_user,
+    get_refresh_user,
+    hash_password_async,
+    invalidate_user,
+    needs_rehash,
+    verify_password_async,
+)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-@router.get("/me")
-async def get_current_user(
-    current_user: User = Depends(get_current_user), 
+@router.get("/me", response_model=UserPublic)
+async def read_current_user(
+    request: Request,
+    current_user: CurrentUser = Depends(get_current_user), 
 ):
-    return {
-        "id": current_user.id,
-        "email": current_user.email,
-        "username": current_user.username,
-    }
+    # El perfil solo cambia con la versión del token (contraseña): sirve de
+    # versión para el ETag sin pasar por Redis
+    async def build():
+        return UserPublic(id=current_user.id, email=current_user.email, username=current_user.username)
+
+    return await cached_json(
+        request, "profile", current_user.id, UserPublic, build, version=str(current_user.token_version)
+    )
+
+def _find_user(session: Session, username: str):
+    return session.exec(select(User).where(User.username == username)).first()
+
+def _find_existing_user(session: Session, username: str, email: str):
+    return session.exec(
+        select(User).where((User.username == username) | (User.email == email))
+    ).first()
+
+def _save_user(session: Session, user: User) -> User:
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    return user
+
+# Los handlers son async para esperar a bcrypt (pool de procesos); las
+# consultas van al threadpool para no bloquear el event loop
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
     # 1. Buscar al usuario por nombre de usuario
-    user = session.exec(select(User).where(User.username == form_data.username)).first()
+    user = await run_in_threadpool(_find_user, session, form_data.username)
     
-    # 2. Verificar existencia y contraseña
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    # 2. Verificar existencia y contraseña (bcrypt en el pool de procesos)
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User or password incorrect",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Si ha cambiado el coste de bcrypt, aprovechamos que tenemos la
+    # contraseña en claro para rehacer el hash
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = await hash_password_async(form_data.password)
+        user = await run_in_threadpool(_save_user, session, user)
     
-    # 3. Generar el token
-    access_token = create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    # 3. Generar los tokens
+    return create_token_pair(user)
+
+@router.post("/refresh")
+def refresh_token(data: RefreshRequest, session: Session = Depends(get_session)):
+    user = get_refresh_user(session, data.refresh_token)
+    return create_token_pair(user)
 
 @router.post("/")
-def create_user(user_data: UserCreate, session: Session = Depends(get_session)):
-    existing_user = session.exec(
-        select(User).where((User.username == user_data.username) | (User.email == user_data.email))
-    ).first()
+async def create_user(user_data: UserCreate, session: Session = Depends(get_session)):
+    existing_user = await run_in_threadpool(
+        _find_existing_user, session, user_data.username, user_data.email
+    )
     
     if existing_user:
         raise HTTPException(
@@ -47,20 +92,60 @@ def create_user(user_data: UserCreate, session: Session = Depends(get_session)):
             detail="Username or email already created"
         )
 
-    hashed_pwd = get_password_hash(user_data.password)
+    hashed_pwd = await hash_password_async(user_data.password)
     
     db_user = User(
         username=user_data.username,
         email=user_data.email,
         hashed_password=hashed_pwd
     )
-    
-    session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    db_user = await run_in_threadpool(_save_user, session, db_user)
     
     return {
         "id": db_user.id,
         "username": db_user.username,
         "message": "User created"
-    }
\ No newline at end of file
+    }
+
+@router.put("/me/password")
+async def change_password(
+    data: PasswordChange,
+    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    user = await run_in_threadpool(session.get, User, current_user.id)
+    if not await verify_password_async(data.current_password, user.hashed_password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User or password incorrect",
+        )
+
+    # Nueva versión de token: los tokens emitidos antes dejan de valer
+    user.hashed_password = await hash_password_async(data.new_password)
+    user.token_version += 1
+    user = await run_in_threadpool(_save_user, session, user)
+    await invalidate_user(user.id)
+
+    return create_token_pair(user)
+
+def _delete_user_data(session: Session, user_id: int):
+    session.exec(delete(UserBookTag).where(UserBookTag.user_id == user_id))
+    session.exec(delete(UserBook).where(UserBook.user_id == user_id))
+    session.exec(delete(Recommendation).where(Recommendation.user_id == user_id))
+    session.exec(delete(RecommendationBatch).where(RecommendationBatch.user_id == user_id))
+    session.exec(delete(ReadingEvent).where(ReadingEvent.user_id == user_id))
+    session.exec(delete(ReadingDailyStats).where(ReadingDailyStats.user_id == user_id))
+    session.exec(delete(ReadingCategoryStats).where(ReadingCategoryStats.user_id == user_id))
+    session.exec(delete(User).where(User.id == user_id))
+    session.commit()
+
+@router.delete("/me")
+async def delete_current_user(
+    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    # Los borrados en el threadpool; el aviso a otros procesos es async
+    await run_in_threadpool(_delete_user_data, session, current_user.id)
+    await invalidate_user(current_user.id)
+
+    return {"message": "User deleted"}
@@ -1,56 +1,151 @@
+import asyncio
 from datetime import datetime, timedelta, timezone
-import hashlib
-import bcrypt
+import json
+import time
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+import redis.asyncio as aioredis
 from sqlmodel import Session, select
 
+from dto.user import CurrentUser
 from model.user import User
 from config.database import get_session
+from config.settings import settings
+from util.cache import REDIS_URL, TTLCache
+from util.log import get_logger
+from util.password import get_password_hash, hash_password_async, needs_rehash, verify_password, verify_password_async
 
-SECRET_KEY = "secret_key_for_book"
+SECRET_KEY = settings.secret_key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # El token durará un día
+# Con el refresh token el cliente renueva el de acceso sin volver a
+# mandar la contraseña (y sin pasar por bcrypt)
+REFRESH_TOKEN_EXPIRE_DAYS = 30
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def _prepare_password(password: str) -> bytes:
-    """
-    1. Aplica SHA-256 para tener longitud fija (64 chars).
-    2. Codifica a bytes para bcrypt.
-    """
-    pw_hash = hashlib.sha256(password.encode("utf-8")).hexdigest()
-    return pw_hash.encode("utf-8")
-
-def get_password_hash(password: str) -> str:
-    # Generar sal y hashear
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(_prepare_password(password), salt)
-    return hashed.decode("utf-8") # Guardamos como string en la DB
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    # Comparar la contraseña plana con la de la DB
-    return bcrypt.checkpw(
-        _prepare_password(plain_password), 
-        hashed_password.encode("utf-8")
-    )
+# Caché token -> usuario. El TTL acota cuánto puede sobrevivir una entrada
+# si se pierde un mensaje de invalidación
+AUTH_CACHE_SIZE = 10_000
+AUTH_CACHE_TTL = 60 * 5
+AUTH_INVALIDATION_CHANNEL = "auth:invalidate"
+
+logger = get_logger(__name__)
+
+_principal_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
 
-def create_access_token(data: dict):
+def create_access_token(data: dict, expires_delta: timedelta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)):
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.now(timezone.utc) + expires_delta
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
+def create_user_token(user: User) -> str:
+    # El id y la versión van en el token para validar sin buscar por nombre
+    return create_access_token(data={"sub": user.username, "uid": user.id, "ver": user.token_version})
+
+def create_refresh_token(user: User) -> str:
+    return create_access_token(
+        data={"sub": user.username, "uid": user.id, "ver": user.token_version, "type": "refresh"},
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+
+def create_token_pair(user: User) -> dict:
+    return {
+        "access_token": create_user_token(user),
+        "refresh_token": create_refresh_token(user),
+        "token_type": "bearer",
+    }
+
+def get_refresh_user(session: Session, refresh_token: str) -> User:
+    # Un refresh token solo vale mientras no cambie la versión del usuario
+    try:
+        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    if payload.get("type") != "refresh" or payload.get("uid") is None:
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+    user = session.get(User, payload["uid"])
+    if user is None or payload.get("ver", 0) != user.token_version:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    return user
+
+def _load_principal(session: Session, payload: dict) -> CurrentUser:
+    user_id = payload.get("uid")
+    if user_id is not None:
+        user = session.get(User, user_id)
+    else:
+        # Tokens emitidos antes de incluir el id
+        user = session.exec(select(User).where(User.username == payload["sub"])).first()
+
+    if user is None:
+        raise HTTPException(status_code=401, detail="Usuario no encontrado")
+    if payload.get("ver", 0) != user.token_version:
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+    return CurrentUser(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        token_version=user.token_version,
+    )
+
+def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)) -> CurrentUser:
+    cached = _principal_cache.get(token)
+    if cached is not None:
+        return cached
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        # Un refresh token no sirve como token de acceso
+        if username is None or payload.get("type") == "refresh":
             raise HTTPException(status_code=401, detail="Token inválido")
     except JWTError:
         raise HTTPException(status_code=401, detail="Token inválido")
-    
-    user = session.exec(select(User).where(User.username == username)).first()
-    if user is None:
-        raise HTTPException(status_code=401, detail="Usuario no encontrado")
-    return user
\ No newline at end of file
+
+    principal = _load_principal(session, payload)
+
+    # Nunca cacheamos más allá de la caducidad del token
+    ttl = min(AUTH_CACHE_TTL, payload["exp"] - time.time()) if "exp" in payload else AUTH_CACHE_TTL
+    if ttl > 0:
+        _principal_cache.set(token, principal, ttl=ttl)
+    return principal
+
+def forget_user(user_id: int):
+    _principal_cache.delete_where(lambda principal: principal.id == user_id)
+
+async def invalidate_user(user_id: int):
+    """
+    Saca al usuario de la caché de este proceso y avisa al resto de procesos
+    de la API por Redis. Llamar tras cambiar la contraseña o borrar la cuenta.
+    """
+    forget_user(user_id)
+    try:
+        client = aioredis.from_url(REDIS_URL)
+        try:
+            await client.publish(AUTH_INVALIDATION_CHANNEL, json.dumps({"user_id": user_id}))
+        finally:
+            await client.aclose()
+    except Exception as e:
+        logger.warning("error publicando invalidación en Redis", extra={"error": str(e)})
+
+async def listen_for_invalidations():
+    # Tarea de fondo (lifespan de la app): aplica las invalidaciones que
+    # publican los demás procesos. Si Redis cae, reintenta con espera
+    while True:
+        client = aioredis.from_url(REDIS_URL)
+        try:
+            async with client.pubsub() as pubsub:
+                await pubsub.subscribe(AUTH_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        forget_user(json.loads(message["data"])["user_id"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("error escuchando invalidaciones en Redis", extra={"error": str(e)})
+            await asyncio.sleep(5)
+        finally:
+            await client.aclose()
@@ -1,44 +1,220 @@
+import asyncio
+import random
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, Dict, List, Optional
-import requests
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import httpx
 
-def fetch_multiple_books(title: str, author: str, max_results: int = 10, lang: str = "es") -> List[Dict[str, Any]]:
+from config.settings import settings
+from util.cache import TwoLevelCache
+from util.log import get_logger
+from util.metrics import book_lookups, upstream_timer
+from util.ratelimit import RateLimiter, limit
+from util.singleflight import SingleFlight
+from util.text import normalize_text
+
+logger = get_logger(__name__)
+
+GOOGLE_BOOKS_URL = settings.google_books_url
+
+# Todas las peticiones van al mismo host, así que el límite del pool de
+# httpx actúa como límite de concurrencia por host
+MAX_CONNECTIONS = 10
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 30
+REQUEST_TIMEOUT = httpx.Timeout(5.0, pool=30.0)
+
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=REQUEST_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    # Cliente compartido por toda la app (vive en el event loop de uvicorn)
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _new_client()
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+@asynccontextmanager
+async def google_books_client():
+    # Para procesos que crean su propio event loop (p.ej. el worker de Celery
+    # con asyncio.run), donde no se puede reutilizar el cliente compartido
+    client = _new_client()
+    try:
+        yield client
+    finally:
+        await client.aclose()
+
+
+async def _get_with_retries(client: httpx.AsyncClient, params: Dict[str, Any]) -> Dict[str, Any]:
+    for attempt in range(MAX_RETRIES):
+        try:
+            response = await client.get(GOOGLE_BOOKS_URL, params=params)
+            if response.status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                return response.json()
+        except httpx.TransportError:
+            if attempt == MAX_RETRIES - 1:
+                raise
+
+        if attempt < MAX_RETRIES - 1:
+            # Backoff exponencial con jitter
+            await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt) + random.uniform(0, RETRY_BACKOFF))
+
+    response.raise_for_status()
+    return response.json()
+
+
+def _encode_books(books: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {**b, "published_date": b["published_date"].isoformat() if b.get("published_date") else None}
+        for b in books
+    ]
+
+
+def _decode_books(books: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {**b, "published_date": datetime.fromisoformat(b["published_date"]) if b.get("published_date") else None}
+        for b in books
+    ]
+
+
+# Las búsquedas sin resultado también se cachean, pero menos tiempo
+books_cache = TwoLevelCache(
+    "google_books",
+    maxsize=4096,
+    ttl=60 * 60 * 24,
+    negative_ttl=60 * 15,
+    encode=_encode_books,
+    decode=_decode_books,
+)
+
+# Búsquedas en curso: peticiones simultáneas del mismo título esperan a la
+# misma llamada a Google en lugar de repetirla
+google_flights = SingleFlight()
+
+
+def _cache_key(title: str, author: Optional[str], max_results: int, lang: str) -> str:
+    return f"{normalize_text(title)}|{normalize_text(author)}|{lang}|{max_results}"
+
+
+async def _search_google(
+    client: httpx.AsyncClient,
+    title: str,
+    author: Optional[str],
+    max_results: int,
+    lang: str,
+) -> List[Dict[str, Any]]:
     # Aumentamos maxResults para obtener variedad
-    query = f"intitle:{title}+inauthor:{author}"
-    url = f"https://www.googleapis.com/books/v1/volumes?q={query}&maxResults={max_results}&langRestrict={lang}"
-    
+    query = f"intitle:{title}"
+    if author:
+        query += f" inauthor:{author}"
+    params = {"q": query, "maxResults": max_results, "langRestrict": lang}
+
+    data = await _get_with_retries(client, params)
+
     books_found = []
-    
-    try:
-        response = requests.get(url, timeout=5)
-        data = response.json()
-        
-        if "items" in data:
-            for item in data["items"]:
-                vol = item.get("volumeInfo", {})
-                
-                published_dt = _parse_google_date(vol.get("publishedDate"))
-                print("vol", _get_book_identifiers(vol))
-                print("----------------------")
-                
-                book_data = {
-                    "title": vol.get("title"),
-                    "author": ", ".join(vol.get("authors", ["Autor Desconocido"])),
-                    "published_date": published_dt,
-                    "description": vol.get("description", "Sin descripción disponible."),
-                    "page_count": vol.get("pageCount", 0),
-                    "image_url": vol.get("imageLinks", {}).get("thumbnail"),
-                    "external_link": vol.get("infoLink"),
-                    "category": ", ".join(vol.get("categories", ["General"])),
-                    "isbn": _get_book_identifiers(vol)
-                }
-                books_found.append(book_data)
-                
-    except Exception as e:
-        print(f"Error buscando en Google Books: {e}")
-    
+    for item in data.get("items", []):
+        vol = item.get("volumeInfo", {})
+
+        book_data = {
+            "title": vol.get("title"),
+            "author": ", ".join(vol.get("authors", ["Autor Desconocido"])),
+            "published_date": _parse_google_date(vol.get("publishedDate")),
+            "description": vol.get("description", "Sin descripción disponible."),
+            "page_count": vol.get("pageCount", 0),
+            "image_url": vol.get("imageLinks", {}).get("thumbnail"),
+            "external_link": vol.get("infoLink"),
+            "category": ", ".join(vol.get("categories", ["General"])),
+            "isbn": _get_book_identifiers(vol)
+        }
+        books_found.append(book_data)
+
     return books_found
 
+
+async def fetch_multiple_books(
+    title: str,
+    author: Optional[str],
+    max_results: int = 10,
+    lang: str = "es",
+    client: Optional[httpx.AsyncClient] = None,
+    limiter: Optional[RateLimiter] = None,
+    user_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Busca en Google Books con caché. Las búsquedas iguales en curso se
+    agrupan en una sola llamada. Con `limiter`, lo que no está en caché
+    consume cupo del usuario y la llamada real (una por grupo), cupo
+    global; ambos pueden lanzar RateLimited.
+    """
+    key = _cache_key(title, author, max_results, lang)
+    cached = await books_cache.get(key)
+    book_lookups.inc(source="google" if cached is None else "cache")
+    if cached is None:
+        # Fuera de la llamada agrupada: un usuario sin cupo no hace fallar a
+        # los demás que esperan la misma búsqueda
+        if limiter is not None and user_id is not None:
+            limiter.check_user(user_id)
+        cached = await google_flights.do(
+            key, lambda: _lookup(key, client, title, author, max_results, lang, limiter)
+        )
+    # Copias para que quien llama no modifique la entrada cacheada
+    return [dict(b) for b in cached]
+
+
+async def _lookup(key, client, title, author, max_results, lang, limiter):
+    async with limit(limiter):
+        try:
+            with upstream_timer("google_books"):
+                books_found = await _search_google(client or get_client(), title, author, max_results, lang)
+        except Exception as e:
+            # Los errores no se cachean, solo las respuestas válidas
+            logger.warning("error buscando en Google Books", extra={"error": str(e), "title": title})
+            return []
+
+    await books_cache.set(key, books_found)
+    return books_found
+
+
+async def fetch_books_batch(
+    queries: Sequence[Tuple[str, Optional[str]]],
+    max_results: int = 1,
+    lang: str = "es",
+    client: Optional[httpx.AsyncClient] = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Resuelve muchos pares (título, autor) en paralelo. El resultado mantiene
+    el orden de `queries`; una búsqueda fallida devuelve lista vacía.
+    """
+    client = client or get_client()
+    return await asyncio.gather(*[
+        fetch_multiple_books(title, author, max_results=max_results, lang=lang, client=client)
+        for title, author in queries
+    ])
+
 def _parse_google_date(date_str: Optional[str]) -> Optional[datetime]:
     if not date_str:
         return None
@@ -63,7 +239,6 @@ def _parse_google_date(date_str: Optional[str]) -> Optional[datetime]:
 
 def _get_book_identifiers(item):
     if not item:
-        print("DEBUG: Item está vacío")
         return {"isbn": None, "google_id": None, "oclc": None}
 
     # Intentamos sacar el ID de la raíz o de donde esté
@@ -79,8 +254,6 @@ def _get_book_identifiers(item):
         "oclc": None
     }
 
-    print(f"DEBUG: Procesando ID {google_id}, Identificadores encontrados: {len(identifiers)}")
-
     for id_obj in identifiers:
         id_type = id_obj.get("type")
         id_val = id_obj.get("identifier")
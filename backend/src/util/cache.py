@@ -0,0 +1,207 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import redis.asyncio as aioredis
+
+from config.settings import settings
+from util.log import get_logger
+
+REDIS_URL = settings.redis_url
+
+logger = get_logger(__name__)
+
+
+class TTLCache:
+    """
+    Caché LRU en memoria con caducidad por entrada. Es thread-safe para
+    poder usarse tanto desde el event loop como desde el threadpool.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate: Callable[[Any], bool]):
+        # Recorre toda la caché: pensado para invalidaciones poco frecuentes
+        with self._lock:
+            for key in [k for k, (value, _) in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisTier:
+    """
+    Nivel compartido en Redis. Si Redis no está disponible la caché sigue
+    funcionando solo con el nivel en memoria.
+    """
+
+    # Tras un fallo dejamos de intentarlo durante un rato para no sumar
+    # un timeout a cada petición
+    RETRY_AFTER = 30
+
+    def __init__(self, namespace: str, url: str = REDIS_URL):
+        self.namespace = namespace
+        self.url = url
+        self._client = None
+        self._loop = None
+        self._disabled_until = 0.0
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self._disabled_until
+
+    def _fail(self, e: Exception, action: str):
+        logger.warning(f"error {action} Redis", extra={"namespace": self.namespace, "error": str(e)})
+        self._disabled_until = time.monotonic() + self.RETRY_AFTER
+
+    def _get_client(self):
+        # Las conexiones de redis.asyncio quedan ligadas al event loop; el
+        # worker de Celery crea uno nuevo en cada asyncio.run
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = aioredis.from_url(self.url, socket_timeout=0.5)
+            self._loop = loop
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self._available():
+            return None
+        try:
+            raw = await self._get_client().get(self._key(key))
+        except Exception as e:
+            self._fail(e, "leyendo de")
+            return None
+        return raw.decode("utf-8") if raw is not None else None
+
+    async def set(self, key: str, value: str, ttl: float):
+        if not self._available():
+            return
+        try:
+            await self._get_client().set(self._key(key), value, ex=max(int(ttl), 1))
+        except Exception as e:
+            self._fail(e, "escribiendo en")
+
+    async def get_or_set(self, key: str, value: str, ttl: float) -> Optional[str]:
+        # Guarda `value` solo si la clave no existe y devuelve el valor actual
+        if not self._available():
+            return None
+        try:
+            client = self._get_client()
+            await client.set(self._key(key), value, ex=max(int(ttl), 1), nx=True)
+            raw = await client.get(self._key(key))
+        except Exception as e:
+            self._fail(e, "leyendo de")
+            return None
+        return raw.decode("utf-8") if raw is not None else None
+
+    async def delete(self, key: str) -> bool:
+        # False si no se ha podido borrar (Redis no disponible)
+        if not self._available():
+            return False
+        try:
+            await self._get_client().delete(self._key(key))
+        except Exception as e:
+            self._fail(e, "escribiendo en")
+            return False
+        return True
+
+    async def incr(self, key: str, ttl: float) -> Optional[int]:
+        if not self._available():
+            return None
+        try:
+            async with self._get_client().pipeline(transaction=True) as pipe:
+                value, _ = await pipe.incr(self._key(key)).expire(self._key(key), max(int(ttl), 1)).execute()
+        except Exception as e:
+            self._fail(e, "escribiendo en")
+            return None
+        return value
+
+
+class TwoLevelCache:
+    """
+    Caché en dos niveles: LRU en proceso delante de Redis. Los valores
+    "vacíos" (búsquedas sin resultado) se guardan con un TTL más corto.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        maxsize: int = 2048,
+        ttl: float = 60 * 60 * 24,
+        negative_ttl: float = 60 * 10,
+        encode: Callable[[Any], Any] = lambda value: value,
+        decode: Callable[[Any], Any] = lambda value: value,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.shared = RedisTier(namespace)
+        self._encode = encode
+        self._decode = decode
+        self.counters: Dict[str, int] = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+
+    def _ttl_for(self, value: Any) -> float:
+        return self.negative_ttl if not value else self.ttl
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            self.counters["local_hits"] += 1
+            return value
+
+        raw = await self.shared.get(key)
+        if raw is not None:
+            value = self._decode(json.loads(raw))
+            # Subimos el valor al nivel local
+            self.local.set(key, value, ttl=self._ttl_for(value))
+            self.counters["shared_hits"] += 1
+            return value
+
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any):
+        ttl = self._ttl_for(value)
+        self.local.set(key, value, ttl=ttl)
+        await self.shared.set(key, json.dumps(self._encode(value)), ttl)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "local_size": len(self.local)}
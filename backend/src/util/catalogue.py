@@ -0,0 +1,90 @@
+from typing import Any, Dict, List
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session
+
+from model.book import Book
+from util.text import normalize_text
+
+# Filas por sentencia INSERT (SQLite limita el número de parámetros)
+UPSERT_CHUNK_SIZE = 500
+
+BOOK_COLUMNS = [
+    "isbn",
+    "title",
+    "author",
+    "publisher",
+    "published_date",
+    "description",
+    "page_count",
+    "category",
+    "image_url",
+    "external_link",
+]
+
+# Si el libro ya existe, solo sobrescribimos los datos que el nuevo
+# resultado trae rellenos
+UPDATABLE_COLUMNS = [c for c in BOOK_COLUMNS if c != "isbn"]
+
+
+def dialect_insert(session: Session):
+    # INSERT con ON CONFLICT del motor en uso (Postgres o SQLite)
+    return pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+
+
+def _prepare_rows(books: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    rows: Dict[str, Dict[str, Any]] = {}
+    for book in books:
+        # Sin ISBN no hay forma de deduplicar: no se guarda en la maestra
+        if not book.get("isbn") or not book.get("title"):
+            continue
+        row = {column: book.get(column) for column in BOOK_COLUMNS}
+        row["author"] = row["author"] or "Autor Desconocido"
+        # El INSERT masivo no pasa por los eventos del ORM
+        row["search_title"] = normalize_text(row["title"])
+        row["search_author"] = normalize_text(row["author"])
+        # Un mismo ISBN dos veces en la sentencia rompe el ON CONFLICT
+        rows[row["isbn"]] = row
+    return list(rows.values())
+
+
+def upsert_books(session: Session, books: List[Dict[str, Any]]) -> List[Book]:
+    """
+    Guarda en la maestra un lote de libros con un único
+    `INSERT ... ON CONFLICT (isbn) DO UPDATE` por bloque y devuelve las
+    filas persistidas (con su id), en el orden de entrada y sin duplicados.
+    No hace commit: la transacción la controla quien llama.
+    """
+    rows = _prepare_rows(books)
+    if not rows:
+        return []
+
+    insert = dialect_insert(session)
+    # Siempre en orden de ISBN: dos importaciones con ISBNs en común
+    # bloquean las filas en el mismo orden y no se interbloquean
+    ordered = sorted(rows, key=lambda row: row["isbn"])
+
+    persisted: Dict[str, Book] = {}
+    for start in range(0, len(ordered), UPSERT_CHUNK_SIZE):
+        chunk = ordered[start:start + UPSERT_CHUNK_SIZE]
+        statement = insert(Book).values(chunk)
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=["isbn"],
+            set_={
+                **{
+                    column: func.coalesce(getattr(excluded, column), getattr(Book, column))
+                    for column in UPDATABLE_COLUMNS
+                },
+                "search_title": excluded.search_title,
+                "search_author": excluded.search_author,
+            },
+        ).returning(Book)
+
+        result = session.scalars(statement, execution_options={"populate_existing": True})
+        for book in result:
+            persisted[book.isbn] = book
+
+    return [persisted[row["isbn"]] for row in rows if row["isbn"] in persisted]
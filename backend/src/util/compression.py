@@ -0,0 +1,84 @@
+from typing import Dict
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # Brotli es opcional: sin el paquete solo hay gzip
+    brotli = None
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    # "gzip, br;q=0.5, *;q=0" -> {"gzip": 1.0, "br": 0.5, "*": 0.0}
+    encodings = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[coding] = quality
+    return encodings
+
+
+def _quality(encodings: Dict[str, float], coding: str) -> float:
+    return encodings.get(coding, encodings.get("*", 0.0))
+
+
+class BrotliResponder(IdentityResponder):
+    # Reutiliza la lógica de Starlette (umbral de tamaño, respuestas en
+    # streaming, tipos excluidos como text/event-stream y respuestas que ya
+    # traen Content-Encoding); solo cambia el compresor
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if more_body:
+            return self.compressor.process(body) + self.compressor.flush()
+        return self.compressor.process(body) + self.compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Comprime las respuestas de más de `minimum_size` bytes: Brotli si el
+    cliente lo acepta y el paquete está instalado, si no gzip.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        compresslevel: int = 6,
+        brotli_quality: int = 4,
+    ) -> None:
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Por tokens y con su q: "br;q=0" es rechazarlo, no pedirlo
+        encodings = accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+        br, gzip = _quality(encodings, "br"), _quality(encodings, "gzip")
+        responder: ASGIApp
+        if brotli is not None and br > 0 and br >= gzip:
+            responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif gzip > 0:
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
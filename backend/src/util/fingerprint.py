@@ -0,0 +1,38 @@
+import hashlib
+from typing import List, Optional
+
+from sqlalchemy.orm import contains_eager
+from sqlmodel import Session, select
+
+from model.book import Book, UserBook
+from model.user import User
+from util.ollama import PROMPT_MIN_RATING, prompt_book_lines
+
+
+def library_fingerprint(user_books: List[UserBook]) -> Optional[str]:
+    """
+    Hash de lo que la biblioteca aporta al prompt del LLM (libros bien
+    valorados con su nota y notas). Si no cambia, las recomendaciones
+    guardadas siguen valiendo. None si no hay nada que recomendar.
+    """
+    lines = sorted(prompt_book_lines(user_books))
+    if not lines:
+        return None
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def refresh_library_fingerprint(session: Session, user_id: int) -> Optional[str]:
+    # Se llama desde las rutas que modifican la biblioteca, antes del commit
+    rated_books = session.exec(
+        select(UserBook)
+        .join(Book, Book.id == UserBook.book_id)
+        .options(contains_eager(UserBook.book))
+        .where(UserBook.user_id == user_id, UserBook.rating >= PROMPT_MIN_RATING)
+    ).all()
+
+    fingerprint = library_fingerprint(rated_books)
+    user = session.get(User, user_id)
+    if user is not None:
+        user.library_fingerprint = fingerprint
+        session.add(user)
+    return fingerprint
@@ -0,0 +1,124 @@
+import hashlib
+import time
+
+import anyio.from_thread
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from config.settings import settings
+from util.cache import RedisTier, TTLCache
+
+# Ámbitos con contador de versión por usuario. Las rutas que escriben
+# incrementan el suyo (`bump_version`) después del commit
+LIBRARY = "library"
+RECOMMENDATIONS = "recommendations"
+
+# Los contadores caducan si no se tocan: al volver a crearse empiezan en un
+# valor nuevo (la hora), así que nunca reaparece una versión antigua
+VERSION_TTL = 60 * 60 * 24 * 7
+
+# El navegador puede guardar la respuesta, pero debe revalidarla siempre
+# con If-None-Match
+CACHE_CONTROL = "private, no-cache"
+
+_versions = RedisTier("version")
+_bodies = TTLCache(maxsize=settings.http_body_cache_size, ttl=settings.http_body_cache_ttl)
+_adapters: Dict[Any, TypeAdapter] = {}
+# Contadores que no se pudieron incrementar (Redis caído). Siguen en Redis
+# con la versión de antes de la escritura: se borran en cuanto vuelve y,
+# hasta entonces, no se dan ETags
+_lost_bumps: Set[str] = set()
+
+
+async def _forget_lost_bumps() -> bool:
+    # False si queda alguno por borrar
+    for key in list(_lost_bumps):
+        if not await _versions.delete(key):
+            return False
+        _lost_bumps.discard(key)
+    return True
+
+
+async def get_version(scope: str, user_id: int) -> Optional[str]:
+    # None si Redis no está disponible: sin versión no hay ETag y se
+    # responde siempre con datos frescos
+    if _lost_bumps and not await _forget_lost_bumps():
+        return None
+    return await _versions.get_or_set(f"{scope}:{user_id}", str(time.time_ns()), VERSION_TTL)
+
+
+async def bump_version(scope: str, *user_ids: int):
+    for user_id in user_ids:
+        key = f"{scope}:{user_id}"
+        if await _versions.incr(key, VERSION_TTL) is None:
+            _lost_bumps.add(key)
+        else:
+            _lost_bumps.discard(key)
+
+
+def bump_version_from_thread(scope: str, *user_ids: int):
+    # Para las rutas síncronas, que FastAPI ejecuta en su threadpool. Se
+    # incrementa antes de responder: si el cliente vuelve a pedir los datos
+    # justo después, ya no recibe un 304 con la copia anterior
+    anyio.from_thread.run(bump_version, scope, *user_ids)
+
+
+def _etag(request: Request, scope: str, user_id: int, version: str) -> str:
+    # La misma versión sirve para todas las variantes de la ruta (filtros,
+    # cursor...): la URL completa forma parte del ETag
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    digest = hashlib.sha1(f"{request.url.path}?{query}".encode("utf-8")).hexdigest()[:16]
+    return f'W/"{scope}.{user_id}.{version}.{digest}"'
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+
+def _encode(model: Any, value: Any) -> bytes:
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = _adapters[model] = TypeAdapter(model)
+    return adapter.dump_json(value)
+
+
+async def cached_json(
+    request: Request,
+    scope: str,
+    user_id: int,
+    model: Any,
+    build: Callable[[], Awaitable[Any]],
+    version: Optional[str] = None,
+    variant: Optional[str] = None,
+) -> Response:
+    """
+    Respuesta JSON con ETag por usuario y versión. Si el cliente ya tiene
+    la versión actual responde 304 sin llamar a `build` (ni a la DB); si
+    está activada la caché de cuerpos, tampoco se vuelve a serializar.
+    `version` permite usar una versión propia en lugar del contador y
+    `variant` añadir al contador algo más de lo que dependa la respuesta.
+    """
+    headers = {"Cache-Control": CACHE_CONTROL, "Vary": "Authorization"}
+    if version is None:
+        version = await get_version(scope, user_id)
+        if version is not None and variant is not None:
+            version = f"{version}-{variant}"
+    if version is None:
+        return Response(_encode(model, await build()), media_type="application/json", headers=headers)
+
+    etag = _etag(request, scope, user_id, version)
+    headers["ETag"] = etag
+    if _matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    body = _bodies.get(etag) if settings.http_body_cache else None
+    if body is None:
+        body = _encode(model, await build())
+        if settings.http_body_cache:
+            _bodies.set(etag, body)
+    return Response(body, media_type="application/json", headers=headers)
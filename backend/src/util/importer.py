@@ -0,0 +1,276 @@
+import asyncio
+import csv
+import re
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+from sqlmodel import Session, col, select
+
+from dto.book import ImportProgress
+from model.book import Book, UserBook
+from util.book_api import fetch_multiple_books
+from util.catalogue import dialect_insert, upsert_books
+from util.fingerprint import refresh_library_fingerprint
+from util.offload import Offload, run_inline
+from util.tags import format_tags, parse_tags, set_user_book_tags
+
+# Filas que se procesan (buscan y escriben) de una vez
+IMPORT_BATCH_SIZE = 200
+
+# Búsquedas simultáneas en Google Books y máximo de búsquedas por segundo
+LOOKUP_CONCURRENCY = 8
+LOOKUP_RATE_PER_SECOND = 20
+
+VALID_STATUSES = {"PENDING", "READING", "COMPLETED", "ABANDONED"}
+
+# Estanterías de Goodreads ("Exclusive Shelf") a nuestros estados
+GOODREADS_SHELVES = {
+    "read": "COMPLETED",
+    "currently-reading": "READING",
+    "to-read": "PENDING",
+}
+
+
+def _clean_isbn(value: Optional[str]) -> Optional[str]:
+    # Goodreads exporta los ISBN como ="0123456789"
+    cleaned = re.sub(r"[^0-9Xx]", "", value or "").upper()
+    return cleaned or None
+
+
+def _to_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _parse_row(raw: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    # Las cabeceras cambian entre Goodreads ("Title", "My Rating"...) y un
+    # CSV propio ("title", "rating"...): comparamos sin mayúsculas
+    row = {(k or "").strip().lower(): (v or "").strip() for k, v in raw.items()}
+
+    title = row.get("title")
+    if not title:
+        return None
+
+    if "exclusive shelf" in row:
+        status = GOODREADS_SHELVES.get(row["exclusive shelf"], "PENDING")
+    else:
+        status = row.get("status", "").upper()
+        status = status if status in VALID_STATUSES else "PENDING"
+
+    rating = _to_float(row.get("my rating") or row.get("rating"))
+    page_count = _to_int(row.get("number of pages") or row.get("page_count"))
+
+    return {
+        "title": title,
+        "author": row.get("author") or None,
+        "isbn": _clean_isbn(row.get("isbn13")) or _clean_isbn(row.get("isbn")),
+        "publisher": row.get("publisher") or None,
+        "page_count": page_count,
+        "status": status,
+        # Goodreads usa 0 para "sin nota"
+        "rating": rating or None,
+        "current_page": page_count if status == "COMPLETED" and page_count else 0,
+        "notes": row.get("my review") or row.get("notes") or "",
+        "tags": row.get("bookshelves") or row.get("tags") or None,
+    }
+
+
+def iter_import_rows(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Lee un export de Goodreads o un CSV propio fila a fila, sin cargar el
+    fichero entero en memoria.
+    """
+    for raw in csv.DictReader(lines):
+        row = _parse_row(raw)
+        if row:
+            yield row
+
+
+def _batches(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _LookupLimiter:
+    # Limita tanto la concurrencia como el ritmo de peticiones a Google
+    def __init__(self, concurrency: int, rate_per_second: float):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._interval = 1.0 / rate_per_second
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def __aexit__(self, *exc):
+        self._semaphore.release()
+
+
+async def _lookup(limiter: _LookupLimiter, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    async with limiter:
+        results = await fetch_multiple_books(row["title"], row["author"], max_results=1)
+
+    if results:
+        book = results[0]
+        # El ISBN del fichero manda: identifica la edición que tiene el usuario
+        if row["isbn"]:
+            book["isbn"] = row["isbn"]
+        return book
+
+    if row["isbn"]:
+        # Sin datos de Google, guardamos lo que trae el fichero
+        return {
+            "isbn": row["isbn"],
+            "title": row["title"],
+            "author": row["author"],
+            "publisher": row["publisher"],
+            "page_count": row["page_count"],
+        }
+    return None
+
+
+def _known_isbns(session: Session, batch: List[Dict[str, Any]]) -> Dict[str, int]:
+    # Deduplicar contra la maestra por ISBN con una sola consulta
+    isbns = [row["isbn"] for row in batch if row["isbn"]]
+    if not isbns:
+        return {}
+    return {
+        book.isbn: book.id
+        for book in session.exec(select(Book).where(col(Book.isbn).in_(isbns))).all()
+    }
+
+
+def _save_batch(
+    session: Session,
+    user_id: int,
+    batch: List[Dict[str, Any]],
+    known: Dict[str, int],
+    new_books: List[Dict[str, Any]],
+    progress: ImportProgress,
+):
+    for book in upsert_books(session, new_books):
+        known[book.isbn] = book.id
+
+    # Vincular al usuario los que aún no estén en su biblioteca. El índice
+    # único (user_id, book_id) descarta los que ya tiene, aunque los haya
+    # añadido mientras tanto desde otra petición
+    user_books = {}
+    now = datetime.now()
+    for row in batch:
+        book_id = known.get(row["isbn"]) if row["isbn"] else None
+        if not book_id:
+            progress.not_found += 1
+            continue
+        if book_id in user_books:
+            progress.already_in_library += 1
+            continue
+        user_books[book_id] = {
+            "user_id": user_id,
+            "book_id": book_id,
+            "status": row["status"],
+            "current_page": row["current_page"],
+            "rating": row["rating"],
+            "notes": row["notes"],
+            "tags": format_tags(parse_tags(row["tags"])),
+            "added_at": now,
+            "updated_at": now,
+        }
+
+    inserted = 0
+    if user_books:
+        statement = (
+            dialect_insert(session)(UserBook)
+            .values(list(user_books.values()))
+            .on_conflict_do_nothing(index_elements=["user_id", "book_id"])
+            .returning(UserBook.id, UserBook.book_id)
+        )
+        created = session.execute(statement).all()
+        inserted = len(created)
+        tagged = {ub_id: user_books[book_id]["tags"] for ub_id, book_id in created if user_books[book_id]["tags"]}
+        if tagged:
+            set_user_book_tags(session, user_id, tagged)
+        if inserted:
+            refresh_library_fingerprint(session, user_id)
+    session.commit()
+
+    progress.imported += inserted
+    progress.already_in_library += len(user_books) - inserted
+    progress.processed += len(batch)
+
+
+async def _import_batch(
+    session: Session,
+    user_id: int,
+    batch: List[Dict[str, Any]],
+    limiter: _LookupLimiter,
+    progress: ImportProgress,
+    offload: Offload,
+):
+    known = await offload(_known_isbns, session, batch)
+
+    # Resolver en paralelo (y con límite) los que no conocemos
+    pending = [row for row in batch if not row["isbn"] or row["isbn"] not in known]
+    resolved = await asyncio.gather(*[_lookup(limiter, row) for row in pending])
+    progress.google_lookups += len(pending)
+
+    new_books = []
+    for row, book in zip(pending, resolved):
+        if book:
+            row["isbn"] = book["isbn"]
+            new_books.append(book)
+
+    await offload(_save_batch, session, user_id, batch, known, new_books, progress)
+
+
+async def import_library(
+    session: Session,
+    user_id: int,
+    rows: Iterable[Dict[str, Any]],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    offload: Offload = run_inline,
+) -> AsyncIterator[ImportProgress]:
+    """
+    Importa filas (ver `iter_import_rows`) a la biblioteca del usuario por
+    lotes, emitiendo el progreso al terminar cada lote. Con `offload`, la
+    lectura del fichero y la base de datos no bloquean el event loop.
+    """
+    progress = ImportProgress()
+    limiter = _LookupLimiter(LOOKUP_CONCURRENCY, LOOKUP_RATE_PER_SECOND)
+    batches = _batches(rows, batch_size)
+
+    while True:
+        # Leer y parsear el CSV también es trabajo síncrono (y de disco)
+        batch = await offload(next, batches, None)
+        if batch is None:
+            break
+        try:
+            await _import_batch(session, user_id, batch, limiter, progress, offload)
+        except Exception:
+            await offload(session.rollback)
+            raise
+        yield progress
+
+    progress.done = True
+    yield progress
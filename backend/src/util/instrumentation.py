@@ -0,0 +1,181 @@
+import time
+from collections import Counter as StatementCounter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config.database import engine, read_engine
+from config.settings import settings
+from util.book_api import books_cache, google_flights
+from util.log import get_logger
+from util.metrics import (
+    CallbackMetric,
+    db_n_plus_one,
+    db_queries_per_request,
+    db_query_duration,
+    db_time_per_request,
+    http_request_duration,
+)
+from util.ratelimit import google_limiter, llm_limiter
+
+logger = get_logger("http")
+
+N_PLUS_ONE_THRESHOLD = settings.db_n_plus_one_threshold
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+class RequestStats:
+    # Consultas SQL de la petición en curso. Las rutas síncronas corren en el
+    # threadpool con una copia del contexto, así que comparten este objeto
+    __slots__ = ("queries", "db_time", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements: StatementCounter = StatementCounter()
+
+    def repeated(self) -> tuple:
+        # La consulta que más se repite y cuántas veces
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    db_query_duration.observe(elapsed, operation=operation if operation in _OPERATIONS else "OTHER")
+
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+        # El texto SQL lleva parámetros ligados: la misma consulta con otro
+        # id cuenta como repetición (el patrón típico de un N+1)
+        stats.statements[statement] += 1
+
+
+def install_sql_hooks():
+    # Sobre la clase Engine: cubre el engine principal y el de la réplica
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route_template(scope: Scope) -> str:
+    # Se etiqueta con la plantilla (/books/{book_id}), no con la ruta real,
+    # para no crear una serie por cada id
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Mide cada petición HTTP (latencia por ruta y estado, consultas SQL y
+    tiempo en la DB) y escribe una línea de log estructurada. Avisa cuando
+    una misma consulta se repite N_PLUS_ONE_THRESHOLD veces o más.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            self._record(scope, status, time.perf_counter() - start, stats)
+
+    def _record(self, scope: Scope, status: int, duration: float, stats: RequestStats):
+        route = _route_template(scope)
+        http_request_duration.observe(duration, method=scope["method"], route=route, status=status)
+        db_queries_per_request.observe(stats.queries, route=route)
+        db_time_per_request.observe(stats.db_time, route=route)
+
+        log_fields = {
+            "method": scope["method"],
+            "route": route,
+            "path": scope["path"],
+            "status": status,
+            "duration_ms": round(duration * 1000, 2),
+            "db_queries": stats.queries,
+            "db_ms": round(stats.db_time * 1000, 2),
+        }
+
+        statement, repeats = stats.repeated()
+        if repeats >= N_PLUS_ONE_THRESHOLD:
+            db_n_plus_one.inc(route=route)
+            logger.warning(
+                "posible N+1",
+                extra={**log_fields, "repeats": repeats, "statement": " ".join(statement.split())[:300]},
+            )
+
+        logger.info("request", extra=log_fields)
+
+
+def _pool_connections():
+    values = {}
+    for name, eng in (("primary", engine), ("replica", read_engine)):
+        if name == "replica" and eng is engine:
+            continue
+        pool = eng.pool
+        # SQLite usa pools sin tamaño fijo
+        if hasattr(pool, "checkedout"):
+            values[(name, "checked_out")] = pool.checkedout()
+            values[(name, "idle")] = pool.checkedin()
+    return values
+
+
+def _books_cache_counters():
+    return {(name,): value for name, value in books_cache.counters.items()}
+
+
+def _singleflight_counters():
+    return {(name,): value for name, value in google_flights.counters.items()}
+
+
+def _ratelimit_counters():
+    return {
+        (limiter.name, result): value
+        for limiter in (google_limiter, llm_limiter)
+        for result, value in limiter.counters.items()
+    }
+
+
+CallbackMetric("db_pool_connections", "Conexiones del pool por estado", ("engine", "state"), _pool_connections)
+CallbackMetric(
+    "google_books_cache_total", "Consultas a la caché de Google Books", ("result",), _books_cache_counters, kind="counter"
+)
+CallbackMetric(
+    "google_books_singleflight_total", "Búsquedas en Google Books lanzadas y agrupadas", ("result",),
+    _singleflight_counters, kind="counter",
+)
+CallbackMetric(
+    "ratelimit_decisions_total", "Llamadas permitidas y rechazadas por los limitadores", ("limiter", "result"),
+    _ratelimit_counters, kind="counter",
+)
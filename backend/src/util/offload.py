@@ -0,0 +1,10 @@
+from typing import Any, Awaitable, Callable
+
+# Cómo se ejecuta el trabajo síncrono de base de datos: en la API se manda
+# al threadpool (run_in_threadpool) para no bloquear el event loop; en el
+# worker de Celery y en los scripts basta con llamarlo directamente
+Offload = Callable[..., Awaitable[Any]]
+
+
+async def run_inline(fn, *args):
+    return fn(*args)
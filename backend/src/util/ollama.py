@@ -1,39 +1,192 @@
+import asyncio
 import json
 import re
+from typing import Optional
+
+import httpx
 import ollama
 
-def get_ai_recommendations(user_books):
-    prompt = build_prompt(user_books)
-    
-    response = ollama.chat(
-        model='llama3.2:1b', 
-        messages=[{'role': 'user', 'content': prompt}],
-        options={
-            "temperature": 0.7, # Creatividad moderada
-            "top_p": 0.9,
-            "num_predict": 500 # Evita que se enrolle demasiado
-        }
-    )
-
-    raw_content = response['message']['content']
+from config.settings import settings
+from util.log import get_logger
+from util.metrics import upstream_timer
+
+logger = get_logger(__name__)
+
+MODEL = settings.ollama_model
+# Errores de la llamada al modelo (servidor caído, error HTTP, corte a
+# mitad del streaming). Cualquier otro error no es del LLM
+LLM_ERRORS = (ollama.ResponseError, ollama.RequestError, ConnectionError, httpx.HTTPError)
+
+OPTIONS = {
+    "temperature": 0.7, # Creatividad moderada
+    "top_p": 0.9,
+    "num_predict": 500 # Evita que se enrolle demasiado
+}
+
+_client: Optional[ollama.AsyncClient] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_llm_client() -> ollama.AsyncClient:
+    # Cliente (y pool de conexiones) compartido. Sus conexiones quedan
+    # ligadas al event loop: el worker de Celery crea uno en cada asyncio.run
+    global _client, _loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _loop is not loop:
+        _client = ollama.AsyncClient()
+        _loop = loop
+    return _client
+
+async def close_llm_client():
+    global _client, _loop
+    if _client is not None:
+        # ollama.AsyncClient no tiene aclose(): se cierra el de httpx
+        await _client._client.aclose()
+        _client = None
+        _loop = None
+
+async def get_ai_recommendations_async(user_books, candidates=None):
+    # Sin bloquear el event loop mientras el modelo genera
+    prompt = build_prompt(user_books, candidates)
+
+    with upstream_timer("ollama"):
+        response = await get_llm_client().chat(
+            model=MODEL,
+            messages=[{'role': 'user', 'content': prompt}],
+            options=OPTIONS
+        )
+
+    return parse_recommendations(response['message']['content'])
+
+async def stream_ai_recommendations(user_books, candidates=None):
+    # Genera en streaming y va devolviendo cada recomendación en cuanto su
+    # objeto JSON está completo, sin esperar al final de la respuesta
+    prompt = build_prompt(user_books, candidates)
+    parser = RecommendationStreamParser()
+
+    # Se mide hasta el último trozo, no solo hasta la primera respuesta
+    with upstream_timer("ollama_stream"):
+        stream = await get_llm_client().chat(
+            model=MODEL,
+            messages=[{'role': 'user', 'content': prompt}],
+            options=OPTIONS,
+            stream=True
+        )
+
+        async for part in stream:
+            for rec in parser.feed(part['message']['content']):
+                yield rec
 
+class RecommendationStreamParser:
+    """
+    Extrae objetos completos de un array JSON que llega por trozos. Ignora
+    el texto anterior al primer '[' y los objetos que no se puedan parsear.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._in_string = False
+        self._escaped = False
+        self._depth = 0
+        self._start = 0
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        found = []
+
+        while self._pos < len(self._buffer):
+            c = self._buffer[self._pos]
+
+            if not self._in_array:
+                self._in_array = c == '['
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == '\\':
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == '{':
+                if self._depth == 0:
+                    self._start = self._pos
+                self._depth += 1
+            elif c == '}' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    rec = self._parse(self._buffer[self._start:self._pos + 1])
+                    if rec:
+                        found.append(rec)
+
+            self._pos += 1
+
+        return found
+
+    def _parse(self, text):
+        try:
+            rec = json.loads(text)
+        except ValueError as e:
+            logger.warning("error parseando IA", extra={"error": str(e)})
+            return None
+        return clean_recommendation(rec)
+
+def clean_recommendation(rec):
+    # El modelo puede devolver cualquier JSON: solo valen objetos con un
+    # título de texto. Autor y razón, si no son texto, se descartan
+    if not isinstance(rec, dict) or not isinstance(rec.get("title"), str) or not rec["title"].strip():
+        return None
+    if not isinstance(rec.get("author"), str) or not rec["author"].strip():
+        rec.pop("author", None)
+    if not isinstance(rec.get("reason"), str):
+        rec["reason"] = ""
+    return rec
+
+def parse_recommendations(raw_content):
     # Limpieza: Extraer solo lo que está entre corchetes [ ]
     try:
         json_match = re.search(r'\[.*\]', raw_content, re.DOTALL)
         if json_match:
             clean_json = json_match.group(0)
-            return json.loads(clean_json)
+            recs = json.loads(clean_json)
+            if not isinstance(recs, list):
+                return []
+            return [rec for rec in map(clean_recommendation, recs) if rec]
         return []
     except Exception as e:
-        print(f"Error parseando IA: {e}")
+        logger.warning("error parseando IA", extra={"error": str(e)})
         return []
 
-def build_prompt(user_books):
+# Solo los libros con buena nota entran en el prompt
+PROMPT_MIN_RATING = 4
+
+def prompt_book_lines(user_books):
     # Formateamos solo libros con buena nota para no contaminar el gusto
-    books_data = "\n".join([
-        f"- {b.title} por {b.author}. Género: {b.category}. Mi nota: {b.rating}/5. Notas: {b.notes}"
-        for b in user_books if b.rating >= 4
-    ])
+    # `user_books` son UserBook con su `book` ya cargado (nota y notas son
+    # del usuario, título/autor/género del libro)
+    return [
+        f"- {ub.book.title} por {ub.book.author}. Género: {ub.book.category}. Mi nota: {ub.rating}/5. Notas: {ub.notes}"
+        for ub in user_books if (ub.rating or 0) >= PROMPT_MIN_RATING
+    ]
+
+def prompt_candidate_lines(candidates):
+    # Candidatos del catálogo (util.similarity) parecidos a sus favoritos
+    return [
+        f"- {c.title} por {c.author}. Género: {c.category}. Parecido a: {c.because_title}"
+        for c in candidates or []
+    ]
+
+def build_prompt(user_books, candidates=None):
+    books_data = "\n".join(prompt_book_lines(user_books))
+    candidates_data = "\n".join(prompt_candidate_lines(candidates))
+    if candidates_data:
+        candidates_data = f"""
+<CANDIDATES>
+Libros de nuestro catálogo que se parecen a los que más le gustan. Elige entre ellos salvo que conozcas uno claramente mejor:
+{candidates_data}
+</CANDIDATES>
+"""
 
     return f"""
 <SYSTEM>
@@ -47,7 +200,7 @@ Reglas estrictas:
 <USER_LIBRARY>
 {books_data}
 </USER_LIBRARY>
-
+{candidates_data}
 <FORMAT_EXAMPLE>
 [
   {{
@@ -60,6 +213,6 @@ Reglas estrictas:
 
 Responde estrictamente en formato JSON:
 [
-  {"title": "...", "author": "...", "reason": "..."}
+  {{"title": "...", "author": "...", "reason": "..."}}
 ]
 """
\ No newline at end of file
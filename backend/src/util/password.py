@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+from config.settings import settings
+
+# Coste de bcrypt para hashes nuevos. Si se cambia, los hashes antiguos se
+# rehacen con el nuevo coste la próxima vez que el usuario inicia sesión
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+
+# bcrypt es CPU puro: lo sacamos del event loop a un pool de procesos (uno
+# por núcleo) en lugar de ocupar el threadpool de la API
+HASH_WORKERS = os.cpu_count() or 1
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def _prepare_password(password: str) -> bytes:
+    """
+    1. Aplica SHA-256 para tener longitud fija (64 chars).
+    2. Codifica a bytes para bcrypt.
+    """
+    pw_hash = hashlib.sha256(password.encode("utf-8")).hexdigest()
+    return pw_hash.encode("utf-8")
+
+def get_password_hash(password: str, rounds: Optional[int] = None) -> str:
+    # Generar sal y hashear
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
+    hashed = bcrypt.hashpw(_prepare_password(password), salt)
+    return hashed.decode("utf-8") # Guardamos como string en la DB
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    # Comparar la contraseña plana con la de la DB
+    return bcrypt.checkpw(
+        _prepare_password(plain_password), 
+        hashed_password.encode("utf-8")
+    )
+
+def needs_rehash(hashed_password: str) -> bool:
+    # Formato: $2b$<coste>$<sal+hash>
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: los procesos hijos solo importan este módulo, sin heredar
+        # hilos ni conexiones del proceso de la API
+        _executor = ProcessPoolExecutor(
+            max_workers=HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), get_password_hash, password, BCRYPT_ROUNDS)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), verify_password, plain_password, hashed_password)
@@ -0,0 +1,290 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, case, tuple_, update
+from sqlmodel import Session, col, select
+
+from config.database import SessionLocal
+from config.settings import settings
+from model.book import Book, UserBook
+from util.cache import TTLCache
+from util.http_cache import LIBRARY, bump_version
+from util.log import get_logger
+from util.metrics import progress_updates
+from util.reading_stats import ProgressEvent, is_finish, record_events
+
+logger = get_logger(__name__)
+
+FLUSH_INTERVAL = settings.progress_flush_interval
+MAX_PENDING = settings.progress_buffer_max
+# Filas por sentencia UPDATE (SQLite limita el número de parámetros)
+FLUSH_CHUNK_SIZE = 300
+
+# (usuario, libro) -> UserBook y páginas del libro. Cambian muy poco; al
+# quitar un libro de la biblioteca se borra la entrada (ver forget_target),
+# pero solo en el proceso que atiende el DELETE: los demás lo descubren al
+# volcar (ver _resolve_moved)
+TARGETS_CACHE_SIZE = 50_000
+TARGETS_CACHE_TTL = 60 * 5
+
+
+class ProgressTarget(NamedTuple):
+    user_book_id: int
+    page_count: Optional[int]
+
+
+class PendingProgress(NamedTuple):
+    user_id: int
+    book_id: int
+    current_page: int
+    # Se acumulan al agrupar actualizaciones del mismo libro
+    seconds_read: int
+    received_at: datetime
+
+
+_targets = TTLCache(maxsize=TARGETS_CACHE_SIZE, ttl=TARGETS_CACHE_TTL)
+
+
+def compute_progress(current_page: int, page_count: Optional[int]) -> float:
+    # Mismo cálculo que UserBook.progress
+    if page_count:
+        return (current_page / page_count) * 100
+    return 0.0
+
+
+def load_targets(session: Session, user_id: int, book_ids: Iterable[int]) -> Dict[int, ProgressTarget]:
+    """
+    UserBook y número de páginas de los libros del usuario, por book_id. Los
+    que no están en su biblioteca no aparecen. Solo consulta los que no están
+    en caché.
+    """
+    found: Dict[int, ProgressTarget] = {}
+    missing = []
+    for book_id in set(book_ids):
+        target = _targets.get((user_id, book_id))
+        if target is None:
+            missing.append(book_id)
+        else:
+            found[book_id] = target
+
+    if missing:
+        rows = session.exec(
+            select(UserBook.id, UserBook.book_id, Book.page_count)
+            .join(Book, Book.id == UserBook.book_id)
+            .where(UserBook.user_id == user_id, col(UserBook.book_id).in_(missing))
+        ).all()
+        for user_book_id, book_id, page_count in rows:
+            found[book_id] = ProgressTarget(user_book_id, page_count)
+            _targets.set((user_id, book_id), found[book_id])
+    return found
+
+
+def forget_target(user_id: int, book_id: int):
+    # Si el libro se vuelve a añadir tendrá otro UserBook
+    _targets.delete((user_id, book_id))
+
+
+def _lock_rows(session: Session, user_book_ids: List[int]):
+    # Página anterior de cada fila (bloqueadas hasta el commit) para saber
+    # cuántas páginas suma cada evento
+    return session.exec(
+        select(
+            UserBook.id,
+            UserBook.book_id,
+            UserBook.current_page,
+            UserBook.status,
+            UserBook.updated_at,
+            Book.category,
+            Book.page_count,
+        )
+        .join(Book, Book.id == UserBook.book_id)
+        .where(col(UserBook.id).in_(user_book_ids))
+        .with_for_update(of=UserBook)
+    ).all()
+
+
+def _resolve_moved(session: Session, gone: Dict[int, PendingProgress]) -> Dict[int, PendingProgress]:
+    """
+    Progreso apuntado a UserBooks que ya no existen: la caché de este
+    proceso tenía el id de antes de quitar el libro (en otro proceso). Se
+    busca el UserBook actual por (usuario, libro) y se quita el viejo de la
+    caché; si el libro ya no está en la biblioteca, se descarta.
+    """
+    for p in gone.values():
+        forget_target(p.user_id, p.book_id)
+    rows = session.exec(
+        select(UserBook.id, UserBook.user_id, UserBook.book_id).where(
+            tuple_(UserBook.user_id, UserBook.book_id).in_([(p.user_id, p.book_id) for p in gone.values()])
+        )
+    ).all()
+    current = {(row.user_id, row.book_id): row.id for row in rows}
+    moved: Dict[int, PendingProgress] = {}
+    for p in gone.values():
+        user_book_id = current.get((p.user_id, p.book_id))
+        if user_book_id is None:
+            progress_updates.inc(result="dropped")
+        else:
+            moved[user_book_id] = p
+    return moved
+
+
+def write_progress(session: Session, pending: Dict[int, PendingProgress]) -> int:
+    """
+    Aplica el progreso pendiente con un UPDATE por bloque (CASE sobre el id
+    de UserBook) y registra los eventos de lectura. Solo escribe las filas
+    que no se han modificado después de recibir la actualización, así una
+    escritura vieja (de otro proceso o anterior a un PUT) no pisa una más
+    nueva. El progreso de un UserBook que ya no existe va al actual del
+    mismo libro, si lo hay. Devuelve las filas escritas.
+    """
+    written = 0
+    events: List[ProgressEvent] = []
+    items = list(pending.items())
+    for start in range(0, len(items), FLUSH_CHUNK_SIZE):
+        chunk = dict(items[start:start + FLUSH_CHUNK_SIZE])
+        current = list(_lock_rows(session, list(chunk)))
+        locked = {row.id for row in current}
+        gone = set(chunk) - locked
+        if gone:
+            moved = _resolve_moved(session, {ub_id: chunk.pop(ub_id) for ub_id in gone})
+            for ub_id, p in moved.items():
+                # Si ya hay progreso con el id nuevo, se queda el más reciente
+                if ub_id not in chunk or chunk[ub_id].received_at < p.received_at:
+                    chunk[ub_id] = p
+            unlocked = [ub_id for ub_id in moved if ub_id not in locked]
+            if unlocked:
+                current += _lock_rows(session, unlocked)
+        chunk = {
+            row.id: chunk[row.id] for row in current if row.updated_at <= chunk[row.id].received_at
+        }
+        if not chunk:
+            continue
+        for row in current:
+            if row.id in chunk:
+                p = chunk[row.id]
+                from_page = row.current_page or 0
+                events.append(ProgressEvent(
+                    user_id=p.user_id,
+                    book_id=row.book_id,
+                    category=row.category,
+                    from_page=from_page,
+                    to_page=p.current_page,
+                    seconds_read=p.seconds_read,
+                    # Llegar a la última página cuenta como libro terminado
+                    finished=is_finish(from_page, p.current_page, row.page_count, row.status, row.status),
+                    created_at=p.received_at,
+                ))
+
+        page = case({ub_id: p.current_page for ub_id, p in chunk.items()}, value=UserBook.id)
+        received_at = case({ub_id: p.received_at for ub_id, p in chunk.items()}, value=UserBook.id)
+        statement = (
+            update(UserBook)
+            .where(col(UserBook.id).in_(list(chunk)), UserBook.updated_at <= received_at)
+            .values(
+                current_page=page,
+                # Empezar a leer un libro pendiente lo pasa a "leyendo"
+                status=case((and_(UserBook.status == "PENDING", page > 0), "READING"), else_=UserBook.status),
+                updated_at=received_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        written += session.execute(statement).rowcount
+    record_events(session, events)
+    session.commit()
+    return written
+
+
+class ProgressBuffer:
+    """
+    Buffer write-behind del progreso de lectura. Las actualizaciones del
+    mismo UserBook que llegan entre dos volcados se quedan en una (la
+    última) y cada volcado es un único UPDATE por bloque. Se vuelca cada
+    FLUSH_INTERVAL segundos, antes si hay MAX_PENDING pendientes, y al
+    parar la app. Lo pendiente de un proceso que muere sin parar se pierde.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, PendingProgress] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(
+        self,
+        user_book_id: int,
+        user_id: int,
+        book_id: int,
+        current_page: int,
+        seconds_read: int,
+        received_at: datetime,
+    ):
+        previous = self._pending.get(user_book_id)
+        if previous is not None:
+            progress_updates.inc(result="coalesced")
+            seconds_read += previous.seconds_read
+        else:
+            progress_updates.inc(result="buffered")
+        self._pending[user_book_id] = PendingProgress(user_id, book_id, current_page, seconds_read, received_at)
+        if len(self._pending) >= MAX_PENDING and self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        try:
+            written = await run_in_threadpool(self._write, pending)
+        except Exception as e:
+            logger.warning("error volcando el progreso de lectura", extra={"rows": len(pending), "error": str(e)})
+            self._requeue(pending)
+            return 0
+
+        progress_updates.inc(written, result="written")
+        await bump_version(LIBRARY, *{p.user_id for p in pending.values()})
+        return written
+
+    def _write(self, pending: Dict[int, PendingProgress]) -> int:
+        with SessionLocal() as session:
+            return write_progress(session, pending)
+
+    def _requeue(self, pending: Dict[int, PendingProgress]):
+        # Se reintenta en el siguiente volcado salvo lo que ya tenga una
+        # actualización más nueva
+        for user_book_id, progress in pending.items():
+            current = self._pending.get(user_book_id)
+            if current is None:
+                self._pending[user_book_id] = progress
+            else:
+                self._pending[user_book_id] = current._replace(
+                    seconds_read=current.seconds_read + progress.seconds_read
+                )
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+progress_buffer = ProgressBuffer()
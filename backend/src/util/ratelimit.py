@@ -0,0 +1,134 @@
+import math
+import time
+from contextlib import asynccontextmanager, nullcontext
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from config.settings import settings
+from util.cache import TTLCache
+
+# Retry-After cuando se rechaza por llamadas en curso y no por ritmo
+BUSY_RETRY_AFTER = 5
+
+
+class RateLimited(HTTPException):
+    # 429 inmediato en lugar de dejar la petición esperando en cola
+    def __init__(self, retry_after: float):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=429,
+            detail="Demasiadas peticiones, inténtalo de nuevo más tarde.",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        # Consume un token y devuelve 0, o los segundos hasta que haya uno
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class RateLimiter:
+    """
+    Límite de llamadas a un servicio externo: un token bucket global, uno
+    por usuario y, opcionalmente, un máximo de llamadas en curso. Los
+    contadores son por proceso.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        per_minute: float,
+        burst: int,
+        user_per_minute: float,
+        user_burst: int,
+        max_in_flight: Optional[int] = None,
+    ):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._global = TokenBucket(per_minute, burst)
+        self._user_per_minute = user_per_minute
+        self._user_burst = user_burst
+        # Un bucket que no se toca en el tiempo que tarda en llenarse está
+        # lleno: se puede olvidar
+        self._users = TTLCache(maxsize=10_000, ttl=max(60, user_burst * 60 / user_per_minute))
+        self.counters: Dict[str, int] = {"allowed": 0, "limited": 0}
+
+    def _user_bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self._user_per_minute, self._user_burst)
+        self._users.set(user_id, bucket)
+        return bucket
+
+    def check(self, user_id: Optional[int] = None):
+        # Consume un token global y uno del usuario, o lanza RateLimited
+        wait = self._global.take()
+        if not wait and user_id is not None:
+            wait = self._user_bucket(user_id).take()
+            if wait:
+                self._global.give_back()
+        if wait:
+            self.counters["limited"] += 1
+            raise RateLimited(wait)
+        self.counters["allowed"] += 1
+
+    def check_user(self, user_id: int):
+        # Solo el cupo del usuario: antes de unirse a una llamada agrupada,
+        # cuyo cupo global consume la llamada real
+        wait = self._user_bucket(user_id).take()
+        if wait:
+            self.counters["limited"] += 1
+            raise RateLimited(wait)
+
+    @asynccontextmanager
+    async def acquire(self, user_id: Optional[int] = None):
+        if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+            self.counters["limited"] += 1
+            raise RateLimited(BUSY_RETRY_AFTER)
+        self.check(user_id)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+
+def limit(limiter: Optional[RateLimiter], user_id: Optional[int] = None):
+    # Sin limitador (worker, importador) no se aplica ningún límite
+    return limiter.acquire(user_id) if limiter is not None else nullcontext()
+
+
+google_limiter = RateLimiter(
+    "google_books",
+    per_minute=settings.google_requests_per_minute,
+    burst=settings.google_burst,
+    user_per_minute=settings.google_user_requests_per_minute,
+    user_burst=settings.google_user_burst,
+)
+
+llm_limiter = RateLimiter(
+    "llm",
+    per_minute=settings.llm_requests_per_minute,
+    burst=settings.llm_burst,
+    user_per_minute=settings.llm_user_requests_per_minute,
+    user_burst=settings.llm_user_burst,
+    max_in_flight=settings.llm_max_in_flight,
+)
@@ -0,0 +1,169 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlmodel import Session, col, select
+
+from dto.stats import CategoryStats, DailyStats, MonthlyStats, ReadingStats
+from model.reading import ReadingCategoryStats, ReadingDailyStats, ReadingEvent
+from util.catalogue import dialect_insert
+
+UNCATEGORIZED = "General"
+# Estado de un libro terminado (el mismo que usan el frontend y el importador)
+COMPLETED = "COMPLETED"
+
+
+class ProgressEvent(NamedTuple):
+    user_id: int
+    book_id: int
+    category: Optional[str]
+    from_page: int
+    to_page: int
+    seconds_read: int
+    finished: bool
+    created_at: datetime
+
+
+def is_finish(
+    from_page: int,
+    to_page: int,
+    page_count: Optional[int],
+    from_status: str,
+    to_status: str,
+) -> bool:
+    """
+    Si el cambio termina el libro: llegar a la última página o marcarlo como
+    COMPLETED, lo que ocurra primero. Así no se cuenta dos veces quien lee
+    hasta el final y después lo marca como terminado.
+    """
+    if from_status == COMPLETED or (page_count and from_page >= page_count):
+        return False
+    return to_status == COMPLETED or bool(page_count and to_page >= page_count)
+
+
+def primary_category(category: Optional[str]) -> str:
+    # Google Books devuelve varias separadas por comas; cuenta la primera
+    first = (category or "").split(",")[0].strip()
+    return first or UNCATEGORIZED
+
+
+def _upsert_added(session: Session, model, keys: List[str], rows: List[dict]):
+    # INSERT ... ON CONFLICT DO UPDATE sumando a lo que ya hubiera
+    if not rows:
+        return
+    statement = dialect_insert(session)(model).values(rows)
+    counters = [c for c in rows[0] if c not in keys]
+    statement = statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={c: getattr(model, c) + getattr(statement.excluded, c) for c in counters},
+    )
+    session.execute(statement)
+
+
+def record_events(session: Session, events: List[ProgressEvent]):
+    """
+    Guarda los eventos de lectura y suma sus páginas, tiempo y libros
+    terminados a los agregados diarios (por día y por categoría). No hace
+    commit: va en la misma transacción que el cambio en UserBook.
+    """
+    events = [
+        e for e in events
+        if e.to_page != e.from_page or e.seconds_read or e.finished
+    ]
+    if not events:
+        return
+
+    daily: Dict[Tuple[int, date], Dict[str, int]] = defaultdict(lambda: {"pages_read": 0, "seconds_read": 0, "books_finished": 0})
+    by_category: Dict[Tuple[int, date, str], Dict[str, int]] = defaultdict(lambda: {"pages_read": 0, "seconds_read": 0})
+    event_rows = []
+    for e in events:
+        pages = max(0, e.to_page - e.from_page)
+        event_rows.append({
+            "user_id": e.user_id,
+            "book_id": e.book_id,
+            "from_page": e.from_page,
+            "to_page": e.to_page,
+            "pages_read": pages,
+            "seconds_read": e.seconds_read,
+            "finished": e.finished,
+            "created_at": e.created_at,
+        })
+
+        day = e.created_at.date()
+        totals = daily[(e.user_id, day)]
+        totals["pages_read"] += pages
+        totals["seconds_read"] += e.seconds_read
+        totals["books_finished"] += int(e.finished)
+        if pages or e.seconds_read:
+            category_totals = by_category[(e.user_id, day, primary_category(e.category))]
+            category_totals["pages_read"] += pages
+            category_totals["seconds_read"] += e.seconds_read
+
+    session.execute(insert(ReadingEvent), event_rows)
+    _upsert_added(
+        session,
+        ReadingDailyStats,
+        ["user_id", "day"],
+        [{"user_id": user_id, "day": day, **totals} for (user_id, day), totals in daily.items()],
+    )
+    _upsert_added(
+        session,
+        ReadingCategoryStats,
+        ["user_id", "day", "category"],
+        [
+            {"user_id": user_id, "day": day, "category": category, **totals}
+            for (user_id, day, category), totals in by_category.items()
+        ],
+    )
+
+
+def reading_stats(session: Session, user_id: int, days: int, today: Optional[date] = None) -> ReadingStats:
+    """
+    Estadísticas de los últimos `days` días leyendo solo los agregados: el
+    coste depende de los días pedidos, no del histórico del usuario.
+    """
+    today = today or date.today()
+    since = today - timedelta(days=days - 1)
+
+    daily_rows = session.exec(
+        select(ReadingDailyStats)
+        .where(ReadingDailyStats.user_id == user_id, col(ReadingDailyStats.day) >= since)
+        .order_by(ReadingDailyStats.day)
+    ).all()
+    category_rows = session.exec(
+        select(ReadingCategoryStats)
+        .where(ReadingCategoryStats.user_id == user_id, col(ReadingCategoryStats.day) >= since)
+    ).all()
+
+    months: Dict[str, MonthlyStats] = {}
+    for row in daily_rows:
+        key = row.day.strftime("%Y-%m")
+        month = months.setdefault(key, MonthlyStats(month=key))
+        month.pages_read += row.pages_read
+        month.seconds_read += row.seconds_read
+        month.books_finished += row.books_finished
+
+    categories: Dict[str, CategoryStats] = {}
+    for row in category_rows:
+        category = categories.setdefault(row.category, CategoryStats(category=row.category))
+        category.pages_read += row.pages_read
+        category.seconds_read += row.seconds_read
+
+    return ReadingStats(
+        since=since,
+        days=[
+            DailyStats(
+                day=row.day,
+                pages_read=row.pages_read,
+                seconds_read=row.seconds_read,
+                books_finished=row.books_finished,
+            )
+            for row in daily_rows
+        ],
+        months=list(months.values()),
+        categories=sorted(categories.values(), key=lambda c: (-c.seconds_read, -c.pages_read)),
+        pages_read=sum(row.pages_read for row in daily_rows),
+        seconds_read=sum(row.seconds_read for row in daily_rows),
+        books_finished=sum(row.books_finished for row in daily_rows),
+    )
@@ -0,0 +1,386 @@
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import httpx
+from sqlalchemy import insert, update
+from sqlalchemy.orm import contains_eager
+from sqlmodel import Session, col, select
+
+from config.settings import settings
+from model.book import Book, UserBook
+from model.recommendation import Recommendation, RecommendationBatch
+from model.user import User
+from util.book_api import fetch_books_batch
+from util.catalogue import upsert_books
+from util.fingerprint import library_fingerprint
+from util.log import get_logger
+from util.offload import Offload, run_inline
+from util.ollama import LLM_ERRORS, PROMPT_MIN_RATING, get_ai_recommendations_async, stream_ai_recommendations
+from util.ratelimit import RateLimiter, limit
+from util.search import find_best_match
+from util.similarity import Candidate, similarity_engine
+from util.text import normalize_text
+
+logger = get_logger(__name__)
+
+# Recomendaciones que se sirven directamente de los candidatos cuando el
+# LLM no responde (las mismas que se le piden en el prompt)
+FALLBACK_RECOMMENDATIONS = 3
+
+def load_user_library(session: Session, user_id: int) -> List[UserBook]:
+    # UserBook + Book en una sola consulta (el prompt usa datos de ambos)
+    return list(session.exec(
+        select(UserBook)
+        .join(Book, Book.id == UserBook.book_id)
+        .options(contains_eager(UserBook.book))
+        .where(UserBook.user_id == user_id)
+    ).all())
+
+
+def load_rated_libraries(session: Session, user_ids: List[int]) -> Dict[int, List[UserBook]]:
+    # Libros bien valorados (los únicos que ve el prompt) de varios usuarios
+    # en una sola consulta, agrupados por usuario. Quien no tiene ninguno
+    # no aparece en el resultado
+    libraries: Dict[int, List[UserBook]] = {}
+    if not user_ids:
+        return libraries
+
+    user_books = session.exec(
+        select(UserBook)
+        .join(Book, Book.id == UserBook.book_id)
+        .options(contains_eager(UserBook.book))
+        .where(col(UserBook.user_id).in_(user_ids), UserBook.rating >= PROMPT_MIN_RATING)
+        .order_by(UserBook.user_id)
+    ).all()
+    for user_book in user_books:
+        libraries.setdefault(user_book.user_id, []).append(user_book)
+    return libraries
+
+
+def load_owned_book_ids(session: Session, user_ids: List[int]) -> Dict[int, Set[int]]:
+    # Todos los libros de la biblioteca de varios usuarios (load_rated_libraries
+    # solo trae los bien valorados), para no recomendarles ninguno
+    owned: Dict[int, Set[int]] = {}
+    if not user_ids:
+        return owned
+    rows = session.exec(select(UserBook.user_id, UserBook.book_id).where(col(UserBook.user_id).in_(user_ids))).all()
+    for user_id, book_id in rows:
+        owned.setdefault(user_id, set()).add(book_id)
+    return owned
+
+
+def find_candidates(user_books: List[UserBook], owned: Optional[Set[int]] = None) -> List[Candidate]:
+    # Puede construir el índice si aún no existe: en la API, vía offload
+    return similarity_engine.candidates(user_books, settings.similarity_candidates, owned)
+
+
+def candidate_recommendations(candidates: List[Candidate]) -> List[Dict[str, Any]]:
+    # Recomendaciones sin LLM: los mejores candidatos con una razón sencilla
+    recs = []
+    for c in candidates[:FALLBACK_RECOMMENDATIONS]:
+        if c.because_rating:
+            reason = f"Se parece a «{c.because_title}», que valoraste con un {c.because_rating:g}/5."
+        else:
+            reason = f"Se parece a «{c.because_title}», de tu biblioteca."
+        recs.append({"title": c.title, "author": c.author, "reason": reason, "book_id": c.book_id})
+    return recs
+
+
+def prepare_recommendations(
+    raw_recs: List[Dict[str, Any]],
+    candidates: List[Candidate],
+    user_books: List[UserBook],
+) -> List[Dict[str, Any]]:
+    """
+    Quita las recomendaciones de libros que el usuario ya tiene y marca con
+    `book_id` las que son candidatos (ya sabemos qué libro de la maestra es:
+    no hace falta buscarlo).
+    """
+    owned = {normalize_text(ub.book.title) for ub in user_books if ub.book}
+    by_title = {normalize_text(c.title): c.book_id for c in candidates}
+    prepared = []
+    for rec in raw_recs:
+        title = normalize_text(rec.get("title"))
+        if not title or title in owned:
+            continue
+        if title in by_title:
+            rec.setdefault("book_id", by_title[title])
+        prepared.append(rec)
+    return prepared
+
+
+async def llm_or_candidates(
+    user_books: List[UserBook],
+    candidates: List[Candidate],
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Recomendaciones del LLM (con los candidatos en el prompt) o, si falla o
+    no devuelve nada, de los candidatos directamente. El segundo valor dice
+    si vienen del LLM.
+    """
+    try:
+        raw_recs = await get_ai_recommendations_async(user_books, candidates)
+    except LLM_ERRORS as e:
+        logger.warning("error llamando al LLM", extra={"error": str(e)})
+        raw_recs = []
+
+    raw_recs = prepare_recommendations(raw_recs, candidates, user_books)
+    if raw_recs or not candidates:
+        return raw_recs, True
+    logger.info("recomendaciones sin LLM", extra={"candidates": len(candidates)})
+    return candidate_recommendations(candidates), False
+
+
+def latest_recommendations(session: Session, user_id: int) -> List[Recommendation]:
+    # La última tanda a través del puntero del usuario: una sola consulta
+    # por índice (recommendation.batch_id)
+    return list(session.exec(
+        select(Recommendation)
+        .join(User, User.latest_batch_id == Recommendation.batch_id)
+        .where(User.id == user_id)
+        .order_by(Recommendation.id)
+    ).all())
+
+
+def _find_local_books(session: Session, raw_recs: List[Dict[str, Any]]) -> List[Optional[Book]]:
+    # Las que vienen de un candidato ya traen su book_id: una sola consulta
+    # para todas; el resto se busca por título y autor
+    ids = [rec["book_id"] for rec in raw_recs if rec.get("book_id")]
+    by_id = {book.id: book for book in session.exec(select(Book).where(col(Book.id).in_(ids))).all()} if ids else {}
+    return [
+        by_id.get(rec.get("book_id")) or find_best_match(session, rec["title"], rec.get("author"))
+        for rec in raw_recs
+    ]
+
+
+def _import_found_books(
+    session: Session,
+    local_books: List[Optional[Book]],
+    found: Dict[int, Dict[str, Any]],
+) -> List[Optional[Book]]:
+    # Los guardamos en la maestra (un único upsert) para que otros usuarios
+    # los aprovechen
+    imported = {book.isbn: book for book in upsert_books(session, list(found.values()))}
+    books = list(local_books)
+    for i, book_data in found.items():
+        # Sin ISBN no se guarda, pero aprovechamos portada y enlace
+        books[i] = imported.get(book_data.get("isbn")) or Book(**book_data)
+    return books
+
+
+async def enrich_recommendations(
+    session: Session,
+    raw_recs: List[Dict[str, Any]],
+    offload: Offload,
+    client: Optional[httpx.AsyncClient] = None,
+) -> List[Optional[Book]]:
+    """
+    Busca cada recomendación en la DB maestra y, las que falten, en Google
+    Books (todas en paralelo). Devuelve un Book (o None) por recomendación.
+    """
+    local_books = await offload(_find_local_books, session, raw_recs)
+
+    missing = [i for i, book_db in enumerate(local_books) if not book_db]
+    google_results = await fetch_books_batch(
+        [(raw_recs[i]["title"], raw_recs[i].get("author", "")) for i in missing],
+        max_results=1,
+        client=client,
+    )
+
+    found = {i: results[0] for i, results in zip(missing, google_results) if results}
+    for i in missing:
+        if i not in found:
+            # Si Google tampoco lo encuentra, usamos solo los datos de la IA
+            logger.info("recomendación sin info extra", extra={"title": raw_recs[i]["title"]})
+
+    if not found:
+        return local_books
+    return await offload(_import_found_books, session, local_books, found)
+
+
+def build_recommendation_rows(
+    user_id: int,
+    raw_recs: List[Dict[str, Any]],
+    books: List[Optional[Book]],
+    created_at: datetime,
+) -> List[Recommendation]:
+    # Usamos los datos de la DB si los encontramos, si no, los de la IA.
+    # Todas las recomendaciones de la tanda comparten fecha de creación
+    return [
+        Recommendation(
+            user_id=user_id,
+            title=rec["title"],
+            author=rec.get("author", "Autor desconocido"),
+            reason=rec.get("reason") or "",
+            image_url=book_db.image_url if book_db else None,
+            external_link=book_db.external_link if book_db else None,
+            created_at=created_at,
+        )
+        for rec, book_db in zip(raw_recs, books)
+    ]
+
+
+def save_batches(
+    session: Session,
+    recs_by_user: Dict[int, List[Recommendation]],
+    created_at: datetime,
+) -> Dict[int, List[Recommendation]]:
+    """
+    Guarda una tanda por usuario: un INSERT para las tandas, otro para
+    todas las recomendaciones y un UPDATE para los punteros
+    `latest_batch_id`. No hace commit.
+    """
+    recs_by_user = {user_id: recs for user_id, recs in recs_by_user.items() if recs}
+    if not recs_by_user:
+        return {}
+
+    batch_ids = dict(session.execute(
+        insert(RecommendationBatch).returning(RecommendationBatch.user_id, RecommendationBatch.id),
+        [{"user_id": user_id, "created_at": created_at} for user_id in recs_by_user],
+    ).all())
+
+    saved = session.scalars(
+        insert(Recommendation).returning(Recommendation),
+        [
+            {**rec.model_dump(exclude={"id", "batch_id"}), "batch_id": batch_ids[user_id]}
+            for user_id, recs in recs_by_user.items()
+            for rec in recs
+        ],
+    ).all()
+
+    session.execute(
+        update(User),
+        [{"id": user_id, "latest_batch_id": batch_id} for user_id, batch_id in batch_ids.items()],
+    )
+
+    result: Dict[int, List[Recommendation]] = {}
+    for rec in saved:
+        result.setdefault(rec.user_id, []).append(rec)
+    return result
+
+
+def _save(session: Session, user: User, recs: List[Recommendation], fingerprint: Optional[str], from_llm: bool):
+    try:
+        saved = save_batches(session, {user.id: recs}, recs[0].created_at).get(user.id, [])
+        user.library_fingerprint = fingerprint
+        # Sin LLM la tanda no cuenta como hecha para esta biblioteca: la
+        # siguiente vez (o el worker) se vuelve a intentar con el LLM
+        user.recommendations_fingerprint = fingerprint if from_llm else None
+        session.add(user)
+        # El RETURNING ya trae todas las columnas: fuera de la sesión el
+        # commit no las caduca y no hace falta un refresh por fila
+        for r in saved:
+            session.expunge(r)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return saved
+
+
+async def generate_for_user(
+    session: Session,
+    user: User,
+    force: bool = False,
+    offload: Offload = run_inline,
+    client: Optional[httpx.AsyncClient] = None,
+    created_at: Optional[datetime] = None,
+    limiter: Optional[RateLimiter] = None,
+) -> Optional[List[Recommendation]]:
+    """
+    Pipeline completo de recomendaciones de un usuario: biblioteca → LLM →
+    enriquecimiento → guardado. Devuelve None si el usuario no tiene libros.
+    Con `limiter`, la llamada al LLM puede lanzar RateLimited.
+    """
+    user_books = await offload(load_user_library, session, user.id)
+    if not user_books:
+        return None
+
+    # Si lo que ve el LLM no ha cambiado desde la última tanda, devolvemos
+    # las recomendaciones guardadas sin volver a llamarlo
+    fingerprint = library_fingerprint(user_books)
+    if not force and fingerprint and fingerprint == user.recommendations_fingerprint:
+        latest = await offload(latest_recommendations, session, user.id)
+        if latest:
+            return latest
+
+    candidates = await offload(find_candidates, user_books)
+    async with limit(limiter, user.id):
+        raw_recs, from_llm = await llm_or_candidates(user_books, candidates)
+    if not raw_recs:
+        return []
+
+    books = await enrich_recommendations(session, raw_recs, offload, client=client)
+    recs = build_recommendation_rows(user.id, raw_recs, books, created_at or datetime.utcnow())
+    return await offload(_save, session, user, recs, fingerprint, from_llm)
+
+
+# Lo que lleva cada evento `recommendation` del streaming, tanto si se
+# acaba de generar como si se repite la última tanda guardada
+PREVIEW_FIELDS = {"title", "author", "reason", "image_url", "external_link"}
+
+
+def _recommendation_preview(rec: Dict[str, Any], book_db: Optional[Book]) -> Dict[str, Any]:
+    return {
+        "title": rec["title"],
+        "author": rec.get("author", "Autor desconocido"),
+        "reason": rec.get("reason") or "",
+        "image_url": book_db.image_url if book_db else None,
+        "external_link": book_db.external_link if book_db else None,
+    }
+
+
+async def stream_for_user(
+    session: Session,
+    user: User,
+    force: bool = False,
+    offload: Offload = run_inline,
+    limiter: Optional[RateLimiter] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Igual que `generate_for_user`, pero emite cada recomendación enriquecida
+    en cuanto el modelo termina de escribirla: ("recommendation", dict) por
+    cada una y ("done", [Recommendation]) al guardar la tanda.
+    """
+    user_books = await offload(load_user_library, session, user.id)
+    if not user_books:
+        yield "error", {"detail": "No tienes suficientes libros para generar recomendaciones."}
+        return
+
+    fingerprint = library_fingerprint(user_books)
+    if not force and fingerprint and fingerprint == user.recommendations_fingerprint:
+        latest = await offload(latest_recommendations, session, user.id)
+        if latest:
+            for rec in latest:
+                yield "recommendation", rec.model_dump(mode="json", include=PREVIEW_FIELDS)
+            yield "done", latest
+            return
+
+    candidates = await offload(find_candidates, user_books)
+    raw_recs, books = [], []
+    async with limit(limiter, user.id):
+        try:
+            async for rec in stream_ai_recommendations(user_books, candidates):
+                if not prepare_recommendations([rec], candidates, user_books):
+                    continue
+                book_db = (await enrich_recommendations(session, [rec], offload))[0]
+                raw_recs.append(rec)
+                books.append(book_db)
+                yield "recommendation", _recommendation_preview(rec, book_db)
+        except LLM_ERRORS as e:
+            # Lo que ya se ha emitido se guarda; si no hay nada, candidatos.
+            # Los errores de la base de datos al enriquecer no se tapan
+            logger.warning("error llamando al LLM", extra={"error": str(e)})
+
+    from_llm = bool(raw_recs) or not candidates
+    if not from_llm:
+        logger.info("recomendaciones sin LLM", extra={"candidates": len(candidates)})
+        raw_recs = candidate_recommendations(candidates)
+        books = await enrich_recommendations(session, raw_recs, offload)
+        for rec, book_db in zip(raw_recs, books):
+            yield "recommendation", _recommendation_preview(rec, book_db)
+
+    recs = build_recommendation_rows(user.id, raw_recs, books, datetime.utcnow())
+    if recs:
+        recs = await offload(_save, session, user, recs, fingerprint, from_llm)
+    yield "done", recs
@@ -0,0 +1,79 @@
+from difflib import SequenceMatcher
+from typing import List, Optional
+
+from sqlalchemy import literal_column
+from sqlmodel import Session, col, func, or_, select
+
+from model.book import Book
+from util.text import normalize_text
+
+# En SQLite (tests/desarrollo) no hay trigramas: filtramos con LIKE y
+# ordenamos en Python sobre un número acotado de candidatos
+SQLITE_CANDIDATES = 50
+
+
+def search_books(
+    session: Session,
+    title: str,
+    author: Optional[str] = None,
+    limit: int = 5,
+) -> List[Book]:
+    """
+    Búsqueda difusa en el catálogo local, ordenada por parecido con el
+    título (y el autor, si se indica).
+    """
+    title = normalize_text(title)
+    author = normalize_text(author)
+    if not title:
+        return []
+
+    if session.get_bind().dialect.name == "postgresql":
+        return _search_postgres(session, title, author, limit)
+    return _search_fallback(session, title, author, limit)
+
+
+def find_best_match(session: Session, title: str, author: Optional[str] = None) -> Optional[Book]:
+    books = search_books(session, title, author, limit=1)
+    return books[0] if books else None
+
+
+def _search_postgres(session: Session, title: str, author: str, limit: int) -> List[Book]:
+    # `%` usa el índice GIN de trigramas; el tsvector cubre los títulos
+    # largos donde el texto buscado es solo una parte
+    search_vector = literal_column("book.search_vector")
+    score = func.similarity(Book.search_title, title)
+
+    query = select(Book).where(
+        or_(
+            col(Book.search_title).op("%")(title),
+            search_vector.op("@@")(func.plainto_tsquery("simple", title)),
+        )
+    )
+
+    if author:
+        score = score + func.similarity(Book.search_author, author)
+        query = query.where(
+            or_(
+                col(Book.search_author).op("%")(author),
+                col(Book.search_author).contains(author, autoescape=True),
+            )
+        )
+
+    query = query.order_by(score.desc()).limit(limit)
+    return list(session.exec(query).all())
+
+
+def _search_fallback(session: Session, title: str, author: str, limit: int) -> List[Book]:
+    query = select(Book).where(col(Book.search_title).contains(title, autoescape=True))
+    if author:
+        query = query.where(col(Book.search_author).contains(author, autoescape=True))
+
+    candidates = session.exec(query.limit(SQLITE_CANDIDATES)).all()
+
+    def score(book: Book) -> float:
+        value = SequenceMatcher(None, book.search_title or "", title).ratio()
+        if author:
+            value += SequenceMatcher(None, book.search_author or "", author).ratio()
+        return value
+
+    return sorted(candidates, key=score, reverse=True)[:limit]
@@ -0,0 +1,312 @@
+import asyncio
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select
+
+from config.database import read_engine
+from config.settings import settings
+from model.book import Book, UserBook
+from util.log import get_logger
+from util.metrics import similarity_query_duration
+from util.text import normalize_text
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él no hay candidatos y se usa solo el LLM
+    np = None
+
+logger = get_logger(__name__)
+
+# Dimensiones de cada bloque del vector de un libro. Memoria del índice:
+# libros × (suma de dimensiones) × 4 bytes
+CATEGORY_DIMS = 32
+AUTHOR_DIMS = 64
+SHELF_DIMS = 128
+# Peso de cada bloque en la similitud
+CATEGORY_WEIGHT = 1.0
+AUTHOR_WEIGHT = 0.7
+SHELF_WEIGHT = 1.2
+# Cuánto pesan la popularidad y la nota media frente a la similitud
+PRIOR_WEIGHT = 0.05
+# Nota media "a priori" (media bayesiana): pocos votos pesan poco
+PRIOR_RATING = 3.0
+PRIOR_VOTES = 5
+MIN_SEED_RATING = 4
+SHELF_BATCH_SIZE = 50_000
+
+
+class Candidate(NamedTuple):
+    book_id: int
+    title: str
+    author: str
+    category: Optional[str]
+    score: float
+    # Libro valorado del usuario al que más se parece (para explicar la
+    # recomendación si no hay LLM)
+    because_title: Optional[str]
+    because_rating: Optional[float]
+
+
+def _bucket(text: str, dims: int) -> Tuple[int, float]:
+    # Hashing trick con signo: hash estable entre procesos (no hash())
+    h = zlib.crc32(text.encode("utf-8"))
+    return h % dims, 1.0 if (h >> 31) & 1 else -1.0
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _hashed_block(values: Sequence[Optional[str]], dims: int):
+    block = np.zeros((len(values), dims), dtype=np.float32)
+    for row, value in enumerate(values):
+        for part in (value or "").split(","):
+            part = normalize_text(part)
+            if part:
+                column, sign = _bucket(part, dims)
+                block[row, column] += sign
+    return block
+
+
+class SimilarityIndex:
+    """
+    Vectores de los libros del catálogo: categoría y autor (hashing trick)
+    y co-estantería (qué usuarios los tienen y con qué nota, también
+    con hashing). Libros parecidos = coseno alto.
+    """
+
+    def __init__(self, book_ids, titles, authors, categories, vectors, prior):
+        self.book_ids = book_ids
+        self.titles = titles
+        self.authors = authors
+        self.categories = categories
+        self.vectors = vectors
+        self.prior = prior
+        self.rows: Dict[int, int] = {book_id: row for row, book_id in enumerate(book_ids.tolist())}
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def from_rows(
+        cls,
+        books: Sequence[Tuple[int, str, str, Optional[str]]],
+        shelves: Iterable[Sequence[Tuple[int, int, Optional[float]]]],
+    ) -> "SimilarityIndex":
+        """
+        `books`: (id, título, autor, categoría). `shelves`: lotes de
+        (user_id, book_id, nota) de UserBook.
+        """
+        book_ids = np.array([b[0] for b in books], dtype=np.int64)
+        rows = {book_id: row for row, book_id in enumerate(book_ids.tolist())}
+        n = len(books)
+
+        shelf = np.zeros((n, SHELF_DIMS), dtype=np.float32)
+        counts = np.zeros(n, dtype=np.float32)
+        rating_sums = np.zeros(n, dtype=np.float32)
+        rating_counts = np.zeros(n, dtype=np.float32)
+        for batch in shelves:
+            if not batch:
+                continue
+            user_ids = np.array([s[0] for s in batch], dtype=np.int64)
+            book_rows = np.array([rows.get(s[1], -1) for s in batch], dtype=np.int64)
+            ratings = np.array([s[2] if s[2] else np.nan for s in batch], dtype=np.float32)
+            known = book_rows >= 0
+            user_ids, book_rows, ratings = user_ids[known], book_rows[known], ratings[known]
+
+            # Cada usuario cae en un cubo (con signo); su nota pesa: un 5
+            # acerca más los libros que un 1
+            hashed = (user_ids * 2654435761) % (2 ** 32)
+            columns = hashed % SHELF_DIMS
+            signs = np.where((hashed >> 31) & 1, 1.0, -1.0).astype(np.float32)
+            rated = ~np.isnan(ratings)
+            weights = np.where(rated, np.clip(1.0 + (ratings - 3.0) / 2.0, 0.0, None), 1.0).astype(np.float32)
+            np.add.at(shelf, (book_rows, columns), signs * weights)
+            np.add.at(counts, book_rows, 1.0)
+            np.add.at(rating_sums, book_rows[rated], ratings[rated])
+            np.add.at(rating_counts, book_rows[rated], 1.0)
+
+        vectors = np.hstack([
+            _normalize_rows(_hashed_block([b[3] for b in books], CATEGORY_DIMS)) * CATEGORY_WEIGHT,
+            _normalize_rows(_hashed_block([b[2] for b in books], AUTHOR_DIMS)) * AUTHOR_WEIGHT,
+            _normalize_rows(shelf) * SHELF_WEIGHT,
+        ])
+        vectors = _normalize_rows(vectors).astype(np.float32)
+
+        mean_rating = (rating_sums + PRIOR_RATING * PRIOR_VOTES) / (rating_counts + PRIOR_VOTES)
+        popularity = np.log1p(counts)
+        if n and popularity.max() > 0:
+            popularity /= popularity.max()
+        prior = (PRIOR_WEIGHT * (popularity + (mean_rating - PRIOR_RATING) / 2.0)).astype(np.float32)
+
+        return cls(
+            book_ids,
+            [b[1] for b in books],
+            [b[2] for b in books],
+            [b[3] for b in books],
+            vectors,
+            prior,
+        )
+
+    def __len__(self) -> int:
+        return len(self.book_ids)
+
+    def top_k(
+        self,
+        seeds: Dict[int, float],
+        owned: Iterable[int],
+        k: int,
+    ) -> List[Candidate]:
+        """
+        Los `k` libros más parecidos a los `seeds` (book_id -> peso) que no
+        están en `owned`. Un producto matriz-vector sobre todo el catálogo.
+        """
+        seed_rows = [(self.rows[b], w) for b, w in seeds.items() if b in self.rows and w > 0]
+        if not seed_rows or k <= 0:
+            return []
+
+        indexes = np.array([r for r, _ in seed_rows])
+        weights = np.array([w for _, w in seed_rows], dtype=np.float32)
+        profile = weights @ self.vectors[indexes]
+        norm = np.linalg.norm(profile)
+        if norm == 0:
+            return []
+        similarity = self.vectors @ (profile / norm)
+
+        scores = similarity + self.prior
+        owned_rows = [self.rows[b] for b in owned if b in self.rows]
+        scores[owned_rows] = -np.inf
+        # Sin parecido real (solo la popularidad) no es un candidato
+        scores[similarity <= 0] = -np.inf
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = top[np.isfinite(scores[top])]
+        if not len(top):
+            return []
+
+        # Para cada candidato, el libro del usuario que más se le parece
+        closest = np.argmax(self.vectors[top] @ self.vectors[indexes].T, axis=1)
+        return [
+            Candidate(
+                book_id=int(self.book_ids[row]),
+                title=self.titles[row],
+                author=self.authors[row],
+                category=self.categories[row],
+                score=float(scores[row]),
+                because_title=self.titles[indexes[c]],
+                because_rating=None,
+            )
+            for row, c in zip(top.tolist(), closest.tolist())
+        ]
+
+
+def _load_books(session: Session):
+    return session.exec(select(Book.id, Book.title, Book.author, Book.category).order_by(Book.id)).all()
+
+
+def _iter_shelves(session: Session):
+    result = session.exec(
+        select(UserBook.user_id, UserBook.book_id, UserBook.rating).execution_options(yield_per=SHELF_BATCH_SIZE)
+    )
+    for partition in result.partitions():
+        yield partition
+
+
+class SimilarityEngine:
+    """
+    Índice en memoria (uno por proceso), leído siempre de la réplica con su
+    propia sesión. La API lo reconstruye en segundo plano (keep_fresh) y el
+    worker antes de cada tanda si tiene más de `refresh_interval` segundos
+    (refresh). Una consulta solo lo construye si aún no existe: uno viejo
+    se sigue usando hasta que está el nuevo.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self._index: Optional[SimilarityIndex] = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return np is not None and settings.similarity_enabled
+
+    def _stale(self) -> bool:
+        return self._index is None or time.monotonic() - self._index.built_at > self.refresh_interval
+
+    def refresh(self, force: bool = False) -> Optional[SimilarityIndex]:
+        # Reconstruye el índice si está viejo (o siempre, con `force`)
+        if not self.available:
+            return None
+        # Con índice, si otro hilo ya lo está reconstruyendo no esperamos
+        if not self._lock.acquire(blocking=self._index is None):
+            return self._index
+        try:
+            if force or self._stale():
+                start = time.perf_counter()
+                # Lee todo el catálogo y las bibliotecas, fuera de la
+                # transacción de quien llama
+                with Session(read_engine) as session:
+                    self._index = SimilarityIndex.from_rows(_load_books(session), _iter_shelves(session))
+                logger.info(
+                    "índice de similitud construido",
+                    extra={"books": len(self._index), "duration_ms": round((time.perf_counter() - start) * 1000, 1)},
+                )
+            return self._index
+        finally:
+            self._lock.release()
+
+    async def keep_fresh(self):
+        """
+        Tarea de la API: construye el índice al arrancar y lo reconstruye
+        cada `refresh_interval` segundos en el threadpool, para que ninguna
+        petición tenga que esperar a construirlo.
+        """
+        if not self.available:
+            if settings.similarity_enabled:
+                logger.warning("NumPy no está instalado: recomendaciones sin candidatos locales")
+            return
+        while True:
+            try:
+                await run_in_threadpool(self.refresh, True)
+            except Exception as e:
+                logger.warning("error construyendo el índice de similitud", extra={"error": str(e)})
+            await asyncio.sleep(self.refresh_interval)
+
+    def candidates(
+        self,
+        user_books: List[UserBook],
+        k: int,
+        owned: Optional[Iterable[int]] = None,
+    ) -> List[Candidate]:
+        """
+        Candidatos del catálogo para un usuario a partir de sus libros mejor
+        valorados (o de toda su biblioteca si no ha valorado ninguno). Nunca
+        incluye los de `user_books` ni los de `owned` (los book_id de toda
+        su biblioteca, si `user_books` es solo una parte).
+        """
+        if not self.available or not user_books:
+            return []
+        # Solo se espera a construirlo la primera vez
+        index = self._index or self.refresh()
+        if index is None:
+            return []
+
+        start = time.perf_counter()
+        ratings = {ub.book_id: ub.rating for ub in user_books}
+        seeds = {b: r - 3.0 for b, r in ratings.items() if (r or 0) >= MIN_SEED_RATING}
+        if not seeds:
+            seeds = {book_id: 1.0 for book_id in ratings}
+        candidates = index.top_k(seeds, set(ratings) | set(owned or ()), k)
+        similarity_query_duration.observe(time.perf_counter() - start)
+
+        titles = {ub.book.title: ub.rating for ub in user_books if ub.book}
+        return [c._replace(because_rating=titles.get(c.because_title)) for c in candidates]
+
+
+similarity_engine = SimilarityEngine(settings.similarity_refresh_interval)
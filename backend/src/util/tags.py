@@ -0,0 +1,97 @@
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, insert
+from sqlmodel import Session, col, select
+
+from dto.book import TagCount
+from model.tag import Tag, UserBookTag
+from util.catalogue import dialect_insert
+from util.text import normalize_text
+
+MAX_TAG_LENGTH = 50
+# Filas por sentencia INSERT (SQLite limita el número de parámetros)
+INSERT_CHUNK_SIZE = 500
+
+
+def parse_tags(raw: Optional[str]) -> Dict[str, str]:
+    """
+    Separa un texto de etiquetas por comas. Devuelve nombre normalizado ->
+    etiqueta tal como se escribió, sin vacías ni repetidas y en orden.
+    """
+    tags: Dict[str, str] = {}
+    for label in (raw or "").split(","):
+        label = " ".join(label.split())[:MAX_TAG_LENGTH]
+        name = normalize_text(label)
+        if name and name not in tags:
+            tags[name] = label
+    return tags
+
+
+def format_tags(tags: Dict[str, str]) -> Optional[str]:
+    # Copia en texto que se guarda en UserBook.tags y se devuelve en la API
+    return ", ".join(tags.values()) or None
+
+
+def ensure_tags(session: Session, tags: Dict[str, str]) -> Dict[str, int]:
+    # Crea las que falten (sin carrera: ON CONFLICT) y devuelve sus ids
+    if not tags:
+        return {}
+    rows = [{"name": name, "label": label} for name, label in tags.items()]
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        session.execute(
+            dialect_insert(session)(Tag)
+            .values(rows[start:start + INSERT_CHUNK_SIZE])
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
+    return dict(session.exec(select(Tag.name, Tag.id).where(col(Tag.name).in_(list(tags)))).all())
+
+
+def set_user_book_tags(session: Session, user_id: int, raw_by_user_book: Dict[int, Optional[str]]) -> Dict[int, Optional[str]]:
+    """
+    Sustituye las etiquetas de varios UserBook del usuario a partir de su
+    texto. Devuelve el texto normalizado de cada uno para guardarlo en
+    UserBook.tags. No hace commit.
+    """
+    parsed = {ub_id: parse_tags(raw) for ub_id, raw in raw_by_user_book.items()}
+    all_tags: Dict[str, str] = {}
+    for tags in parsed.values():
+        for name, label in tags.items():
+            all_tags.setdefault(name, label)
+    tag_ids = ensure_tags(session, all_tags)
+
+    session.execute(delete(UserBookTag).where(col(UserBookTag.user_book_id).in_(list(parsed))))
+    rows = [
+        {"user_book_id": ub_id, "tag_id": tag_ids[name], "user_id": user_id}
+        for ub_id, tags in parsed.items()
+        for name in tags
+    ]
+    if rows:
+        session.execute(insert(UserBookTag), rows)
+    return {ub_id: format_tags(tags) for ub_id, tags in parsed.items()}
+
+
+def with_all_tags(user_id: int, raw: str):
+    """
+    Subconsulta con los UserBook del usuario que tienen todas las etiquetas
+    de `raw` (separadas por comas). Usa el índice (user_id, tag_id).
+    """
+    names = list(parse_tags(raw))
+    return (
+        select(UserBookTag.user_book_id)
+        .join(Tag, Tag.id == UserBookTag.tag_id)
+        .where(UserBookTag.user_id == user_id, col(Tag.name).in_(names))
+        .group_by(UserBookTag.user_book_id)
+        .having(func.count() == len(names))
+    )
+
+
+def tag_counts(session: Session, user_id: int) -> List[TagCount]:
+    # Nube de etiquetas: cuántos libros del usuario llevan cada una
+    rows = session.exec(
+        select(Tag.name, Tag.label, func.count().label("count"))
+        .join(UserBookTag, UserBookTag.tag_id == Tag.id)
+        .where(UserBookTag.user_id == user_id)
+        .group_by(Tag.id, Tag.name, Tag.label)
+        .order_by(func.count().desc(), Tag.name)
+    ).all()
+    return [TagCount(name=name, label=label, count=count) for name, label, count in rows]
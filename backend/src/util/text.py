@@ -0,0 +1,14 @@
+import unicodedata
+from typing import Optional
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """
+    Minúsculas, sin tildes y con los espacios colapsados. Es la forma en la
+    que se guardan las columnas de búsqueda de Book.
+    """
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.lower().split())
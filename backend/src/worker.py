@@ -1,21 +1,70 @@
+import asyncio
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
 from celery import Celery
 from celery.schedules import crontab
-from sqlmodel import select
+from celery.signals import setup_logging, worker_process_init
+from sqlalchemy import func, update
+from sqlmodel import col, or_, select
 
-from config.database import get_session
-from model.book import Book
-from model.recommendation import Recommendation
+from config.database import SessionLocal, engine
+from config.settings import settings
+from model.book import UserBook
+from model.recommendation import RecommendationBatch
 from model.user import User
-from util.book_api import search_book
-from util.ollama import get_ai_recommendations
+from util.book_api import google_books_client
+from util.fingerprint import library_fingerprint
+from util.http_cache import RECOMMENDATIONS, bump_version
+from util.log import configure_logging, get_logger
+from util.ollama import close_llm_client
+from util.recommender import (
+    build_recommendation_rows,
+    enrich_recommendations,
+    find_candidates,
+    generate_for_user,
+    llm_or_candidates,
+    load_owned_book_ids,
+    load_rated_libraries,
+    run_inline,
+    save_batches,
+)
+from util.similarity import Candidate, similarity_engine
+
+# Usuarios (rango de IDs) que procesa cada tarea de la tanda
+USERS_PER_CHUNK = 50
 
 # Configuración básica
 celery_app = Celery(
     "tasks",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0"
+    broker=settings.celery_broker_url or settings.redis_url,
+    backend=settings.celery_result_backend or settings.redis_url,
 )
 
+logger = get_logger(__name__)
+
+
+@setup_logging.connect
+def _configure_logging(**_):
+    # Mismo formato de logs (JSON) que la API en lugar del de Celery
+    configure_logging()
+
+@worker_process_init.connect
+def _reset_engine_pool(**_):
+    # Cada proceso hijo (prefork) abre sus propias conexiones en lugar de
+    # reutilizar las heredadas del proceso padre
+    engine.dispose(close=False)
+
+# Las tareas que llaman al LLM van a su propia cola: la concurrencia del
+# worker que la consume (--concurrency) es el límite de llamadas a Ollama
+celery_app.conf.task_routes = {
+    "tasks.recommendations_chunk": {"queue": "recommendations"},
+    "tasks.generate_user_recommendations": {"queue": "recommendations"},
+}
+celery_app.conf.task_acks_late = True
+celery_app.conf.task_track_started = True
+celery_app.conf.worker_prefetch_multiplier = 1
+
 # Definición del Cron (Beat)
 celery_app.conf.beat_schedule = {
     "generar-recomendaciones-cada-12h": {
@@ -24,29 +73,164 @@ celery_app.conf.beat_schedule = {
     },
 }
 
+class PendingUser(NamedTuple):
+    user_books: List[UserBook]
+    fingerprint: Optional[str]
+    candidates: List[Candidate]
+
+def _load_chunk(first_id, last_id, run_at):
+    # Todo lo que la tanda necesita leer de la DB, en una sesión corta que
+    # se cierra antes de llamar al LLM. Los objetos siguen cargados
+    # (expire_on_commit=False) una vez cerrada la sesión
+    with SessionLocal(expire_on_commit=False) as session:
+        users = {user.id: user for user in session.exec(_candidate_users(first_id, last_id)).all()}
+        if not users:
+            return {}, 0
+
+        # Idempotencia: las tandas se guardan con created_at = run_at; si la
+        # tarea se reintenta, los usuarios ya procesados se saltan
+        done = set(session.exec(
+            select(RecommendationBatch.user_id)
+            .where(col(RecommendationBatch.user_id).in_(list(users)), RecommendationBatch.created_at == run_at)
+        ).all())
+
+        # Bibliotecas de todo el rango en una consulta
+        libraries = load_rated_libraries(session, [i for i in users if i not in done])
+        owned = load_owned_book_ids(session, list(libraries))
+
+        pending = {}
+        for user_id, user_books in libraries.items():
+            user = users[user_id]
+            user.library_fingerprint = library_fingerprint(user_books)
+            # Sin cambios en lo que ve el LLM: no hace falta regenerar
+            if user.library_fingerprint != user.recommendations_fingerprint:
+                candidates = find_candidates(user_books, owned.get(user_id))
+                pending[user_id] = PendingUser(user_books, user.library_fingerprint, candidates)
+        session.commit()
+    return pending, len(users)
+
+async def _recommend_chunk(pending, run_at):
+    # Una llamada al LLM por usuario (o sus candidatos si el LLM falla), sin
+    # ninguna sesión abierta. El enriquecimiento (DB maestra + Google Books)
+    # se hace una sola vez para todas las recomendaciones de la tanda. El
+    # worker no tiene un event loop propio: los clientes de Google y del LLM
+    # viven solo durante esta llamada. Devuelve las filas por usuario y los
+    # usuarios servidos sin LLM
+    raw_by_user, without_llm = {}, set()
+    try:
+        for user_id, user in pending.items():
+            raw_by_user[user_id], from_llm = await llm_or_candidates(user.user_books, user.candidates)
+            if not from_llm:
+                without_llm.add(user_id)
+    finally:
+        await close_llm_client()
+
+    all_recs = [rec for raw_recs in raw_by_user.values() for rec in raw_recs]
+    if not all_recs:
+        return {}, without_llm
+
+    recs_by_user = {}
+    with SessionLocal() as session:
+        async with google_books_client() as client:
+            books = await enrich_recommendations(session, all_recs, run_inline, client=client)
+        session.commit()
+
+        books = iter(books)
+        for user_id, raw_recs in raw_by_user.items():
+            user_books = [next(books) for _ in raw_recs]
+            recs_by_user[user_id] = build_recommendation_rows(user_id, raw_recs, user_books, run_at)
+    return recs_by_user, without_llm
+
+def _save_user_batch(user_id, recs, fingerprint, run_at):
+    # Cada usuario en su propia transacción corta
+    with SessionLocal() as session:
+        saved = save_batches(session, {user_id: recs}, run_at)
+        if fingerprint:
+            session.exec(
+                update(User).where(User.id == user_id).values(recommendations_fingerprint=fingerprint)
+            )
+        session.commit()
+    return bool(saved)
+
+async def _generate_for_user(session, user, force):
+    try:
+        async with google_books_client() as client:
+            return await generate_for_user(session, user, force=force, client=client)
+    finally:
+        await close_llm_client()
+
+def _candidate_users(first_id, last_id):
+    # Usuarios del rango cuya huella de biblioteca no coincide con la de sus
+    # últimas recomendaciones (o que aún no tienen huella calculada)
+    return (
+        select(User)
+        .where(User.id.between(first_id, last_id))
+        .where(
+            or_(
+                User.library_fingerprint.is_(None),
+                User.recommendations_fingerprint.is_(None),
+                User.library_fingerprint != User.recommendations_fingerprint,
+            )
+        )
+        .order_by(User.id)
+    )
+
 @celery_app.task(name="tasks.update_recommendations")
 def update_recommendations():
-    session = get_session()
-    users = session.exec(select(User)).all()
-    for user in users:
-        # Reutilizamos la lógica que ya tenemos
-        user_books = session.exec(select(Book).where(Book.user_id == user.id)).all()
-        if not user_books: continue
-        
-        try:
-            raw_recs = get_ai_recommendations(user_books)
-            for item in raw_recs:
-                details = search_book(item['title'], item['author'])
-                new_rec = Recommendation(
-                    user_id=user.id,
-                    title=item['title'],
-                    author=item['author'],
-                    reason=item['reason'],
-                    image_url=details.get('image_url'),
-                    external_link=details.get('external_link')
-                )
-                session.add(new_rec)
-            session.commit()
-        except Exception as e:
-            session.rollback()
-            print(f"Error: {e}")
\ No newline at end of file
+    # Coordinador: reparte los usuarios en rangos de IDs y encola una tarea
+    # por rango. Todas comparten `run_at`, que identifica la tanda
+    run_at = datetime.utcnow()
+    with SessionLocal() as session:
+        first_id, last_id = session.exec(select(func.min(User.id), func.max(User.id))).one()
+
+    if first_id is None:
+        return 0
+
+    chunks = 0
+    for start in range(first_id, last_id + 1, USERS_PER_CHUNK):
+        recommendations_chunk.delay(start, start + USERS_PER_CHUNK - 1, run_at.isoformat())
+        chunks += 1
+    return chunks
+
+@celery_app.task(
+    name="tasks.recommendations_chunk",
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=3,
+)
+def recommendations_chunk(first_id, last_id, run_at):
+    run_at = datetime.fromisoformat(run_at)
+
+    # El worker no tiene keep_fresh: el índice de similitud se renueva aquí,
+    # antes de abrir la sesión de la tanda (lee de la réplica con la suya)
+    similarity_engine.refresh()
+    pending, users = _load_chunk(first_id, last_id, run_at)
+    if not pending:
+        return users
+
+    recs_by_user, without_llm = asyncio.run(_recommend_chunk(pending, run_at))
+
+    saved = []
+    for user_id, recs in recs_by_user.items():
+        # Sin LLM la huella no cambia: la próxima tanda vuelve a intentarlo
+        fingerprint = pending[user_id].fingerprint if user_id not in without_llm else None
+        if recs and _save_user_batch(user_id, recs, fingerprint, run_at):
+            saved.append(user_id)
+
+    if saved:
+        asyncio.run(bump_version(RECOMMENDATIONS, *saved))
+
+    return users
+
+@celery_app.task(name="tasks.generate_user_recommendations")
+def generate_user_recommendations(user_id, force=False):
+    # Generación bajo demanda (POST /recommendations/generate?background=true)
+    with SessionLocal() as session:
+        user = session.get(User, user_id)
+        if user is None:
+            return {"user_id": user_id, "recommendation_ids": []}
+
+        recs = asyncio.run(_generate_for_user(session, user, force)) or []
+        if recs:
+            asyncio.run(bump_version(RECOMMENDATIONS, user_id))
+        return {"user_id": user_id, "recommendation_ids": [r.id for r in recs]}
@@ -0,0 +1,32 @@
+import os
+import sys
+
+# Los módulos de la app se importan relativos a src/, como al arrancarla
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+import model.book, model.reading, model.recommendation, model.tag, model.user  # noqa: E402,F401 (tablas)
+
+
+@pytest.fixture
+def anyio_backend():
+    # Los tests asíncronos (@pytest.mark.anyio), solo con asyncio como la app
+    return "asyncio"
+
+
+@pytest.fixture
+def engine():
+    # SQLite en memoria, compartida por todas las conexiones del engine
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    with Session(engine) as session:
+        yield session
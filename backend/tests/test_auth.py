@@ -0,0 +1,85 @@
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from model.user import User
+from util import auth
+from util.auth import (
+    create_access_token,
+    create_refresh_token,
+    create_user_token,
+    forget_user,
+    get_current_user,
+    get_refresh_user,
+)
+
+
+@pytest.fixture
+def user(session, monkeypatch):
+    monkeypatch.setattr(auth, "_principal_cache", auth.TTLCache(maxsize=10, ttl=auth.AUTH_CACHE_TTL))
+    user = User(id=1, username="ana", email="ana@example.com", hashed_password="x", token_version=3)
+    session.add(user)
+    session.commit()
+    return user
+
+
+def _cached_for(token):
+    _, expires_at = auth._principal_cache._data[token]
+    return expires_at - time.monotonic()
+
+
+def test_principal_is_cached_until_the_user_is_forgotten(session, user):
+    token = create_user_token(user)
+    principal = get_current_user(token, session)
+    session.delete(user)
+    session.commit()
+
+    # Sin consultar la DB mientras esté en caché
+    assert get_current_user(token, session) == principal
+    assert principal.token_version == 3
+    assert _cached_for(token) == pytest.approx(auth.AUTH_CACHE_TTL, abs=5)
+
+    forget_user(user.id)
+    with pytest.raises(HTTPException):
+        get_current_user(token, session)
+
+
+def test_cache_never_outlives_the_token(session, user):
+    token = create_access_token({"sub": "ana", "uid": 1, "ver": 3}, expires_delta=timedelta(seconds=30))
+
+    get_current_user(token, session)
+
+    assert 0 < _cached_for(token) <= 30
+
+
+def test_stale_token_version_is_rejected(session, user):
+    token = create_access_token({"sub": "ana", "uid": 1, "ver": 2})
+
+    with pytest.raises(HTTPException) as error:
+        get_current_user(token, session)
+
+    assert error.value.status_code == 401
+    assert len(auth._principal_cache) == 0
+
+
+def test_refresh_token_is_not_an_access_token(session, user):
+    with pytest.raises(HTTPException) as error:
+        get_current_user(create_refresh_token(user), session)
+
+    assert error.value.status_code == 401
+
+
+def test_refresh_token_only_refreshes_its_token_version(session, user):
+    refresh_token = create_refresh_token(user)
+
+    assert get_refresh_user(session, refresh_token).id == user.id
+    with pytest.raises(HTTPException):
+        get_refresh_user(session, create_user_token(user))
+
+    user.token_version += 1
+    session.add(user)
+    session.commit()
+    with pytest.raises(HTTPException):
+        get_refresh_user(session, refresh_token)
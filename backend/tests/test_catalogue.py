@@ -0,0 +1,59 @@
+from sqlmodel import select
+
+from model.book import Book
+from util import catalogue
+from util.catalogue import upsert_books
+
+
+def _book(isbn, title, **fields):
+    return {"isbn": isbn, "title": title, "author": "Autor", **fields}
+
+
+def test_upsert_returns_books_in_input_order_without_duplicates(session):
+    books = upsert_books(session, [
+        _book("2", "Segundo"),
+        _book("1", "Primero"),
+        {"title": "Sin ISBN"},
+        _book("2", "Segundo, otra edición"),
+    ])
+
+    assert [(b.isbn, b.title) for b in books] == [("2", "Segundo, otra edición"), ("1", "Primero")]
+    assert all(b.id for b in books)
+    assert books[1].search_title == "primero"
+
+
+def test_upsert_updates_existing_isbn_keeping_missing_fields(session):
+    first, = upsert_books(session, [_book("1", "Drácula", publisher="Valdemar", page_count=400)])
+    session.commit()
+
+    again, = upsert_books(session, [_book("1", "Drácula (ed. revisada)", page_count=None, category="Terror")])
+    session.commit()
+
+    assert again.id == first.id
+    assert (again.title, again.publisher, again.page_count, again.category) == (
+        "Drácula (ed. revisada)", "Valdemar", 400, "Terror",
+    )
+    assert len(session.exec(select(Book)).all()) == 1
+
+
+def test_upsert_sends_chunks_in_isbn_order(session, monkeypatch):
+    monkeypatch.setattr(catalogue, "UPSERT_CHUNK_SIZE", 2)
+    chunks = []
+    dialect_insert = catalogue.dialect_insert
+
+    def spy(session):
+        insert = dialect_insert(session)
+
+        def recording_insert(table):
+            statement = insert(table)
+            values = statement.values
+            statement.values = lambda rows: chunks.append([r["isbn"] for r in rows]) or values(rows)
+            return statement
+
+        return recording_insert
+
+    monkeypatch.setattr(catalogue, "dialect_insert", spy)
+    books = upsert_books(session, [_book(isbn, isbn) for isbn in ["5", "3", "1", "4", "2"]])
+
+    assert chunks == [["1", "2"], ["3", "4"], ["5"]]
+    assert [b.isbn for b in books] == ["5", "3", "1", "4", "2"]
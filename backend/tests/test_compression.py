@@ -0,0 +1,36 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from util.compression import CompressionMiddleware, accepted_encodings
+
+
+def test_accepted_encodings_reads_q_values():
+    assert accepted_encodings("gzip, BR;q=0.5, *;q=0, x;q=nope") == {"gzip": 1.0, "br": 0.5, "*": 0.0, "x": 0.0}
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, deflate, br", "br"),
+        ("gzip, br;q=0", "gzip"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("abbr, gzip", "gzip"),
+        ("*", "br"),
+        ("identity", None),
+        ("gzip;q=0", None),
+    ],
+)
+def test_compression_respects_accept_encoding(accept_encoding, expected):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=10)
+
+    @app.get("/")
+    def index():
+        return PlainTextResponse("libros " * 100)
+
+    response = TestClient(app).get("/", headers={"Accept-Encoding": accept_encoding})
+
+    assert response.headers.get("content-encoding") == expected
+    assert response.text == "libros " * 100
@@ -0,0 +1,124 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from util import http_cache
+
+
+class FakeTier:
+    """Contadores de versión en memoria en lugar de Redis."""
+
+    def __init__(self):
+        self.values = {}
+        self.up = True
+
+    async def get_or_set(self, key, value, ttl):
+        if not self.up:
+            return None
+        return self.values.setdefault(key, value)
+
+    async def incr(self, key, ttl):
+        if not self.up:
+            return None
+        self.values[key] = str(int(self.values.get(key, 0)) + 1)
+        return int(self.values[key])
+
+    async def delete(self, key):
+        if not self.up:
+            return False
+        self.values.pop(key, None)
+        return True
+
+
+def _client(monkeypatch):
+    tier = FakeTier()
+    monkeypatch.setattr(http_cache, "_versions", tier)
+    monkeypatch.setattr(http_cache, "_lost_bumps", set())
+    calls = []
+    app = FastAPI()
+
+    @app.get("/library")
+    async def library(request: Request):
+        async def build():
+            calls.append(1)
+            return {"items": len(calls)}
+
+        return await http_cache.cached_json(request, http_cache.LIBRARY, 1, dict, build)
+
+    @app.post("/library")
+    async def write():
+        await http_cache.bump_version(http_cache.LIBRARY, 1)
+
+    return TestClient(app), tier, calls
+
+
+def test_unchanged_version_answers_304_without_building(monkeypatch):
+    client, _, calls = _client(monkeypatch)
+
+    first = client.get("/library")
+    again = client.get("/library", headers={"If-None-Match": first.headers["etag"]})
+
+    assert first.status_code == 200
+    assert again.status_code == 304
+    assert len(calls) == 1
+
+
+def test_bump_changes_the_etag(monkeypatch):
+    client, _, calls = _client(monkeypatch)
+    etag = client.get("/library").headers["etag"]
+
+    client.post("/library")
+    response = client.get("/library", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json() == {"items": 2}
+
+
+def test_lost_bump_never_revives_the_old_etag(monkeypatch):
+    client, tier, _ = _client(monkeypatch)
+    etag = client.get("/library").headers["etag"]
+
+    # La escritura llega con Redis caído: el contador viejo sigue ahí
+    tier.up = False
+    client.post("/library")
+    assert "etag" not in client.get("/library").headers
+
+    tier.up = True
+    response = client.get("/library", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert not http_cache._lost_bumps
+
+
+def test_variant_is_part_of_the_etag_and_needs_one_lookup(monkeypatch):
+    tier = FakeTier()
+    lookups = []
+    get_or_set = tier.get_or_set
+
+    async def counting_get_or_set(key, value, ttl):
+        lookups.append(key)
+        return await get_or_set(key, value, ttl)
+
+    tier.get_or_set = counting_get_or_set
+    monkeypatch.setattr(http_cache, "_versions", tier)
+    monkeypatch.setattr(http_cache, "_lost_bumps", set())
+    app = FastAPI()
+
+    @app.get("/stats/{day}")
+    async def stats(request: Request, day: str):
+        async def build():
+            return {"day": day}
+
+        return await http_cache.cached_json(request, http_cache.LIBRARY, 1, dict, build, variant=day)
+
+    client = TestClient(app)
+    monday = client.get("/stats/lunes").headers["etag"]
+    tuesday = client.get("/stats/martes").headers["etag"]
+
+    assert "-lunes." in monday and "-martes." in tuesday
+    assert len(lookups) == 2
+
+    tier.up = False
+    assert "etag" not in client.get("/stats/lunes").headers
+    assert len(lookups) == 3
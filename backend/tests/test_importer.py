@@ -0,0 +1,96 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+import router.book
+from config.database import get_session
+from dto.user import CurrentUser
+from model.book import Book, UserBook
+from model.tag import Tag
+from model.user import User
+from util import importer
+from util.auth import get_current_user
+from util.importer import import_library, iter_import_rows
+
+GOODREADS_CSV = '''Title,Author,ISBN,ISBN13,My Rating,Number of Pages,Exclusive Shelf,Bookshelves,My Review
+Drácula,Bram Stoker,"=""0141439840""","=""9780141439846""",5,488,read,"terror, clásicos",Genial
+Carmilla,Sheridan Le Fanu,,,0,120,currently-reading,,
+Inventado,Nadie,,,0,,to-read,,
+,Sin título,,,,,read,,
+'''
+
+
+@pytest.fixture
+def google(monkeypatch):
+    # Google Books falso: solo conoce Carmilla
+    lookups = []
+
+    async def fetch_multiple_books(title, author, max_results=10, **kwargs):
+        lookups.append(title)
+        if title == "Carmilla":
+            return [{"isbn": "9780000000001", "title": "Carmilla", "author": "J. Sheridan Le Fanu", "page_count": 120}]
+        return []
+
+    monkeypatch.setattr(importer, "fetch_multiple_books", fetch_multiple_books)
+    return lookups
+
+
+@pytest.fixture
+def user(session):
+    session.add(User(id=1, username="ana", email="ana@example.com", hashed_password="x"))
+    session.commit()
+
+
+def test_iter_import_rows_reads_a_goodreads_export():
+    dracula, carmilla, unknown = iter_import_rows(GOODREADS_CSV.splitlines(keepends=True))
+
+    assert dracula["isbn"] == "9780141439846"
+    assert (dracula["status"], dracula["rating"], dracula["current_page"]) == ("COMPLETED", 5.0, 488)
+    assert (dracula["tags"], dracula["notes"]) == ("terror, clásicos", "Genial")
+    assert (carmilla["isbn"], carmilla["status"], carmilla["rating"]) == (None, "READING", None)
+    assert unknown["status"] == "PENDING"
+
+
+@pytest.mark.anyio
+async def test_import_library_in_batches(session, user, google):
+    session.add(Book(isbn="9780141439846", title="Drácula", author="Bram Stoker"))
+    session.commit()
+    rows = list(iter_import_rows(GOODREADS_CSV.splitlines(keepends=True)))
+
+    progress = [p.model_copy() async for p in import_library(session, 1, rows + rows[:1], batch_size=2)]
+
+    # El ISBN conocido no se busca en Google; el repetido ya está
+    assert google == ["Carmilla", "Inventado"]
+    assert [p.processed for p in progress] == [2, 4, 4]
+    last = progress[-1]
+    assert last.done
+    assert (last.imported, last.already_in_library, last.not_found) == (2, 1, 1)
+    library = session.exec(select(UserBook).where(UserBook.user_id == 1)).all()
+    assert sorted(ub.status for ub in library) == ["COMPLETED", "READING"]
+    assert sorted(session.exec(select(Tag.name)).all()) == ["clasicos", "terror"]
+
+
+def test_import_endpoint_streams_ndjson_progress(engine, user, google, monkeypatch):
+    async def bump_version(*args):
+        pass
+
+    monkeypatch.setattr(router.book, "bump_version", bump_version)
+    app = FastAPI()
+    app.include_router(router.book.router)
+
+    def session_override():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = session_override
+    app.dependency_overrides[get_current_user] = lambda: CurrentUser(id=1, username="ana", email="ana@example.com")
+
+    response = TestClient(app).post("/books/import", files={"file": ("export.csv", GOODREADS_CSV.encode("utf-8"))})
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["processed"] for line in lines] == [3, 3]
+    assert lines[-1]["done"] and lines[-1]["imported"] == 2
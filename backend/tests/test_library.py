@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from model.book import Book, UserBook
+from model.user import User
+from router.book import _library_page
+
+ADDED = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def library(session):
+    session.add(User(id=1, username="ana", email="ana@example.com", hashed_password="x"))
+    session.add(User(id=2, username="luis", email="luis@example.com", hashed_password="x"))
+    titles = ["Emma", "Drácula", "Carmilla", "Beowulf", "Abel Sánchez"]
+    for book_id, title in enumerate(titles, start=1):
+        session.add(Book(id=book_id, isbn=str(book_id), title=title, author="Autor"))
+        # Del 2 al 5 se añadieron a la vez: desempata el id
+        added_at = ADDED + timedelta(days=min(book_id, 2))
+        session.add(UserBook(id=book_id, user_id=1, book_id=book_id, added_at=added_at))
+    session.add(UserBook(id=10, user_id=2, book_id=1, added_at=ADDED))
+    session.commit()
+
+
+def _all_pages(session, sort, order, limit=2):
+    pages, cursor = [], None
+    while True:
+        page = _library_page(session, 1, None, None, None, sort, order, cursor, limit)
+        pages.append([item.title for item in page.items])
+        cursor = page.next_cursor
+        if cursor is None:
+            return pages
+
+
+def test_keyset_pages_by_added_at_break_ties_by_id(session, library):
+    assert _all_pages(session, "added_at", "desc") == [
+        ["Abel Sánchez", "Beowulf"],
+        ["Carmilla", "Drácula"],
+        ["Emma"],
+    ]
+
+
+def test_keyset_pages_by_title_ascending(session, library):
+    assert _all_pages(session, "title", "asc", limit=3) == [
+        ["Abel Sánchez", "Beowulf", "Carmilla"],
+        ["Drácula", "Emma"],
+    ]
+
+
+def test_last_full_page_has_no_cursor(session, library):
+    page = _library_page(session, 1, None, None, None, "title", "asc", None, 5)
+
+    assert len(page.items) == 5
+    assert page.next_cursor is None
+
+
+def test_invalid_cursor_is_a_400(session, library):
+    with pytest.raises(HTTPException) as error:
+        _library_page(session, 1, None, None, None, "added_at", "desc", "no-es-un-cursor", 2)
+
+    assert error.value.status_code == 400
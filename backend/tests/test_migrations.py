@@ -0,0 +1,58 @@
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+
+import config.database
+
+
+def _legacy_database():
+    # Las tablas tal y como las dejaba create_all antes de Alembic
+    engine = sa.create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            'CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR NOT NULL, '
+            "email VARCHAR NOT NULL UNIQUE, hashed_password VARCHAR NOT NULL)"
+        )
+        connection.exec_driver_sql(
+            "CREATE TABLE book (id INTEGER PRIMARY KEY, isbn VARCHAR NOT NULL UNIQUE, title VARCHAR NOT NULL, "
+            "author VARCHAR NOT NULL, publisher VARCHAR, published_date DATETIME, description VARCHAR, "
+            "page_count INTEGER, category VARCHAR, image_url VARCHAR, external_link VARCHAR)"
+        )
+        connection.exec_driver_sql(
+            "CREATE TABLE userbook (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), "
+            "book_id INTEGER NOT NULL REFERENCES book (id), status VARCHAR NOT NULL, current_page INTEGER NOT NULL, "
+            "rating FLOAT, notes VARCHAR, tags VARCHAR, added_at DATETIME NOT NULL)"
+        )
+        connection.exec_driver_sql(
+            "CREATE TABLE recommendation (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), "
+            "title VARCHAR NOT NULL, author VARCHAR NOT NULL, reason VARCHAR NOT NULL, image_url VARCHAR, "
+            "external_link VARCHAR, created_at DATETIME NOT NULL)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO \"user\" (id, username, email, hashed_password) VALUES (1, 'ana', 'ana@example.com', 'x')"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO book (id, isbn, title, author) VALUES (1, '1', 'Drácula', 'Bram Stoker')"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO userbook (id, user_id, book_id, status, current_page, added_at) "
+            "VALUES (1, 1, 1, 'READING', 10, '2024-01-01 00:00:00')"
+        )
+    return engine
+
+
+def test_legacy_sqlite_database_is_adopted(monkeypatch):
+    engine = _legacy_database()
+    monkeypatch.setattr(config.database, "engine", engine)
+
+    config.database.run_migrations()
+
+    inspector = sa.inspect(engine)
+    assert {"search_title", "search_author"} <= {c["name"] for c in inspector.get_columns("book")}
+    assert "updated_at" in {c["name"] for c in inspector.get_columns("userbook")}
+    assert {"token_version", "library_fingerprint"} <= {c["name"] for c in inspector.get_columns("user")}
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT search_title FROM book").scalar() == "drácula"
+        assert connection.exec_driver_sql("SELECT token_version FROM user").scalar() == 0
+        assert connection.exec_driver_sql("SELECT updated_at FROM userbook").scalar() is not None
+    # Las migraciones siguientes también se han aplicado
+    assert inspector.has_table("recommendationbatch") and inspector.has_table("tag")
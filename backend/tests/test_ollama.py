@@ -0,0 +1,56 @@
+import model.user  # noqa: F401 (relaciones de UserBook)
+from model.book import Book, UserBook
+from util.ollama import RecommendationStreamParser, build_prompt, parse_recommendations
+
+
+def _user_book(title, rating, notes=""):
+    return UserBook(
+        book=Book(isbn=title, title=title, author="Autor", category="Terror"),
+        rating=rating,
+        notes=notes,
+    )
+
+
+def test_build_prompt_only_includes_well_rated_books():
+    prompt = build_prompt([_user_book("Drácula", 5.0, "Genial"), _user_book("Olvidable", 2.0)])
+
+    assert "- Drácula por Autor. Género: Terror. Mi nota: 5.0/5. Notas: Genial" in prompt
+    assert "Olvidable" not in prompt
+
+
+def test_build_prompt_keeps_json_format_example():
+    prompt = build_prompt([])
+
+    assert '{"title": "...", "author": "...", "reason": "..."}' in prompt
+
+
+def test_parse_recommendations_drops_invalid_items():
+    raw = """Aquí tienes:
+[
+  {"title": "Drácula", "author": "Bram Stoker"},
+  "Frankenstein",
+  {"title": 3, "reason": "número"},
+  {"author": "Sin título"},
+  {"title": "Carmilla", "author": null, "reason": ["lista"]}
+]"""
+
+    assert parse_recommendations(raw) == [
+        {"title": "Drácula", "author": "Bram Stoker", "reason": ""},
+        {"title": "Carmilla", "reason": ""},
+    ]
+
+
+def test_parse_recommendations_ignores_non_list_json():
+    assert parse_recommendations('[1, 2] y {"title": "x"}') == []
+    assert parse_recommendations("sin json") == []
+
+
+def test_stream_parser_applies_the_same_rules():
+    parser = RecommendationStreamParser()
+    found = parser.feed('[{"title": "Drácula", "reason": 5}, {"title": ""}, ')
+    found += parser.feed('{"title": "Carmilla", "author": "Le Fanu", "reason": "Vampiros"}]')
+
+    assert found == [
+        {"title": "Drácula", "reason": ""},
+        {"title": "Carmilla", "author": "Le Fanu", "reason": "Vampiros"},
+    ]
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from sqlmodel import select
+
+from model.book import Book, UserBook
+from model.reading import ReadingEvent
+from model.user import User
+from util import progress
+from util.progress import PendingProgress, load_targets, write_progress
+
+NOW = datetime(2024, 3, 1, 12, 0)
+
+
+def _library(session, pages=300):
+    session.add(User(id=1, username="ana", email="ana@example.com", hashed_password="x"))
+    session.add(Book(id=1, isbn="1", title="Drácula", author="Bram Stoker", page_count=pages))
+    session.add(UserBook(id=1, user_id=1, book_id=1, updated_at=NOW - timedelta(hours=1)))
+    session.commit()
+
+
+def _pending(page, received_at=NOW, seconds=60):
+    return PendingProgress(user_id=1, book_id=1, current_page=page, seconds_read=seconds, received_at=received_at)
+
+
+def test_write_progress_updates_the_row_and_logs_the_event(session):
+    _library(session)
+
+    assert write_progress(session, {1: _pending(40)}) == 1
+
+    user_book = session.get(UserBook, 1)
+    session.refresh(user_book)
+    assert (user_book.current_page, user_book.status, user_book.updated_at) == (40, "READING", NOW)
+    event, = session.exec(select(ReadingEvent)).all()
+    assert (event.from_page, event.to_page, event.seconds_read, event.finished) == (0, 40, 60, False)
+
+
+def test_write_progress_skips_rows_changed_after_the_update(session):
+    _library(session)
+    user_book = session.get(UserBook, 1)
+    user_book.current_page, user_book.updated_at = 90, NOW + timedelta(seconds=1)
+    session.add(user_book)
+    session.commit()
+
+    assert write_progress(session, {1: _pending(40)}) == 0
+
+    session.refresh(user_book)
+    assert user_book.current_page == 90
+    assert session.exec(select(ReadingEvent)).all() == []
+
+
+def test_write_progress_follows_a_book_added_again(session):
+    _library(session)
+    # Otro proceso quitó el libro y lo volvió a añadir: esta caché aún
+    # tiene el UserBook viejo
+    load_targets(session, 1, [1])
+    session.delete(session.get(UserBook, 1))
+    session.commit()
+    session.add(UserBook(id=2, user_id=1, book_id=1, updated_at=NOW - timedelta(minutes=1)))
+    session.commit()
+
+    assert write_progress(session, {1: _pending(300)}) == 1
+
+    user_book = session.get(UserBook, 2)
+    session.refresh(user_book)
+    assert user_book.current_page == 300
+    assert session.exec(select(ReadingEvent.finished)).all() == [True]
+    assert progress._targets.get((1, 1)) is None
+    assert load_targets(session, 1, [1])[1].user_book_id == 2
+
+
+def test_write_progress_drops_books_no_longer_in_the_library(session):
+    _library(session)
+    session.delete(session.get(UserBook, 1))
+    session.commit()
+
+    assert write_progress(session, {1: _pending(40)}) == 0
+    assert session.exec(select(ReadingEvent)).all() == []
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from util import ratelimit
+from util.ratelimit import RateLimited, RateLimiter
+from util.singleflight import SingleFlight
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_user_quota_is_separate_and_refills(clock):
+    limiter = RateLimiter("test", per_minute=600, burst=10, user_per_minute=60, user_burst=2)
+
+    limiter.check(1)
+    limiter.check(1)
+    with pytest.raises(RateLimited) as error:
+        limiter.check(1)
+
+    assert error.value.retry_after == 1
+    assert error.value.headers == {"Retry-After": "1"}
+    # Al usuario rechazado no se le cobra el token global
+    assert limiter._global.tokens == 8
+    limiter.check(2)
+    clock[0] += 1
+    limiter.check(1)
+    assert limiter.counters == {"allowed": 4, "limited": 1}
+
+
+def test_global_quota_applies_to_everyone(clock):
+    limiter = RateLimiter("test", per_minute=60, burst=1, user_per_minute=60, user_burst=5)
+
+    limiter.check(1)
+    with pytest.raises(RateLimited):
+        limiter.check(2)
+    # check_user no toca el cupo global
+    limiter.check_user(2)
+
+
+@pytest.mark.anyio
+async def test_acquire_rejects_over_max_in_flight():
+    limiter = RateLimiter("test", per_minute=600, burst=10, user_per_minute=600, user_burst=10, max_in_flight=1)
+
+    async with limiter.acquire(1):
+        with pytest.raises(RateLimited) as error:
+            async with limiter.acquire(2):
+                pass
+    async with limiter.acquire(2):
+        pass
+
+    assert error.value.retry_after == ratelimit.BUSY_RETRY_AFTER
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_single_flight_shares_one_call_and_its_error():
+    flights = SingleFlight()
+    calls = []
+    release = asyncio.Event()
+
+    async def fetch():
+        calls.append(1)
+        await release.wait()
+        return len(calls)
+
+    waiters = [asyncio.create_task(flights.do("drácula", fetch)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == [1, 1, 1]
+    assert flights.counters == {"calls": 1, "coalesced": 2}
+    assert len(flights) == 0
+
+    async def fail():
+        raise ValueError("sin servicio")
+
+    with pytest.raises(ValueError):
+        await flights.do("drácula", fail)
+
+
+@pytest.mark.anyio
+async def test_single_flight_survives_the_first_caller_leaving():
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return "ok"
+
+    first = asyncio.create_task(flights.do("k", fetch))
+    second = asyncio.create_task(flights.do("k", fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+
+    assert await second == "ok"
+    assert first.cancelled()
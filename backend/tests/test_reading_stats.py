@@ -0,0 +1,66 @@
+from datetime import date, datetime
+
+import pytest
+from sqlmodel import select
+
+from model.book import Book
+from model.reading import ReadingCategoryStats, ReadingDailyStats, ReadingEvent
+from model.user import User
+from util.reading_stats import ProgressEvent, is_finish, reading_stats, record_events
+
+
+@pytest.mark.parametrize(
+    "from_page, to_page, page_count, from_status, to_status, expected",
+    [
+        (100, 300, 300, "READING", "READING", True),
+        (100, 200, 300, "READING", "COMPLETED", True),
+        (100, 200, 300, "READING", "READING", False),
+        # Ya terminado (por páginas o por estado): no cuenta otra vez
+        (300, 300, 300, "READING", "COMPLETED", False),
+        (200, 300, 300, "COMPLETED", "COMPLETED", False),
+        (0, 50, None, "READING", "READING", False),
+        (0, 50, None, "READING", "COMPLETED", True),
+    ],
+)
+def test_is_finish(from_page, to_page, page_count, from_status, to_status, expected):
+    assert is_finish(from_page, to_page, page_count, from_status, to_status) is expected
+
+
+def _event(book_id, from_page, to_page, seconds=0, finished=False, at=datetime(2024, 3, 1, 10), category="Terror"):
+    return ProgressEvent(1, book_id, category, from_page, to_page, seconds, finished, at)
+
+
+def test_record_events_adds_to_the_daily_rollups(session):
+    session.add(User(id=1, username="ana", email="ana@example.com", hashed_password="x"))
+    session.add(Book(id=1, isbn="1", title="Drácula", author="Bram Stoker"))
+    session.add(Book(id=2, isbn="2", title="Emma", author="Jane Austen"))
+    session.commit()
+
+    record_events(session, [
+        _event(1, 0, 40, seconds=600),
+        _event(2, 10, 10),  # sin cambios: no es un evento
+        _event(2, 10, 5, seconds=60, category=None),  # volver atrás no resta páginas
+    ])
+    record_events(session, [
+        _event(1, 40, 488, seconds=1200, finished=True, category="Terror, Clásicos"),
+        _event(1, 0, 0, seconds=30, at=datetime(2024, 3, 2, 9)),
+    ])
+    session.commit()
+
+    assert len(session.exec(select(ReadingEvent)).all()) == 4
+    daily = {row.day: row for row in session.exec(select(ReadingDailyStats)).all()}
+    assert (daily[date(2024, 3, 1)].pages_read, daily[date(2024, 3, 1)].seconds_read) == (488, 1860)
+    assert daily[date(2024, 3, 1)].books_finished == 1
+    assert daily[date(2024, 3, 2)].seconds_read == 30
+    categories = {
+        (row.day, row.category): row.pages_read for row in session.exec(select(ReadingCategoryStats)).all()
+    }
+    assert categories == {
+        (date(2024, 3, 1), "Terror"): 488,
+        (date(2024, 3, 1), "General"): 0,
+        (date(2024, 3, 2), "Terror"): 0,
+    }
+
+    stats = reading_stats(session, 1, days=1, today=date(2024, 3, 2))
+    assert (stats.since, stats.seconds_read, stats.books_finished) == (date(2024, 3, 2), 30, 0)
+    assert reading_stats(session, 1, days=30, today=date(2024, 3, 2)).months[0].pages_read == 488
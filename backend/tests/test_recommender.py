@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from model.recommendation import Recommendation
+from model.user import User
+from util.recommender import _save
+
+
+def _user(session):
+    user = User(
+        username="ana",
+        email="ana@example.com",
+        hashed_password="x",
+        library_fingerprint="vieja",
+        recommendations_fingerprint="vieja",
+    )
+    session.add(user)
+    session.commit()
+    return user
+
+
+def _recs(user):
+    return [Recommendation(user_id=user.id, title="Drácula", author="Bram Stoker", reason="", created_at=datetime(2024, 1, 1))]
+
+
+def test_save_from_llm_marks_the_library_as_done(session):
+    user = _user(session)
+
+    saved = _save(session, user, _recs(user), "nueva", True)
+
+    assert [r.title for r in saved] == ["Drácula"]
+    session.refresh(user)
+    assert (user.library_fingerprint, user.recommendations_fingerprint) == ("nueva", "nueva")
+    assert user.latest_batch_id == saved[0].batch_id
+
+
+def test_save_without_llm_keeps_the_library_fingerprint(session):
+    user = _user(session)
+
+    _save(session, user, _recs(user), "nueva", False)
+
+    session.refresh(user)
+    assert user.library_fingerprint == "nueva"
+    assert user.recommendations_fingerprint is None
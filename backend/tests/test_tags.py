@@ -0,0 +1,56 @@
+from sqlmodel import select
+
+from model.book import Book, UserBook
+from model.tag import Tag, UserBookTag
+from model.user import User
+from util.tags import format_tags, parse_tags, set_user_book_tags, tag_counts, with_all_tags
+
+
+def _library(session):
+    session.add(User(id=1, username="ana", email="ana@example.com", hashed_password="x"))
+    session.add(User(id=2, username="luis", email="luis@example.com", hashed_password="x"))
+    for book_id in (1, 2, 3):
+        session.add(Book(id=book_id, isbn=str(book_id), title=f"Libro {book_id}", author="Autor"))
+        session.add(UserBook(id=book_id, user_id=1, book_id=book_id))
+    session.add(UserBook(id=4, user_id=2, book_id=1))
+    session.commit()
+
+
+def test_parse_tags_normalizes_and_deduplicates():
+    tags = parse_tags(" Clásicos,club ,,  de   verano, CLASICOS")
+
+    assert tags == {"clasicos": "Clásicos", "club": "club", "de verano": "de verano"}
+    assert format_tags(tags) == "Clásicos, club, de verano"
+    assert format_tags(parse_tags(" , ")) is None
+
+
+def test_set_user_book_tags_replaces_and_shares_tags(session):
+    _library(session)
+
+    set_user_book_tags(session, 1, {1: "Clásicos, club", 2: "clasicos"})
+    stored = set_user_book_tags(session, 1, {1: "club,  Verano"})
+    set_user_book_tags(session, 2, {4: "Club"})
+    session.commit()
+
+    assert stored == {1: "club, Verano"}
+    # Una fila por etiqueta normalizada, con la forma de la primera vez
+    assert sorted(session.exec(select(Tag.name, Tag.label)).all()) == [
+        ("clasicos", "Clásicos"), ("club", "club"), ("verano", "Verano"),
+    ]
+    assert len(session.exec(select(UserBookTag).where(UserBookTag.user_book_id == 1)).all()) == 2
+
+
+def test_tag_filters_and_counts_are_per_user(session):
+    _library(session)
+    set_user_book_tags(session, 1, {1: "club, clásicos", 2: "club", 3: "verano"})
+    set_user_book_tags(session, 2, {4: "club"})
+    session.commit()
+
+    def matching(raw):
+        return sorted(session.exec(with_all_tags(1, raw)).all())
+
+    assert matching("club") == [1, 2]
+    assert matching("CLUB, Clasicos") == [1]
+    assert matching("club, verano") == []
+    assert [(t.name, t.count) for t in tag_counts(session, 1)] == [("club", 2), ("clasicos", 1), ("verano", 1)]
+    assert [(t.name, t.count) for t in tag_counts(session, 2)] == [("club", 1)]
@@ -15,6 +15,29 @@ api.interceptors.request.use((config) => {
     return config;
 });
 
+// Si el token de acceso caduca, lo renovamos una vez con el refresh token
+// (sin volver a pedir la contraseña) y repetimos la petición
+api.interceptors.response.use(
+    (response) => response,
+    async (error) => {
+        const original = error.config;
+        const refreshToken = typeof window !== 'undefined' ? localStorage.getItem('refresh_token') : null;
+        if (error.response?.status === 401 && refreshToken && original && !original._retry
+            && !original.url?.includes('/users/refresh')) {
+            original._retry = true;
+            try {
+                const { data } = await api.post('/users/refresh', { refresh_token: refreshToken });
+                localStorage.setItem('token', data.access_token);
+                localStorage.setItem('refresh_token', data.refresh_token);
+                return api(original);
+            } catch {
+                localStorage.removeItem('refresh_token');
+            }
+        }
+        return Promise.reject(error);
+    }
+);
+
 // api.interceptors.response.use(
 //     (response) => response,
 //     (error) => {
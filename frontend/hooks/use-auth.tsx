@@ -19,6 +19,7 @@ export const useAuth = () => {
         },
         onSuccess: (data) => {
             localStorage.setItem("token", data.access_token);
+            localStorage.setItem("refresh_token", data.refresh_token);
             window.location.href = "/library"; // Redirección simple
         },
     });
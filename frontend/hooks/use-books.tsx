@@ -5,7 +5,8 @@ export interface Book {
     id: number;
     title: string;
     author: string;
-    description: string;
+    // Solo en la vista completa de /books/find-all
+    description?: string;
     image_url: string;
     page_count: number;
     category: string;
@@ -17,12 +18,27 @@ export interface Book {
     status: string;
 }
 
+interface LibraryPage {
+    items: Book[];
+    next_cursor: string | null;
+}
+
 export const useBooks = () => {
     return useQuery<Book[]>({
         queryKey: ["books"],
         queryFn: async () => {
-            const response = await api.get("/books/find-all");
-            return response.data;
+            // La API pagina por cursor; recorremos todas las páginas
+            // porque las estadísticas se calculan sobre la biblioteca completa
+            const books: Book[] = [];
+            let cursor: string | null = null;
+            do {
+                const response: { data: LibraryPage } = await api.get("/books/find-all", {
+                    params: { limit: 200, view: "summary", ...(cursor ? { cursor } : {}) },
+                });
+                books.push(...response.data.items);
+                cursor = response.data.next_cursor;
+            } while (cursor);
+            return books;
         },
     });
 };
\ No newline at end of file